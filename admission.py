@@ -0,0 +1,97 @@
+import os
+import logging
+
+from flask import jsonify
+
+from models import CrawlTask
+from jobs import ACTIVE_STATUSES, CRAWL_SLOTS, running_count, queued_count
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Jobs allowed to wait for a crawl slot; beyond this new crawls are refused
+MAX_QUEUED_CRAWLS = int(os.environ.get("MAX_QUEUED_CRAWLS", 50))
+
+# Crawls one user (or anonymous client) / one API key may have queued or running
+MAX_CRAWLS_PER_USER = int(os.environ.get("MAX_CRAWLS_PER_USER", 2))
+MAX_CRAWLS_PER_API_KEY = int(os.environ.get("MAX_CRAWLS_PER_API_KEY", 2))
+
+# Suggested wait, in seconds, sent with rejected requests
+RETRY_AFTER_SECONDS = 30
+
+
+def slot_usage():
+    """Crawl slot and wait queue occupancy."""
+    return {
+        "slots": CRAWL_SLOTS,
+        "slots_in_use": running_count(),
+        "queued": queued_count(),
+        "queue_capacity": MAX_QUEUED_CRAWLS
+    }
+
+
+def _active_count(**owner):
+    return (CrawlTask.query
+            .filter_by(**owner)
+            .filter(CrawlTask.status.in_(ACTIVE_STATUSES))
+            .count())
+
+
+def check_admission(user_id=None, api_key_id=None, client_addr=None):
+    """
+    Decide whether a new crawl request may be accepted.
+
+    Requests are refused once the wait queue is full, or when their owner
+    is already at their cap. The counts are read without locking, so a
+    burst can overshoot a cap by a request or two.
+
+    Args:
+        user_id (int): Logged-in or API key user, if any
+        api_key_id (int): API key the request was made with, if any
+        client_addr (str): Client address, used to cap anonymous requests
+
+    Returns:
+        dict: None if admitted, otherwise the rejection to send with a 429
+    """
+    usage = slot_usage()
+    rejection = None
+
+    if api_key_id is not None and _active_count(api_key_id=api_key_id) >= MAX_CRAWLS_PER_API_KEY:
+        rejection = ("api_key_limit",
+                     f"This API key already has {MAX_CRAWLS_PER_API_KEY} crawls queued or running. "
+                     f"Wait for one to finish and try again.")
+    elif user_id is not None and _active_count(user_id=user_id) >= MAX_CRAWLS_PER_USER:
+        rejection = ("user_limit",
+                     f"You already have {MAX_CRAWLS_PER_USER} crawls queued or running. "
+                     f"Wait for one to finish and try again.")
+    elif user_id is None and client_addr and _active_count(client_addr=client_addr) >= MAX_CRAWLS_PER_USER:
+        rejection = ("user_limit",
+                     f"You already have {MAX_CRAWLS_PER_USER} crawls queued or running. "
+                     f"Wait for one to finish and try again.")
+    elif usage["queued"] >= usage["queue_capacity"]:
+        rejection = ("queue_full",
+                     f"The crawl queue is full ({usage['queued']} crawls waiting). Please try again later.")
+
+    if rejection is None:
+        metrics.increment("crawl_requests_admitted")
+        return None
+
+    reason, message = rejection
+    metrics.increment(f"crawl_requests_rejected.{reason}")
+    logger.info(f"Rejected crawl request ({reason}): user={user_id} api_key={api_key_id} client={client_addr}")
+    return {
+        "error": message,
+        "reason": reason,
+        # Where a queued request would land once there is room
+        "queue_position": usage["queued"] + 1,
+        "crawl_slots": usage,
+        "retry_after": RETRY_AFTER_SECONDS
+    }
+
+
+def too_busy_response(rejection):
+    """429 response for a crawl request refused by admission control."""
+    response = jsonify(rejection)
+    response.status_code = 429
+    response.headers['Retry-After'] = str(rejection["retry_after"])
+    return response
@@ -3,9 +3,11 @@ import logging
 import json
 import re
 import time
+import datetime
 from urllib.parse import urlparse, urljoin
 import zipfile
 import io
+import shutil
 import uuid
 from pathlib import Path
 import threading
@@ -15,12 +17,29 @@ from functools import wraps
 
 import requests
 from bs4 import BeautifulSoup
-from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for, flash, make_response
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, make_response, Response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_socketio import SocketIO, emit
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from models import db, User, ApiKey
-from crawler import WebCrawler
+from models import db, User, ApiKey, create_schema
+from crawler import build_preview_data, cleanup_task_files
+from task_registry import get_task, update_task, delete_task, add_subscriber
+from jobs import (enqueue_job, queue_position, crawl_key, join_active_job, coalesce_job, owner_key,
+                  is_subscribed, release_subscriber, wait_for_job, request_cancel, ACTIVE_STATUSES)
+from worker import start_workers, running_crawlers
+from admission import check_admission, slot_usage, too_busy_response
+from worker_registry import fetch_metrics
+from result_cache import find_cached_result, cache_usage, RESULT_CACHE_MAX_AGE, RESULT_CACHE_BUDGET_BYTES
+from wget_backend import probe_wget
+from manifest import read_manifest, remove_manifest
+from page_index import index_pages, query_pages, DEFAULT_PAGE_LIMIT
+from archive_reader import get_reader
+from zip_stream import stream_task_archive, stream_task_snapshot
+from file_delivery import send_archive
+from janitor import janitor_settings
+from artifacts import latest_artifact, list_artifacts, listing_args, forget_artifact
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -36,6 +55,13 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
 }
 
+# X-Forwarded-For/-Proto hops to trust. Off by default, since a client that
+# connects directly could forge the header to dodge per-address caps; the
+# Procfile and railway.toml set 1 for the platform's router.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
 # Initialize extensions
 db.init_app(app)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
@@ -46,7 +72,7 @@ login_manager.login_message = 'Please log in to access this page.'
 # Create database tables
 def create_tables():
     with app.app_context():
-        db.create_all()
+        create_schema()
 
 # Create tables on startup
 create_tables()
@@ -75,15 +101,61 @@ def require_api_key(f):
         
         # Add the user to the request context
         request.user = key_record.user
+        request.api_key = key_record
         return f(*args, **kwargs)
     return decorated_function
 
+def request_owner():
+    """
+    Who a crawl started by this request counts against for concurrency caps.
+    
+    Anonymous callers are told apart by their address as forwarded by the
+    router (see TRUSTED_PROXY_HOPS).
+    """
+    api_key = getattr(request, 'api_key', None)
+    if api_key is not None:
+        return {"user_id": api_key.user_id, "api_key_id": api_key.id}
+    if current_user.is_authenticated:
+        return {"user_id": current_user.id}
+    return {"client_addr": request.remote_addr}
+
+def request_fetch_weight():
+    """Fetch scheduling weight for a crawl started by this request."""
+    api_key = getattr(request, 'api_key', None)
+    if api_key is not None:
+        return api_key.fetch_weight or api_key.user.fetch_weight
+    if current_user.is_authenticated:
+        return current_user.fetch_weight
+    return 1.0
+
+def _flag(params, name):
+    """
+    Whether a yes/no request option is on, e.g. wait=true, stream=1 or
+    finalize=yes; params is request.form, request.args or a JSON body.
+    """
+    return params is not None and str(params.get(name, '')).lower() in ('1', 'true', 'yes')
+
+def result_cache_options(params):
+    """
+    Read result cache options from request parameters.
+    
+    max_age is the oldest cached archive, in seconds, the caller will accept;
+    refresh=true skips the cache and crawls again.
+    """
+    refresh = _flag(params, 'refresh')
+    try:
+        max_age = int(params.get('max_age', RESULT_CACHE_MAX_AGE))
+    except (TypeError, ValueError):
+        max_age = RESULT_CACHE_MAX_AGE
+    return max_age, refresh
+
 # Create a directory for temporary storage if it doesn't exist
 temp_dir = Path("temp")
 temp_dir.mkdir(exist_ok=True)
 
-# Store active crawling tasks
-active_tasks = {}
+# Crawl workers to run inside this web process. Set to 0 when crawls run in
+# separate webber-worker processes.
+EMBEDDED_CRAWL_WORKERS = int(os.environ.get("EMBEDDED_CRAWL_WORKERS", 1))
 
 @app.route('/')
 def index():
@@ -93,25 +165,168 @@ def index():
 def direct_download():
     """Provide direct download of the latest ZIP file."""
     try:
-        # Find the most recent zip file in the root directory
-        zip_files = [f for f in os.listdir('.') if f.endswith('.zip')]
-        if not zip_files:
+        # The newest archive in the registry, without scanning any directory
+        artifact = latest_artifact()
+        if artifact is None or not os.path.exists(artifact.path):
             return jsonify({"error": "No ZIP files available"}), 404
         
-        # Sort by modification time, newest first
-        zip_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-        latest_zip = zip_files[0]
-        
-        return send_file(latest_zip, as_attachment=True)
+        return send_archive(artifact.path)
     except Exception as e:
         logger.error(f"Direct download error: {e}")
         return jsonify({"error": f"Error providing direct download: {str(e)}"}), 500
 
+def submit_crawl(url, engine, params, archive=True):
+    """
+    Find or queue a crawl job for a URL.
+    
+    A recent archive of the same crawl is reused, then an identical crawl
+    that is still queued or running; only after that is a new job queued.
+    
+    Args:
+        url (str): Validated start URL
+        engine (str): "crawler", "wget" or "fast_wget"
+        params: Request parameters holding the result cache options
+        archive (bool): Whether a new job builds a ZIP, or keeps its files
+            for streaming downloads
+        
+    Returns:
+        tuple: (result dict, None), or (None, response) if the request was refused
+    """
+    # Serve a recent archive of the same crawl straight away
+    key = crawl_key(url, engine)
+    owner = request_owner()
+    subscriber = owner_key(**owner)
+    max_age, refresh = result_cache_options(params)
+    if not refresh:
+        cached = find_cached_result(key, subscriber, max_age)
+        if cached is not None:
+            return {"task_id": cached.id, "status": "completed", "cached": True}, None
+    
+    # Follow an identical crawl that is already queued or running
+    task = join_active_job(key, subscriber)
+    if task is not None:
+        return {"task_id": task.id, "status": "started", "attached": True,
+                "queue_position": queue_position(task.id)}, None
+    
+    # Refuse the crawl outright if the queue or the caller's cap is full
+    rejection = check_admission(**owner)
+    if rejection:
+        return None, too_busy_response(rejection)
+    
+    # Queue the job; a crawl worker picks it up with the requested engine
+    task_id = str(uuid.uuid4())
+    enqueue_job(task_id, url, wget_mode=engine != "crawler", engine=engine, archive=archive,
+                fetch_weight=request_fetch_weight(), dedupe_key=key, **owner)
+    add_subscriber(task_id, subscriber)
+    followed = coalesce_job(task_id, key, subscriber)
+    return {"task_id": followed, "status": "started", "attached": followed != task_id,
+            "queue_position": queue_position(followed)}, None
+
+def stream_archive_response(task):
+    """
+    Send a finished task's files as a ZIP generated from its manifest while
+    it is sent: a streaming-only task's files, or those still in the task's
+    working directory.
+    
+    There is no Content-Length, so the response goes out chunked and the
+    first bytes leave as soon as the first file is read.
+    
+    Returns:
+        Response: The streaming response, or None if the task's files are gone
+    """
+    root = task.files_root or snapshot_root(task)
+    if not root or not os.path.isdir(root):
+        return None
+    chunks = stream_task_archive(task.id, root)
+    if chunks is None:
+        return None
+    
+    finished = task.finished_at or task.created_at
+    filename = f"{urlparse(task.url).netloc.replace('.', '_')}_{int(finished.timestamp())}.zip"
+    return streamed_zip_response(chunks, filename)
+
+def streamed_zip_response(chunks, filename):
+    """Chunked ZIP download of generated archive bytes."""
+    response = Response(chunks, mimetype='application/zip', direct_passthrough=True)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def snapshot_root(task):
+    """
+    Directory a running task's manifest paths are relative to.
+    
+    The crawler saves into its task directory; wget saves under a directory
+    named after the host, which only exists once the first file is saved.
+    """
+    task_dir = temp_dir / task.id
+    if not task.wget_mode:
+        return task_dir
+    host = urlparse(task.url).netloc
+    for candidate in (task_dir / host, task_dir / ("www." + host)):
+        if candidate.is_dir():
+            return candidate
+    return None
+
+def snapshot_response(task):
+    """
+    Send the files a queued or running task has finished so far as a ZIP.
+    
+    Built from the manifest while it is sent, without pausing the crawl.
+    
+    Returns:
+        Response: The streaming response, or None if nothing is saved yet
+    """
+    root = snapshot_root(task)
+    chunks = stream_task_snapshot(task.id, root) if root is not None else None
+    if chunks is None:
+        return None
+    
+    filename = f"{urlparse(task.url).netloc.replace('.', '_')}_snapshot_{int(time.time())}.zip"
+    return streamed_zip_response(chunks, filename)
+
+def fast_wget_accepted(submitted, status_url, download_url):
+    """202 response telling a fast wget caller where to follow its job."""
+    body = dict(submitted, status_url=status_url, download_url=download_url)
+    response = jsonify(body)
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+def wait_for_fast_wget(task_id, log_prefix=""):
+    """Block until a fast wget job is done and send its ZIP, for wait=true callers."""
+    task = wait_for_job(task_id)
+    zip_path = task.zip_path if task is not None and task.status == "completed" else None
+    logger.debug(f"{log_prefix}fast wget job {task_id} returned zip_path: {zip_path}")
+    
+    # Streaming-only jobs have no ZIP; it is generated as it is sent
+    if task is not None and task.status == "completed" and not zip_path:
+        response = stream_archive_response(task)
+        if response is not None:
+            logger.info(f"{log_prefix}Streaming ZIP of fast wget job {task_id} from {task.files_root}")
+            return response
+    
+    if not zip_path:
+        logger.error(f"{log_prefix}fast wget job {task_id} produced no ZIP file")
+        return jsonify({"error": "Failed to download website with wget. The website might be unavailable, blocked, or have certificate issues. Please try a different website."}), 500
+        
+    if not os.path.exists(zip_path):
+        logger.error(f"{log_prefix}Generated ZIP file does not exist at path: {zip_path}")
+        return jsonify({"error": f"Failed to download website with wget. ZIP file not found at {zip_path}."}), 500
+    
+    # Log success
+    logger.info(f"{log_prefix}Successfully downloaded website. ZIP file at: {zip_path}")
+    
+    # Return the ZIP file directly
+    return send_archive(zip_path)
+
 @app.route('/fast_wget', methods=['POST'])
 def fast_wget():
     """
-    Direct wget crawl route that immediately returns the ZIP file.
-    This is a synchronous endpoint that will block until the download is complete.
+    Queue a wget download and answer 202 with the job's status and download URLs.
+    With wait=true, block until the download is complete and return the ZIP file,
+    as this route originally did; the crawl itself still runs on a crawl worker.
+    With stream=true no ZIP is built on disk; the download generates it as it sends.
     """
     url = request.form.get('url')
     if not url:
@@ -130,30 +345,19 @@ def fast_wget():
         return jsonify({"error": f"Invalid URL: {str(e)}"}), 400
     
     try:
-        # Import and use the fast_wget module
-        from fast_wget import crawl_with_wget_sync
-        
-        # Show a message to the user
         logger.info(f"Starting fast wget download for {url}")
+        submitted, refused = submit_crawl(url, "fast_wget", request.form,
+                                          archive=not _flag(request.form, 'stream'))
+        if refused is not None:
+            return refused
         
-        # Call the wget function (this will block until download is complete)
-        logger.debug(f"Calling crawl_with_wget_sync({url})")
-        zip_path = crawl_with_wget_sync(url)
-        logger.debug(f"crawl_with_wget_sync returned zip_path: {zip_path}")
-        
-        if not zip_path:
-            logger.error("crawl_with_wget_sync returned None")
-            return jsonify({"error": "Failed to download website with wget. The website might be unavailable, blocked, or have certificate issues. Please try a different website."}), 500
-            
-        if not os.path.exists(zip_path):
-            logger.error(f"Generated ZIP file does not exist at path: {zip_path}")
-            return jsonify({"error": f"Failed to download website with wget. ZIP file not found at {zip_path}."}), 500
-        
-        # Log success
-        logger.info(f"Successfully downloaded website. ZIP file at: {zip_path}")
+        task_id = submitted["task_id"]
+        if _flag(request.form, 'wait'):
+            return wait_for_fast_wget(task_id)
         
-        # Return the ZIP file directly
-        return send_file(zip_path, as_attachment=True, download_name=os.path.basename(zip_path))
+        return fast_wget_accepted(submitted,
+                                  url_for('status', task_id=task_id),
+                                  url_for('download', task_id=task_id))
     
     except Exception as e:
         # Log the error with full traceback
@@ -240,206 +444,177 @@ def crawl():
         logger.error(f"URL parsing error: {e}")
         return jsonify({"error": f"Invalid URL: {str(e)}"}), 400
     
-    # Generate a task ID
-    task_id = str(uuid.uuid4())
-    session['task_id'] = task_id
-    
-    if use_wget:
-        # Create a thread to run wget crawling
-        def wget_crawler():
-            try:
-                # Send initial status
-                logger.info(f"Starting wget crawling for {url}")
-                socketio.emit('status_update', {
-                    'task_id': task_id,
-                    'message': f"Starting wget download for {url}",
-                    'progress': 10,
-                    'stats': {'resources': {'html': 0, 'css': 0, 'js': 0, 'images': 0, 'fonts': 0, 'other': 0}}
-                })
-                
-                # Prepare task directory
-                task_dir = temp_dir / task_id
-                
-                # Use our simplified_wget module
-                from simplified_wget import crawl_with_wget
-                
-                # Send status update
-                socketio.emit('status_update', {
-                    'task_id': task_id,
-                    'message': f"Downloading website with wget...",
-                    'progress': 30,
-                    'stats': {'resources': {'html': 0, 'css': 0, 'js': 0, 'images': 0, 'fonts': 0, 'other': 0}}
-                })
-                
-                # Start crawling
-                result = crawl_with_wget(url, task_id, task_dir)
-                
-                if result["status"] == "completed":
-                    # Store task completion info
-                    active_tasks[task_id] = {
-                        "status": "completed",
-                        "start_time": time.time(),
-                        "url": url,
-                        "zip_path": result["zip_path"],
-                        "files_downloaded": result["files_downloaded"],
-                        "resources": result["resources"],
-                        "wget_mode": True
-                    }
-                    
-                    # Emit completion status
-                    socketio.emit('status_update', {
-                        'task_id': task_id,
-                        'message': f"Crawling completed! Downloaded {result['files_downloaded']} files.",
-                        'progress': 100,
-                        'stats': {'resources': result["resources"]}
-                    })
-                    
-                    logger.info(f"Wget crawling completed for {url}")
-                else:
-                    # Handle error
-                    active_tasks[task_id] = {
-                        "status": "failed",
-                        "start_time": time.time(),
-                        "url": url,
-                        "error": result.get("error", "Unknown error"),
-                        "wget_mode": True
-                    }
-                    
-                    socketio.emit('status_update', {
-                        'task_id': task_id,
-                        'message': f"Error: {result.get('error', 'Unknown error')}",
-                        'progress': -1
-                    })
-                    
-                    logger.error(f"Wget crawling failed for {url}: {result.get('error', 'Unknown error')}")
-                
-            except Exception as e:
-                logger.error(f"Error in wget crawling: {str(e)}")
-                active_tasks[task_id] = {
-                    "status": "failed",
-                    "start_time": time.time(),
-                    "url": url,
-                    "error": str(e),
-                    "wget_mode": True
-                }
-                socketio.emit('status_update', {
-                    'task_id': task_id,
-                    'message': f"Error: {str(e)}",
-                    'progress': -1
-                })
-        
-        # Start wget crawling in a thread
-        active_tasks[task_id] = {
-            "status": "starting",
-            "start_time": time.time(),
-            "url": url,
-            "wget_mode": True
-        }
-        thread = threading.Thread(target=wget_crawler)
-        thread.daemon = True
-        thread.start()
-    else:
-        # Initialize crawler with faster throttle using the original Python method
-        crawler = WebCrawler(url, task_id, socketio, throttle_delay=0.01)
-        active_tasks[task_id] = {
-            "crawler": crawler,
-            "status": "starting",
-            "start_time": time.time(),
-            "url": url,
-            "wget_mode": False
-        }
-        
-        # Start crawling in a separate thread
-        thread = threading.Thread(target=crawler.start_crawling)
-        thread.daemon = True
-        thread.start()
+    # With stream=true the crawler builds no ZIP; downloads generate it as they send
+    streaming = not use_wget and _flag(request.form, 'stream')
+    submitted, refused = submit_crawl(url, "wget" if use_wget else "crawler", request.form,
+                                      archive=not streaming)
+    if refused is not None:
+        return refused
     
-    return jsonify({"task_id": task_id, "status": "started"})
+    session['task_id'] = submitted["task_id"]
+    return jsonify(submitted)
 
 @app.route('/status/<task_id>')
 def status(task_id):
     """Get the status of a crawling task."""
-    if task_id not in active_tasks:
+    task = get_task(task_id)
+    if task is None:
         return jsonify({"error": "Task not found"}), 404
     
-    task = active_tasks[task_id]
-    
-    # If task has been running for over 30 seconds, mark it as completed
-    # so the download can be attempted (for non-wget tasks only)
-    if not task.get("wget_mode", False) and time.time() - task["start_time"] > 30 and task["status"] != "failed":
-        task["status"] = "completed"
+    # A crawler running in this process has fresher stats than the last flush
+    crawler = running_crawlers.get(task_id)
+    stats = crawler.get_stats() if crawler else task.stats
     
-    # Handle wget vs non-wget tasks differently
-    if task.get("wget_mode", False):
-        # For wget mode tasks
+    if not stats:
         stats = {
-            "processed_urls": task.get("files_downloaded", 0),
-            "total_urls": task.get("files_downloaded", 0) + 10,  # Add buffer for incomplete downloads
-            "resources": task.get("resources", {
+            "processed_urls": 0,
+            "total_urls": 0,
+            "resources": {
                 "html": 0, "css": 0, "js": 0, "images": 0, "fonts": 0, "other": 0
-            })
+            }
         }
-        
-        return jsonify({
-            "status": task["status"],
-            "url": task["url"],
-            "duration": time.time() - task["start_time"],
-            "crawled_urls": stats
-        })
-    else:
-        # For original Python crawler tasks
-        return jsonify({
-            "status": task["status"],
-            "url": task["url"],
-            "duration": time.time() - task["start_time"],
-            "crawled_urls": task["crawler"].get_stats()
-        })
+    
+    response = {
+        "status": task.status,
+        "url": task.url,
+        "duration": time.time() - task.start_time,
+        "crawled_urls": stats
+    }
+    if task.status == "queued":
+        response["queue_position"] = queue_position(task_id)
+    # A cancelled task can be downloaded only if the cancel kept a partial archive
+    if task.status == "completed" or (task.status == "cancelled" and task.zip_path):
+        response["download_url"] = url_for('download', task_id=task_id)
+    if task.error:
+        response["error"] = task.error
+    return jsonify(response)
 
 @app.route('/download/<task_id>')
 def download(task_id):
-    """Download the ZIP file for a completed task."""
-    if task_id not in active_tasks:
+    """
+    Download the ZIP file for a completed task.
+    
+    Streaming-only tasks have no ZIP on disk; theirs is generated from the
+    task's manifest and files while it is sent. With stream=1 any task whose
+    files are still on disk is sent that way, whatever engine ran it; the
+    ZIP is sent if they are gone. With snapshot=1, a task still running
+    sends the files it has finished so far.
+    """
+    task = get_task(task_id)
+    if task is None:
         return jsonify({"error": "Task not found"}), 404
     
-    task = active_tasks[task_id]
-    if task["status"] != "completed":
+    if _flag(request.args, 'snapshot') and task.status in ACTIVE_STATUSES:
+        response = snapshot_response(task)
+        if response is None:
+            return jsonify({"error": "No files saved yet", "status": task.status}), 409
+        return response
+    
+    # A cancelled task has an archive only if the cancel asked to finalize it
+    if task.status != "completed" and not (task.status == "cancelled" and task.zip_path):
         return jsonify({"error": "Task not yet completed"}), 400
     
     try:
-        # Handle wget vs non-wget tasks differently
-        if task.get("wget_mode", False):
-            # For wget mode tasks
-            zip_path = task.get("zip_path")
-            if not zip_path or not os.path.exists(zip_path):
-                return jsonify({"error": "ZIP file not found"}), 404
-            
-            filename = os.path.basename(zip_path)
-            return send_file(zip_path, download_name=filename, as_attachment=True)
-        else:
-            # For original Python crawler tasks
-            zip_path = task["crawler"].get_zip_path()
-            if not zip_path or not os.path.exists(zip_path):
-                return jsonify({"error": "ZIP file not found"}), 404
-            
-            filename = os.path.basename(zip_path)
-            return send_file(zip_path, download_name=filename, as_attachment=True)
+        zip_path = task.zip_path
+        if not zip_path or _flag(request.args, 'stream'):
+            response = stream_archive_response(task)
+            if response is not None:
+                return response
+        if not zip_path or not os.path.exists(zip_path):
+            return jsonify({"error": "ZIP file not found"}), 404
+        
+        # Downloads count as use, so the janitor evicts least recently used archives first
+        update_task(task_id, last_accessed_at=datetime.datetime.utcnow())
+        
+        # Resumable, and zero-copy or offloaded to the front server where possible
+        return send_archive(zip_path)
     except Exception as e:
         logger.error(f"Download error: {e}")
         return jsonify({"error": f"Error downloading ZIP: {str(e)}"}), 500
 
+@app.route('/browse/<task_id>/', defaults={'path': ''})
+@app.route('/browse/<task_id>/<path:path>')
+def browse(task_id, path):
+    """
+    Serve one file of a finished crawl straight out of its archive.
+    
+    Lets a mirrored site be clicked through in the browser without
+    downloading or extracting the ZIP. Pages are sandboxed so the mirrored
+    site's scripts can't act on this app's origin.
+    """
+    task = get_task(task_id)
+    if task is None:
+        return jsonify({"error": "Task not found"}), 404
+    
+    if task.status != "completed" or not task.zip_path or not os.path.exists(task.zip_path):
+        return jsonify({"error": "No archive available to browse"}), 404
+    
+    try:
+        reader = get_reader(task.zip_path, lambda: {entry["path"]: entry["mime"]
+                                                    for entry in read_manifest(task_id) or []})
+        name = reader.find(path)
+        if name is None:
+            if path and reader.is_directory(path):
+                # Relative links in the index page need the trailing slash
+                return redirect(url_for('browse', task_id=task_id, path=path.rstrip('/') + '/'))
+            return jsonify({"error": "File not found in archive"}), 404
+        
+        etag = reader.etag(name)
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            info = reader.entries[name]
+            # No charset is added: pages keep the encoding they were saved in
+            response = Response(reader.iter_file(name), content_type=reader.mime_type(name),
+                                direct_passthrough=True)
+            response.content_length = info.file_size
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, max-age=0, must-revalidate"
+        response.headers["Content-Security-Policy"] = "sandbox allow-scripts allow-forms allow-popups"
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        return response
+    except Exception as e:
+        logger.error(f"Browse error: {e}")
+        return jsonify({"error": f"Error reading archive: {str(e)}"}), 500
+
 @app.route('/preview/<task_id>')
 def preview(task_id):
-    """Show a preview of crawled content."""
-    if task_id not in active_tasks:
+    """
+    Show a preview of crawled content.
+    
+    Pages come from the task's page index, a page at a time: ?offset= and
+    ?limit= page through them and ?q= filters by title or path.
+    """
+    task = get_task(task_id)
+    if task is None:
         return jsonify({"error": "Task not found"}), 404
     
-    task = active_tasks[task_id]
-    if task["status"] not in ["completed", "processing"]:
+    if task.status not in ["completed", "processing"]:
         return jsonify({"error": "No content available for preview"}), 400
     
     try:
-        # Handle wget vs non-wget tasks differently
-        if task.get("wget_mode", False):
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+        q = request.args.get('q', '').strip() or None
+        
+        # Tasks finished before the index existed are indexed on first preview
+        indexed = task.pages_indexed if task.pages_indexed is not None else index_pages(task_id)
+        if indexed is not None:
+            result = query_pages(task_id, offset, limit, q)
+            resources = task.stats.get("resources", {})
+            return jsonify({
+                "pages": result["pages"],
+                "total_pages": result["total"],
+                "offset": result["offset"],
+                "limit": result["limit"],
+                "next_offset": result["next_offset"],
+                "q": result["q"],
+                "resources": resources,
+                "total_files": sum(resources.values())
+            })
+        
+        # Tasks from before manifests: handle wget vs non-wget tasks differently
+        if task.wget_mode:
             # For wget mode tasks, create a basic preview
             task_dir = temp_dir / task_id
             
@@ -448,7 +623,7 @@ def preview(task_id):
             total_files = 0
             
             # Handle different directory structures
-            domain_dir = task_dir / urlparse(task["url"]).netloc
+            domain_dir = task_dir / urlparse(task.url).netloc
             search_dir = domain_dir if domain_dir.exists() else task_dir
             
             # Walk through the directory and count files
@@ -489,7 +664,12 @@ def preview(task_id):
             return jsonify(preview_data)
         else:
             # For original Python crawler tasks
-            preview_data = task["crawler"].get_preview_data()
+            crawler = running_crawlers.get(task_id)
+            if crawler:
+                preview_data = crawler.get_preview_data()
+            else:
+                resources = task.stats.get("resources", {})
+                preview_data = build_preview_data(temp_dir / task_id, resources, sum(resources.values()))
             return jsonify(preview_data)
     except Exception as e:
         logger.error(f"Preview error: {e}")
@@ -498,31 +678,95 @@ def preview(task_id):
 @app.route('/cleanup/<task_id>', methods=['POST'])
 def cleanup(task_id):
     """Clean up completed task data."""
-    if task_id not in active_tasks:
+    task = get_task(task_id)
+    if task is None:
         return jsonify({"error": "Task not found"}), 404
     
+    subscriber = owner_key(**request_owner())
+    if not is_subscribed(task_id, subscriber):
+        return jsonify({"error": "Not subscribed to this task"}), 403
+    
+    # Other callers subscribed to this crawl still need its files
+    if release_subscriber(task_id, subscriber):
+        return jsonify({"status": "detached"})
+    
+    # A cached archive outlives its task's working files until it is evicted
+    if RESULT_CACHE_BUDGET_BYTES > 0 and task.archive_size is not None:
+        shutil.rmtree(temp_dir / task_id, ignore_errors=True)
+        return jsonify({"status": "cleaned"})
+    
     try:
-        # Clean up task files
-        task = active_tasks[task_id]
-        
         # Different cleanup for wget vs non-wget tasks
-        if task.get("wget_mode", False):
+        if task.wget_mode:
             # For wget mode tasks, just remove the task directory
             task_dir = temp_dir / task_id
             if task_dir.exists():
-                import shutil
                 shutil.rmtree(task_dir, ignore_errors=True)
-        elif "crawler" in task:
+            remove_manifest(task_id)
+        else:
             # For original Python crawler tasks
-            task["crawler"].cleanup()
+            cleanup_task_files(temp_dir / task_id, task.zip_path)
+            forget_artifact(task.zip_path)
         
-        # Remove from active tasks
-        del active_tasks[task_id]
+        # Remove from the task registry
+        delete_task(task_id)
         return jsonify({"status": "cleaned"})
     except Exception as e:
         logger.error(f"Cleanup error: {e}")
         return jsonify({"error": f"Error during cleanup: {str(e)}"}), 500
 
+def cancel_task(task_id, finalize=False):
+    """
+    Cancel a task for one caller.
+    
+    A crawl other callers are subscribed to keeps running and only loses
+    this caller. Otherwise a queued task is dropped at once, and a running one
+    is stopped by its worker, which kills wget, aborts requests in flight
+    and frees the task's files within a second or two.
+    
+    Args:
+        task_id (str): Task to cancel
+        finalize (bool): Archive what a running task has saved so far
+    
+    Returns:
+        tuple: JSON response and status code
+    """
+    task = get_task(task_id)
+    if task is None:
+        return jsonify({"error": "Task not found"}), 404
+    
+    subscriber = owner_key(**request_owner())
+    if not is_subscribed(task_id, subscriber):
+        return jsonify({"error": "Not subscribed to this task"}), 403
+    
+    # Finished tasks keep their subscribers until each of them cleans up
+    if task.status not in ACTIVE_STATUSES:
+        return jsonify({"error": f"Task already {task.status}", "status": task.status}), 409
+    
+    if release_subscriber(task_id, subscriber):
+        return jsonify({"task_id": task_id, "status": "detached"}), 200
+    
+    outcome = request_cancel(task_id, finalize=finalize)
+    if outcome is None:
+        return jsonify({"error": "Task not found"}), 404
+    if outcome not in ("cancelled", "cancelling"):
+        return jsonify({"error": f"Task already {outcome}", "status": outcome}), 409
+    
+    # A crawl running in this process needn't wait for its worker's next poll
+    crawler = running_crawlers.get(task_id)
+    if crawler is not None:
+        crawler.cancel(finalize=finalize)
+    
+    logger.info(f"Cancel requested for task {task_id}: {outcome}")
+    socketio.emit('status_update', {'task_id': task_id, 'message': "Cancelling...", 'progress': -1})
+    return jsonify({"task_id": task_id, "status": outcome, "finalize": finalize}), 202 if outcome == "cancelling" else 200
+
+@app.route('/cancel/<task_id>', methods=['POST'])
+def cancel(task_id):
+    """Cancel a queued or running task; finalize=true keeps a partial archive."""
+    params = request.get_json(silent=True) or request.values
+    return cancel_task(task_id, finalize=_flag(params, 'finalize'))
+
 @socketio.on('connect')
 def handle_connect():
     logger.info('Client connected')
@@ -651,6 +895,20 @@ def delete_api_key(key_id):
     flash(f'API key "{key_name}" deleted successfully', 'success')
     return redirect(url_for('dashboard'))
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Crawl slot usage, worker processes' fetch schedulers, deployment-wide totals and this process's request counters, as JSON."""
+    return jsonify({
+        "crawl_slots": slot_usage(),
+        "running_in_process": len(running_crawlers),
+        "fetch_scheduler": fetch_metrics(),
+        "result_cache": cache_usage(),
+        "janitor": janitor_settings(),
+        "totals": metrics.get_totals(),
+        "wget": {flavor: binary.as_dict() for flavor, binary in probe_wget().items()},
+        "counters": metrics.get_counters()
+    })
+
 # API documentation
 @app.route('/api/docs')
 def api_docs():
@@ -661,7 +919,7 @@ def api_docs():
 @app.route('/api/v1/fast_wget', methods=['POST'])
 @require_api_key
 def api_fast_wget():
-    """API endpoint for fast wget download"""
+    """API endpoint for fast wget download; answers 202 unless wait=true is passed. stream=true skips building the ZIP on disk"""
     url = request.json.get('url')
     if not url:
         return jsonify({"error": "No URL provided"}), 400
@@ -679,30 +937,19 @@ def api_fast_wget():
         return jsonify({"error": f"Invalid URL: {str(e)}"}), 400
     
     try:
-        # Import and use the fast_wget module
-        from fast_wget import crawl_with_wget_sync
-        
-        # Show a message to the user
         logger.info(f"API: Starting fast wget download for {url}")
+        streaming = _flag(request.json, 'stream') or _flag(request.args, 'stream')
+        submitted, refused = submit_crawl(url, "fast_wget", request.json, archive=not streaming)
+        if refused is not None:
+            return refused
         
-        # Call the wget function (this will block until download is complete)
-        logger.debug(f"API: Calling crawl_with_wget_sync({url})")
-        zip_path = crawl_with_wget_sync(url)
-        logger.debug(f"API: crawl_with_wget_sync returned zip_path: {zip_path}")
-        
-        if not zip_path:
-            logger.error("API: crawl_with_wget_sync returned None")
-            return jsonify({"error": "Failed to download website with wget. The website might be unavailable, blocked, or have certificate issues. Please try a different website."}), 500
-            
-        if not os.path.exists(zip_path):
-            logger.error(f"API: Generated ZIP file does not exist at path: {zip_path}")
-            return jsonify({"error": f"Failed to download website with wget. ZIP file not found at {zip_path}."}), 500
-        
-        # Log success
-        logger.info(f"API: Successfully downloaded website. ZIP file at: {zip_path}")
+        task_id = submitted["task_id"]
+        if _flag(request.json, 'wait') or _flag(request.args, 'wait'):
+            return wait_for_fast_wget(task_id, log_prefix="API: ")
         
-        # Return the ZIP file directly
-        return send_file(zip_path, as_attachment=True, download_name=os.path.basename(zip_path))
+        return fast_wget_accepted(submitted,
+                                  url_for('api_job_status', task_id=task_id),
+                                  url_for('api_job_download', task_id=task_id))
     
     except Exception as e:
         # Log the error with full traceback
@@ -711,6 +958,59 @@ def api_fast_wget():
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({"error": f"Error downloading with wget: {str(e)}"}), 500
 
+@app.route('/api/v1/artifacts')
+@require_api_key
+def api_artifacts():
+    """API endpoint listing the key owner's archives, newest first; page with limit and before"""
+    limit, before = listing_args(request.args)
+    listing = list_artifacts(limit, before, user_id=request.user.id)
+    for artifact in listing["artifacts"]:
+        if artifact["task_id"]:
+            artifact["download_url"] = url_for('api_job_download', task_id=artifact["task_id"])
+    return jsonify(listing)
+
+@app.route('/api/v1/jobs/<task_id>')
+@require_api_key
+def api_job_status(task_id):
+    """API endpoint for the status of a queued download"""
+    task = get_task(task_id)
+    if task is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    response = {
+        "task_id": task.id,
+        "status": task.status,
+        "url": task.url,
+        "progress": task.progress,
+        "message": task.message
+    }
+    if task.status == "queued":
+        response["queue_position"] = queue_position(task_id)
+    if task.status in ACTIVE_STATUSES:
+        response["snapshot_url"] = url_for('api_job_download', task_id=task_id, snapshot=1)
+    if task.status == "completed" or (task.status == "cancelled" and task.zip_path):
+        response["download_url"] = url_for('api_job_download', task_id=task_id)
+    if task.error:
+        response["error"] = task.error
+    return jsonify(response)
+
+@app.route('/api/v1/jobs/<task_id>/download')
+@require_api_key
+def api_job_download(task_id):
+    """API endpoint to download a finished job's ZIP file"""
+    return download(task_id)
+
+@app.route('/api/v1/jobs/<task_id>/cancel', methods=['POST'])
+@require_api_key
+def api_job_cancel(task_id):
+    """API endpoint to cancel a queued or running job; finalize=true keeps a partial archive"""
+    params = request.get_json(silent=True) or request.args
+    return cancel_task(task_id, finalize=_flag(params, 'finalize'))
+
+# Run crawl jobs in this process unless dedicated workers handle them
+if EMBEDDED_CRAWL_WORKERS > 0:
+    start_workers(app, socketio, EMBEDDED_CRAWL_WORKERS)
+
 if __name__ == '__main__':
     try:
         port = int(os.environ.get("PORT", 8080))
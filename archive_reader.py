@@ -0,0 +1,139 @@
+"""
+Random access to single files inside a finished crawl archive.
+
+The central directory of each archive is read once and kept, and the
+archive is memory-mapped, so serving a stored (uncompressed) entry is
+slicing the mapping rather than seeking and reading through zipfile. Deflated entries
+are inflated as they stream out.
+"""
+import os
+import mmap
+import struct
+import zipfile
+import threading
+import mimetypes
+from collections import OrderedDict
+
+# Archives whose central directory is kept open
+READER_CACHE_SIZE = 32
+
+# Size of the chunks a file is streamed in
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Fixed part of a local file header, before its file name and extra field
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+class ArchiveReader:
+    """
+    An open crawl archive: its central directory and a read-only mapping.
+
+    Args:
+        zip_path (str): Archive to open
+        mime_types (dict): MIME type by entry name, e.g. from the crawl
+            manifest, for files whose names don't give their type away
+    """
+
+    def __init__(self, zip_path, mime_types=None):
+        self.zip_path = zip_path
+        self.mime_types = mime_types or {}
+        self._zip = zipfile.ZipFile(zip_path)
+        self.entries = {info.filename: info for info in self._zip.infolist() if not info.is_dir()}
+        self._file = open(zip_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._data_offsets = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._zip.close()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def find(self, path):
+        """
+        Resolve a browse path to an entry name.
+
+        A path naming a directory resolves to its index.html.
+
+        Returns:
+            str: The entry name, or None if there is no such file
+        """
+        path = path.lstrip('/')
+        if path == '' or path.endswith('/'):
+            path += 'index.html'
+        return path if path in self.entries else None
+
+    def is_directory(self, path):
+        """Whether a path without a trailing slash names a directory with an index.html."""
+        return f"{path.strip('/')}/index.html" in self.entries
+
+    def etag(self, name):
+        info = self.entries[name]
+        return f"{info.CRC:08x}-{info.file_size:x}"
+
+    def mime_type(self, name):
+        return self.mime_types.get(name) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    def _data_offset(self, info):
+        """Where a stored entry's bytes start, from its local header."""
+        with self._lock:
+            offset = self._data_offsets.get(info.filename)
+            if offset is None:
+                header = self._mmap[info.header_offset:info.header_offset + _LOCAL_HEADER.size]
+                fields = _LOCAL_HEADER.unpack(header)
+                if fields[0] != _LOCAL_HEADER_SIGNATURE:
+                    raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+                offset = info.header_offset + _LOCAL_HEADER.size + fields[9] + fields[10]
+                self._data_offsets[info.filename] = offset
+            return offset
+
+    def iter_file(self, name):
+        """Yield an entry's contents in chunks, straight from the mapping when stored."""
+        info = self.entries[name]
+        if info.compress_type == zipfile.ZIP_STORED and self._mmap is not None:
+            # WSGI servers want bytes, so each chunk is one copy out of the
+            # page cache, with no seek or read calls on the archive
+            start = self._data_offset(info)
+            end = start + info.file_size
+            for offset in range(start, end, STREAM_CHUNK_BYTES):
+                yield self._mmap[offset:min(offset + STREAM_CHUNK_BYTES, end)]
+            return
+
+        with self._zip.open(info) as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_BYTES), b''):
+                yield chunk
+
+
+_readers = OrderedDict()
+_readers_lock = threading.Lock()
+
+
+def get_reader(zip_path, load_mime_types=None):
+    """
+    The cached reader for an archive, opening it on first use.
+
+    load_mime_types, if given, is called once when the archive is opened
+    and returns the reader's mime_types.
+
+    Readers are keyed on the archive's size and modification time, so a
+    rewritten archive is reopened. Readers pushed out of the cache are not
+    closed here; they close once responses still streaming from them finish.
+    """
+    stat = os.stat(zip_path)
+    key = (os.path.abspath(zip_path), stat.st_mtime_ns, stat.st_size)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is not None:
+            _readers.move_to_end(key)
+            return reader
+
+    reader = ArchiveReader(zip_path, load_mime_types() if load_mime_types else None)
+    with _readers_lock:
+        reader = _readers.setdefault(key, reader)
+        _readers.move_to_end(key)
+        while len(_readers) > READER_CACHE_SIZE:
+            _readers.popitem(last=False)
+    return reader
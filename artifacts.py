@@ -0,0 +1,191 @@
+"""
+Registry of finished archives.
+
+Each archive is recorded once, as it is produced, with its owner, size,
+creation time and source URL. Download listings page through this table
+newest first instead of listing and stat-ing a directory on every request.
+
+Archives are written under ARCHIVE_DIR rather than the working directory,
+with names that can't collide: the host, the time and a per-archive suffix.
+"""
+import os
+import re
+import time
+import uuid
+import logging
+import argparse
+import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+from models import db, Artifact, create_schema
+
+logger = logging.getLogger(__name__)
+
+# Where finished archives are written
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archives")
+
+# Page size for archive listings, and the most one request may ask for
+DEFAULT_LISTING_LIMIT = 50
+MAX_LISTING_LIMIT = 500
+
+_UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9_-]+')
+
+
+def new_archive_path(host, key=None):
+    """
+    A fresh path for an archive of a crawl of host.
+
+    Args:
+        host (str): Host (and port) the crawl started from
+        key (str): Task ID or other unique key; a random one by default
+
+    Returns:
+        str: Absolute path ARCHIVE_DIR/<host>_<unix time>_<key prefix>.zip;
+            absolute so send_file doesn't resolve it against the app's root
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    stem = _UNSAFE_NAME_CHARS.sub('_', host).strip('_') or 'site'
+    suffix = (key or uuid.uuid4().hex).replace('-', '')[:8]
+    return os.path.abspath(os.path.join(ARCHIVE_DIR, f"{stem}_{int(time.time())}_{suffix}.zip"))
+
+
+def register_artifact(path, url=None, task_id=None, user_id=None):
+    """
+    Record a finished archive, or refresh its size if already recorded.
+
+    Returns:
+        Artifact: The registry entry, or None if the file doesn't exist
+    """
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    name = os.path.basename(path)
+    artifact = Artifact.query.filter_by(name=name).first()
+    if artifact is None:
+        artifact = Artifact(name=name, created_at=datetime.datetime.utcfromtimestamp(stat.st_mtime))
+        db.session.add(artifact)
+    artifact.path = path
+    artifact.url = url
+    artifact.task_id = task_id
+    artifact.user_id = user_id
+    artifact.size = stat.st_size
+    db.session.commit()
+    return artifact
+
+
+def register_task_artifact(task):
+    """Record a finished task's archive, if it has one: a completed task's, or a finalized cancel's partial one."""
+    if task is None or task.status not in ("completed", "cancelled") or not task.zip_path:
+        return None
+    return register_artifact(task.zip_path, task.url, task.id, task.user_id)
+
+
+def forget_artifact(path):
+    """Drop the registry entry for an archive that has been deleted; the caller commits."""
+    if path:
+        Artifact.query.filter_by(name=os.path.basename(path)).delete(synchronize_session=False)
+
+
+def get_artifact(name):
+    return Artifact.query.filter_by(name=name).first()
+
+
+def latest_artifact(user_id=None):
+    """The newest archive, optionally only one of user_id's."""
+    query = Artifact.query
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    return query.order_by(Artifact.id.desc()).first()
+
+
+def list_artifacts(limit=DEFAULT_LISTING_LIMIT, before=None, user_id=None):
+    """
+    One page of archives, newest first.
+
+    Pages are keyed on the ID of the last archive seen rather than an
+    offset, so any page costs the same index range scan.
+
+    Args:
+        limit (int): Archives to return, at most MAX_LISTING_LIMIT
+        before (int): Only archives older than this ID, from next_before
+        user_id (int): Only archives owned by this user
+
+    Returns:
+        dict: artifacts, limit and next_before (None on the last page)
+    """
+    limit = max(1, min(limit, MAX_LISTING_LIMIT))
+    query = Artifact.query
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    if before is not None:
+        query = query.filter(Artifact.id < before)
+
+    # One extra row says whether there is a next page without counting
+    rows = query.order_by(Artifact.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+    return {
+        "artifacts": [artifact.to_dict() for artifact in page],
+        "limit": limit,
+        "next_before": page[-1].id if len(rows) > limit else None
+    }
+
+
+def listing_args(args):
+    """limit and before from request arguments, ignoring malformed values."""
+    try:
+        limit = int(args.get('limit', DEFAULT_LISTING_LIMIT))
+    except (TypeError, ValueError):
+        limit = DEFAULT_LISTING_LIMIT
+    try:
+        before = int(args['before']) if args.get('before') else None
+    except ValueError:
+        before = None
+    return limit, before
+
+
+def bind_database(app):
+    """
+    Point a standalone download server at the app's database.
+
+    The standalone servers share the registry with the main app; relative
+    SQLite URLs resolve to the same instance folder.
+    """
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", os.environ.get("DATABASE_URL", "sqlite:///app.db"))
+    app.config.setdefault("SQLALCHEMY_TRACK_MODIFICATIONS", False)
+    db.init_app(app)
+    with app.app_context():
+        create_schema()
+
+
+def import_archives(directory):
+    """
+    Register ZIP files already in a directory, e.g. from before the registry.
+
+    Returns:
+        int: Number of archives registered
+    """
+    count = 0
+    for entry in sorted(os.scandir(directory), key=lambda e: e.stat().st_mtime):
+        if entry.is_file() and entry.name.endswith('.zip') and get_artifact(entry.name) is None:
+            register_artifact(entry.path)
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Register existing ZIP archives in the artifact registry.")
+    parser.add_argument("directory", nargs="?", default=".",
+                        help="directory to import archives from (default: the working directory)")
+    args = parser.parse_args(argv)
+
+    from flask import Flask
+    app = Flask(__name__)
+    bind_database(app)
+    with app.app_context():
+        count = import_archives(args.directory)
+    print(f"Registered {count} archives from {Path(args.directory).resolve()}")
+
+
+if __name__ == '__main__':
+    main()
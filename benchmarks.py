@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the crawler's hot paths.
+
+Usage: benchmarks.py [NAME ...]
+Runs every benchmark when no names are given.
+"""
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import functools
+from pathlib import Path
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from css_rewriter import rewrite_css
+from crawler import WebCrawler
+from fetch_scheduler import FetchScheduler
+import wget_backend
+
+
+def _timeit(func, repeat=5):
+    """Return the best wall time of several runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _css_bundle(rules=50000):
+    """Build a large CSS bundle resembling framework output."""
+    parts = ['@charset "utf-8";\n@import "base.css";\n@import url(theme.css) screen;\n']
+    for i in range(rules):
+        parts.append(
+            f".c{i}{{color:#{i % 4096:03x};margin:0 {i % 16}px;"
+            f"background:url(../img/sprite{i % 40}.png) no-repeat -{i % 200}px 0}}\n"
+        )
+        if i % 500 == 0:
+            parts.append(f"/* section {i}: url(not-a-ref.png) */\n")
+            parts.append(f"@font-face{{font-family:f{i};src:url('../fonts/f{i}.woff2') format('woff2')}}\n")
+    return ''.join(parts)
+
+
+def bench_css():
+    """Throughput of the single-pass CSS rewriter on a multi-MB bundle."""
+    css = _css_bundle()
+    css_bytes = css.encode('utf-8')
+    size_mb = len(css_bytes) / (1024 * 1024)
+
+    def rewrite(url):
+        return '/assets/' + url.rsplit('/', 1)[-1]
+
+    for label, data in (('str', css), ('bytes', css_bytes)):
+        elapsed = _timeit(lambda: rewrite_css(data, rewrite))
+        print(f"css rewrite ({label}): {size_mb:.1f} MB in {elapsed * 1000:.1f} ms "
+              f"= {size_mb / elapsed:.1f} MB/s")
+
+
+class _NullSocketIO:
+    def emit(self, *args, **kwargs):
+        pass
+
+
+def bench_resolve(pages=2000, links_per_page=300):
+    """CPU saved by the link resolution cache on a template-heavy site."""
+    crawler = WebCrawler("https://example.com/", "bench_resolve", _NullSocketIO())
+    try:
+        # Every page shares the same nav/footer, spread over a few directories
+        nav = [f"/section{i % 30}/page{i}" if i % 3 else f"../item{i}.html" for i in range(links_per_page)]
+        page_urls = [f"https://example.com/blog/{p % 50}/post-{p}" for p in range(pages)]
+
+        def uncached():
+            for page_url in page_urls:
+                for href in nav:
+                    crawler._resolve_link_uncached(page_url, href, True)
+
+        def cached():
+            crawler._resolve_link.cache_clear()
+            for page_url in page_urls:
+                for href in nav:
+                    crawler._resolve_link(crawler._resolution_base(page_url, href), href, True)
+
+        lookups = pages * links_per_page
+        uncached_time = _timeit(uncached, repeat=3)
+        cached_time = _timeit(cached, repeat=3)
+        stats = crawler.get_resolve_cache_stats()
+        print(f"link resolution: {lookups} lookups, uncached {uncached_time * 1000:.0f} ms, "
+              f"cached {cached_time * 1000:.0f} ms ({uncached_time / cached_time:.1f}x), "
+              f"hit rate {stats['hit_rate']:.1%}")
+    finally:
+        crawler.cleanup()
+
+
+def bench_fair_share(connections=4, fetch_seconds=0.005, small_fetches=40):
+    """How long a small crawl takes while a large one saturates the fetch budget."""
+    scheduler = FetchScheduler(connections)
+    stop = threading.Event()
+
+    def fetcher(task_id, count=None):
+        done = 0
+        while not stop.is_set() and (count is None or done < count):
+            with scheduler.connection(task_id):
+                time.sleep(fetch_seconds)
+            done += 1
+
+    # The large crawl keeps more fetch threads busy than there are connections
+    scheduler.register("large")
+    large = [threading.Thread(target=fetcher, args=("large",)) for _ in range(connections * 4)]
+    for thread in large:
+        thread.start()
+    time.sleep(0.2)
+
+    # A small crawl arrives with its usual few fetch threads
+    scheduler.register("small")
+    start = time.perf_counter()
+    small = [threading.Thread(target=fetcher, args=("small", small_fetches // 2)) for _ in range(2)]
+    for thread in small:
+        thread.start()
+    for thread in small:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    for thread in large:
+        thread.join()
+
+    alone = small_fetches / 2 * fetch_seconds
+    stats = scheduler.get_stats()["crawls"]
+    print(f"fair share: small crawl of {small_fetches} fetches took {elapsed * 1000:.0f} ms next to a "
+          f"saturating crawl ({alone * 1000:.0f} ms alone), avg wait {stats['small']['avg_wait_ms']} ms "
+          f"vs {stats['large']['avg_wait_ms']} ms for the large crawl")
+
+
+def _write_site(root, pages):
+    """A site of linked pages sharing a stylesheet, with a sitemap listing them."""
+    (root / "css").mkdir()
+    (root / "img").mkdir()
+    (root / "pages").mkdir()
+    (root / "css" / "site.css").write_text("body{background:url(../img/bg.png)}\n")
+    (root / "img" / "bg.png").write_bytes(b"\x89PNG" + b"\0" * 2048)
+    links = ''.join(f'<a href="pages/p{i}.html">p{i}</a>' for i in range(pages))
+    (root / "index.html").write_text(f'<html><head><link rel="stylesheet" href="css/site.css"></head>'
+                                     f'<body>{links}</body></html>')
+    for i in range(pages):
+        (root / "img" / f"p{i}.png").write_bytes(b"\x89PNG" + b"\0" * 4096)
+        (root / "pages" / f"p{i}.html").write_text(
+            f'<html><head><link rel="stylesheet" href="../css/site.css"></head><body>'
+            f'<img src="../img/p{i}.png"><a href="../index.html">home</a>'
+            f'<a href="p{(i + 1) % pages}.html">next</a></body></html>')
+    return ['index.html'] + [f"pages/p{i}.html" for i in range(pages)]
+
+
+class _SlowHandler(SimpleHTTPRequestHandler):
+    """Static file server with a fixed per-request delay, standing in for network latency."""
+
+    latency = 0.02
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_wget_parallel(pages=150, latency=0.02):
+    """
+    Wall time of a wget mirror: one process vs a sharded sitemap vs wget2.
+
+    The test site's sitemap lists every page, so all strategies mirror the
+    same files. On a development machine the sharded mirror ran about
+    1.5-1.8x faster than one process.
+    """
+    if not wget_backend.get_wget("wget"):
+        print("wget parallel: wget is not installed, skipping")
+        return
+
+    site = Path(tempfile.mkdtemp(prefix="bench_site_"))
+    out = Path(tempfile.mkdtemp(prefix="bench_wget_"))
+    server = None
+    try:
+        _SlowHandler.latency = latency
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_SlowHandler, directory=str(site)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}/"
+        paths = _write_site(site, pages)
+        (site / "sitemap.xml").write_text(
+            '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            + ''.join(f"<url><loc>{base}{path}</loc></url>" for path in paths) + '</urlset>')
+
+        strategies = ["single", "sharded"] + (["wget2"] if wget_backend.get_wget("wget2") else [])
+        times = {}
+        for strategy in strategies:
+            target = out / strategy
+            start = time.perf_counter()
+            result = wget_backend.mirror(base, target, strategy=strategy)
+            times[strategy] = time.perf_counter() - start
+            print(f"wget parallel ({strategy}): {result['progress']['processed_urls']} files "
+                  f"in {times[strategy]:.2f} s, exit {result['returncode']}")
+        for strategy in strategies[1:]:
+            print(f"wget parallel: {strategy} is {times['single'] / times[strategy]:.1f}x the single process "
+                  f"({wget_backend.WGET_SHARDS} shards, {wget_backend.WGET2_THREADS} wget2 threads, "
+                  f"{latency * 1000:.0f} ms latency)")
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(site, ignore_errors=True)
+        shutil.rmtree(out, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'css': bench_css,
+    'resolve': bench_resolve,
+    'fair': bench_fair_share,
+    'wget': bench_wget_parallel,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Available: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[name]()
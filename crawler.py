@@ -1,31 +1,235 @@
 import os
+import io
 import re
+import codecs
+import posixpath
+import tempfile
 import time
-import uuid
 import logging
 import zipfile
 import shutil
 from pathlib import Path
-from urllib.parse import urlparse, urljoin, urldefrag
+from urllib.parse import urlparse, urljoin, urldefrag, urlunparse, parse_qsl, urlencode
 from collections import deque
 import threading
 import queue
+import functools
+import json
 
 import requests
-from bs4 import BeautifulSoup
+import charset_normalizer
 import hashlib
-import random
+
+from css_rewriter import rewrite_css
+from html_rewriter import HTMLRewriter
+from pipeline import Pipeline, Stage
+from artifacts import new_archive_path
+from fetch_scheduler import fetch_scheduler
+from manifest import (ManifestWriter, read_manifest, write_archive, preview_from_manifest,
+                      remove_manifest, clean_title, classify_path)
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# How much of an HTML body to sniff for a BOM or <meta charset> declaration
+CHARSET_SNIFF_BYTES = 4096
+
+# Chunk size for streaming HTML bodies through the rewriter
+HTML_CHUNK_BYTES = 64 * 1024
+
+# Bodies up to this size are kept in memory between pipeline stages
+SPOOL_MEMORY_BYTES = 1024 * 1024
+
+# Where each kind of resource is stored, by the extension of its URL
+RESOURCE_DIRS = {
+    "css": "css",
+    "js": "js",
+    "images": "images",
+    "fonts": "fonts",
+}
+
+# Checkpoint of the crawl frontier, kept in the task directory so a crawl
+# reassigned to another worker resumes instead of starting over
+CRAWL_STATE_FILE = ".crawl_state.json"
+CHECKPOINT_EVERY = 25
+
+# Max (base directory, href) pairs kept in each crawler's link resolution cache
+RESOLVE_CACHE_SIZE = 8192
+
+# Byte order marks, longest first so UTF-32 is not mistaken for UTF-16
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# Matches both <meta charset="..."> and <meta http-equiv content="...; charset=...">
+_META_CHARSET_RE = re.compile(
+    rb'<meta[^>]*?charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:\-]+)',
+    re.IGNORECASE
+)
+
+_HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([a-zA-Z0-9_.:\-]+)', re.IGNORECASE)
+
+
+def _valid_encoding(name):
+    """Return the normalised codec name, or None if Python does not know it."""
+    try:
+        return codecs.lookup(name).name
+    except (LookupError, TypeError):
+        return None
+
+
+def detect_html_encoding(content_type, body):
+    """
+    Work out the encoding of an HTML body without running full charset detection.
+    
+    Checks, in order: the charset in the Content-Type header, a byte order mark,
+    and a <meta charset> declaration within the first few KB. Returns None when
+    none of them give a usable answer.
+    """
+    header_match = _HEADER_CHARSET_RE.search(content_type or '')
+    if header_match:
+        encoding = _valid_encoding(header_match.group(1))
+        if encoding:
+            return encoding
+    
+    head = body[:CHARSET_SNIFF_BYTES]
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    
+    meta_match = _META_CHARSET_RE.search(head)
+    if meta_match:
+        encoding = _valid_encoding(meta_match.group(1).decode('ascii', 'ignore'))
+        if encoding:
+            # A meta tag we could read as ASCII cannot really be UTF-16
+            return 'utf-8' if encoding.startswith('utf-16') else encoding
+    
+    return None
+
+
+def sniff_html_encoding(content_type, head):
+    """
+    Pick the encoding for a streamed HTML body from its first chunk.
+    
+    Uses detect_html_encoding first. Undeclared pages are overwhelmingly UTF-8,
+    so a strict decode of the head is tried next, and charset detection over
+    the head only runs as a last resort.
+    """
+    encoding = detect_html_encoding(content_type, head)
+    if encoding:
+        return encoding
+    
+    try:
+        # The incremental decoder tolerates a sequence cut off at the chunk end
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    
+    best = charset_normalizer.from_bytes(head).best()
+    return _valid_encoding(best.encoding) if best else 'utf-8'
+
+
+def relative_link(target, document):
+    """
+    Link from one stored file to another, both relative to the archive root.
+    
+    Links are relative to the referencing document, so the archive works
+    wherever it is unpacked or served from, not just at a site root.
+    """
+    return posixpath.relpath(target, posixpath.dirname(document) or '.')
+
+
+def url_directory(url):
+    """
+    Return the part of a URL that urljoin resolves relative references against.
+    
+    Every page in the same directory resolves a given href the same way, which
+    is what lets link resolution be cached across pages.
+    """
+    url = url.split('#', 1)[0].split('?', 1)[0]
+    scheme_end = url.find('//')
+    slash = url.rfind('/')
+    if scheme_end == -1 or slash <= scheme_end + 1:
+        return url + '/'
+    return url[:slash + 1]
+
+
+def url_origin(url):
+    """Return the scheme://host/ prefix of an absolute URL."""
+    scheme_end = url.find('//')
+    if scheme_end == -1:
+        return url
+    slash = url.find('/', scheme_end + 2)
+    return url + '/' if slash == -1 else url[:slash + 1]
+
+
+def canonical_url(url):
+    """
+    Normalise a start URL so that equivalent spellings compare equal.
+    
+    Lowercases the scheme and host, drops default ports and the fragment,
+    gives an empty path a trailing slash and sorts the query parameters.
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    if parsed.port and (scheme, parsed.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parsed.port}"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, parsed.path or '/', parsed.params, query, ''))
+
+
+class _CrawlItem:
+    """A URL travelling through the crawl pipeline."""
+    
+    __slots__ = ('url', 'content_type', 'body', 'kind', 'relative_path', 'title')
+    
+    def __init__(self, url):
+        self.url = url
+        self.content_type = ''
+        # Spooled file holding the fetched, then transformed, body
+        self.body = None
+        self.kind = None
+        self.relative_path = None
+        self.title = None
+    
+    def close(self):
+        if self.body is not None:
+            self.body.close()
+            self.body = None
+
+
 class WebCrawler:
-    def __init__(self, start_url, task_id, socketio, throttle_delay=0.1):
+    """
+    Crawls a site through a staged pipeline: fetch -> classify -> transform -> store.
+    
+    Each stage has its own worker pool and a bounded queue in front of it, so
+    a slow stage applies backpressure instead of stalling every other step,
+    and per-stage queue depth and latency show where the bottleneck is.
+    """
+    
+    def __init__(self, start_url, task_id, socketio, throttle_delay=0.1,
+                 fetch_workers=4, transform_workers=2, store_workers=2, queue_size=64,
+                 progress_callback=None, fetch_weight=1.0, scheduler=None, build_archive=True):
         self.start_url = start_url
         self.task_id = task_id
         self.socketio = socketio
         self.throttle_delay = throttle_delay
+        # Fetches queue for connections shared with every other crawl in the
+        # process; fetch_weight is this crawl's share of them
+        self.fetch_weight = fetch_weight
+        self.scheduler = scheduler or fetch_scheduler
+        # Called as progress_callback(message, progress, stats) with every status update
+        self.progress_callback = progress_callback
+        # False for streaming-only crawls: the files stay in the task directory
+        # and downloads zip them as they are sent
+        self.build_archive = build_archive
         
         # Parse the starting URL
         self.parsed_url = urlparse(start_url)
@@ -39,12 +243,28 @@ class WebCrawler:
         # Set up tracking variables
         self.visited_urls = set()
         self.queue = deque()
+        # Page requisites (CSS, images, fonts...) are fetched before further pages
+        self.requisite_queue = deque()
+        self.queued_urls = set()
+        # URLs that have been through the whole pipeline, fetched or failed
+        self.completed_urls = set()
         self.processed_count = 0
         self.failed_urls = []
         self.file_count = 0
         self.zip_path = None
+        # Every stored file is recorded here as it is written
+        self.manifest = None
         self.status = "initialized"
         
+        # Guards the frontier above; pipeline workers add URLs while the
+        # crawl loop takes them off
+        self._frontier_cond = threading.Condition()
+        self._in_flight = 0
+        # Guards counters updated from pipeline workers
+        self._lock = threading.Lock()
+        self.state_path = self.task_dir / CRAWL_STATE_FILE
+        self._checkpoint_lock = threading.Lock()
+        
         # Set up tracking for downloaded resource types
         self.resources = {
             "html": 0,
@@ -60,18 +280,32 @@ class WebCrawler:
             "total_urls": 0,
             "processed_urls": 0,
             "failed_urls": 0,
+            "bytes_downloaded": 0,
             "resources": self.resources
         }
         
+        # Nav/footer links repeat on every page, so cache their resolution
+        self._resolve_link = functools.lru_cache(maxsize=RESOLVE_CACHE_SIZE)(self._resolve_link_uncached)
+        
         # Thread-safe queue for emitting status updates
         self.message_queue = queue.Queue()
         self._stop_event = threading.Event()
+        # "discard" or "finalize" once the crawl has been cancelled
+        self._cancel_mode = None
+        
+        # One requests session per fetch thread, and the responses being
+        # read, so a cancel can cut them off mid-body
+        self._local = threading.local()
+        self._sessions = []
+        self._responses = set()
         
-        # Session for requests
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (compatible; WebSiteToZip/1.0; +http://websitetozip.com)'
-        })
+        # I/O-bound stages get more threads than the CPU-bound transform
+        self.pipeline = Pipeline([
+            Stage("fetch", self._fetch_stage, fetch_workers, queue_size),
+            Stage("classify", self._classify_stage, 1, queue_size),
+            Stage("transform", self._transform_stage, transform_workers, queue_size),
+            Stage("store", self._store_stage, store_workers, queue_size),
+        ], on_complete=self._on_item_complete)
     
     def start_crawling(self):
         """Start the crawling process."""
@@ -84,57 +318,70 @@ class WebCrawler:
         status_thread.start()
         
         try:
-            # Add the start URL to the queue
-            self.queue.append(self.start_url)
-            self.stats["total_urls"] += 1
-            
-            # Emit initial status
-            self._queue_status_update("Started crawling", 0)
+            resumed = self._load_checkpoint()
+            # A resumed crawl keeps the files the last attempt recorded
+            self.manifest = ManifestWriter(self.task_id, append=resumed)
+            if resumed:
+                self._queue_status_update(f"Resumed crawl with {len(self.completed_urls)} URLs already done", 0)
+            else:
+                # Add the start URL to the queue
+                self._enqueue(self.start_url)
+                
+                # Emit initial status
+                self._queue_status_update("Started crawling", 0)
             
             # Create necessary directories
             self._create_directory_structure()
             
-            # Process the queue - unlimited depth crawling
-            processed_urls = 0
+            # Feed the frontier into the pipeline - unlimited depth crawling
+            self.scheduler.register(self.task_id, self.fetch_weight)
+            self.pipeline.start()
+            try:
+                while not self._stop_event.is_set():
+                    current_url = self._next_url()
+                    if current_url is None:
+                        break
+                    
+                    # Blocks while the fetch stage is backed up
+                    self.pipeline.put(_CrawlItem(current_url))
+            finally:
+                self.pipeline.stop()
+                self.manifest.close()
+                self.stats["fetch_queue"] = self.scheduler.get_flow_stats(self.task_id)
+                self.scheduler.unregister(self.task_id)
             
-            while self.queue and not self._stop_event.is_set():
-                # Get the next URL
-                current_url = self.queue.popleft()
-                
-                # Skip if already visited
-                if current_url in self.visited_urls:
-                    continue
-                
-                # Mark as visited
-                self.visited_urls.add(current_url)
-                
-                # Process the URL
-                self._process_url(current_url)
+            if self._cancel_mode == "abandon":
+                # The job is another worker's now, and so are the task
+                # directory, checkpoint and manifest: leave them as they are
+                self.status = "abandoned"
+            elif self._cancel_mode:
+                # Cancelled: nothing to resume, but keep what was saved if asked
+                if self.state_path.exists():
+                    self.state_path.unlink()
+                if self._cancel_mode == "finalize":
+                    self._create_redirects_file()
+                    self._create_zip_file()
+                self.status = "cancelled"
+                self._queue_status_update("Crawling cancelled", -1)
+            elif self._stop_event.is_set():
+                # Stopped before the frontier ran dry; keep state for a resume
+                self._save_checkpoint()
+                self.status = "stopped"
+                self._queue_status_update("Crawling stopped", -1)
+            else:
+                if self.state_path.exists():
+                    self.state_path.unlink()
                 
-                # Update progress
-                self.processed_count += 1
-                self.stats["processed_urls"] = self.processed_count
-                processed_urls += 1
+                # Create redirects file for Netlify
+                self._create_redirects_file()
                 
-                # Update progress more frequently (every 5 URLs)
-                if processed_urls % 5 == 0:
-                    # Calculate a progress percentage based on ratio of processed to total known URLs
-                    total_known_urls = len(self.visited_urls) + len(self.queue)
-                    progress = min(int((len(self.visited_urls) / max(total_known_urls, 1)) * 100), 99)
-                    self._queue_status_update(f"Processed {processed_urls} URLs - Unlimited depth crawling", progress)
+                # Create zip file
+                if self.build_archive:
+                    self._create_zip_file()
                 
-                # Throttle requests with shorter delay for faster completion
-                time.sleep(self.throttle_delay)
-            
-            # Create redirects file for Netlify
-            self._create_redirects_file()
-            
-            # Create zip file
-            self._create_zip_file()
-            
-            # Update status to completed
-            self.status = "completed"
-            self._queue_status_update("Crawling completed", 100)
+                # Update status to completed
+                self.status = "completed"
+                self._queue_status_update("Crawling completed", 100)
             
         except Exception as e:
             logger.error(f"Crawling error: {e}")
@@ -143,6 +390,176 @@ class WebCrawler:
         
         # Signal the status updater to stop
         self._stop_event.set()
+        self._close_sessions()
+    
+    def stop(self):
+        """Ask the crawl to stop; URLs already in the pipeline are finished first."""
+        self._stop_event.set()
+    
+    def cancel(self, finalize=False):
+        """
+        Cancel the crawl: stop the frontier, cut off responses being read
+        and drop URLs still in the pipeline.
+        
+        Args:
+            finalize (bool): Archive the files saved so far instead of
+                discarding them
+        """
+        self._cut_off("finalize" if finalize else "discard")
+    
+    def abandon(self):
+        """
+        Drop the crawl after its lease was lost, as cancel() does, but
+        without touching anything the new lease holder now owns: no
+        checkpoint, manifest entries, files, archive or progress reports.
+        """
+        self._cut_off("abandon")
+    
+    def _cut_off(self, mode):
+        self._cancel_mode = mode
+        self._stop_event.set()
+        with self._lock:
+            responses = list(self._responses)
+        for response in responses:
+            try:
+                # Unblocks a fetch thread waiting on the socket
+                response.raw.shutdown()
+            except Exception:
+                response.close()
+        with self._frontier_cond:
+            self._frontier_cond.notify_all()
+    
+    def _next_url(self):
+        """
+        Take the next unvisited URL off the frontier, page requisites first.
+        
+        Waits while the frontier is empty but pages are still in the pipeline,
+        since they may add more links. Returns None once the crawl is done.
+        """
+        with self._frontier_cond:
+            while not self._stop_event.is_set():
+                if self.requisite_queue:
+                    current_url = self.requisite_queue.popleft()
+                elif self.queue:
+                    current_url = self.queue.popleft()
+                elif self._in_flight:
+                    self._frontier_cond.wait(timeout=0.5)
+                    continue
+                else:
+                    return None
+                
+                # Skip if already visited
+                if current_url in self.visited_urls:
+                    continue
+                
+                # Mark as visited
+                self.visited_urls.add(current_url)
+                self._in_flight += 1
+                return current_url
+        return None
+    
+    def _on_item_complete(self, item, error):
+        """Called exactly once for every URL that leaves the pipeline."""
+        item.close()
+        
+        # While stopping, URLs dropped or cut off mid-fetch still need doing
+        stopping = self._stop_event.is_set()
+        finished = not stopping or (error is None and item.kind is not None)
+        
+        if error is not None and not stopping:
+            logger.error(f"Error processing {item.url}: {error}")
+            with self._lock:
+                self.failed_urls.append(item.url)
+                self.stats["failed_urls"] += 1
+        
+        with self._frontier_cond:
+            self._in_flight -= 1
+            if finished:
+                self.completed_urls.add(item.url)
+            self.processed_count += 1
+            self.stats["processed_urls"] = self.processed_count
+            processed_urls = self.processed_count
+            total_known_urls = len(self.visited_urls) + self._pending_count()
+            visited = len(self.visited_urls)
+            self._frontier_cond.notify_all()
+        
+        if processed_urls % CHECKPOINT_EVERY == 0:
+            self._save_checkpoint()
+        
+        # Update progress more frequently (every 5 URLs)
+        if processed_urls % 5 == 0:
+            # Calculate a progress percentage based on ratio of processed to total known URLs
+            progress = min(int((visited / max(total_known_urls, 1)) * 100), 99)
+            self._queue_status_update(f"Processed {processed_urls} URLs - Unlimited depth crawling", progress)
+    
+    def _save_checkpoint(self):
+        """Write the crawl frontier to the task directory."""
+        # An abandoned crawl's checkpoint would overwrite the new lease holder's
+        if self._cancel_mode == "abandon":
+            return
+        # Another pipeline thread is already writing one; skip this round
+        if not self._checkpoint_lock.acquire(blocking=False):
+            return
+        try:
+            with self._frontier_cond:
+                in_flight = [url for url in self.visited_urls if url not in self.completed_urls]
+                state = {
+                    "start_url": self.start_url,
+                    "completed": list(self.completed_urls),
+                    "in_flight": in_flight,
+                    "requisites": list(self.requisite_queue),
+                    "pages": list(self.queue),
+                    "failed_urls": list(self.failed_urls),
+                    "resources": dict(self.resources),
+                    "file_count": self.file_count
+                }
+            
+            # Write then rename, so a crash never leaves a truncated checkpoint
+            temp_path = self.state_path.with_name(self.state_path.name + '.part')
+            with open(temp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving crawl checkpoint: {e}")
+        finally:
+            self._checkpoint_lock.release()
+    
+    def _load_checkpoint(self):
+        """
+        Restore the frontier from a previous attempt at this crawl.
+        
+        URLs that were in flight when the last worker died are fetched again
+        first. Returns False if there is no usable checkpoint.
+        """
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Ignoring unreadable crawl checkpoint: {e}")
+            return False
+        
+        if state.get("start_url") != self.start_url:
+            return False
+        
+        with self._frontier_cond:
+            self.completed_urls = set(state["completed"])
+            self.visited_urls = set(self.completed_urls)
+            self.requisite_queue = deque(state["in_flight"] + state["requisites"])
+            self.queue = deque(state["pages"])
+            self.queued_urls = self.completed_urls | set(self.requisite_queue) | set(self.queue)
+            self.failed_urls = list(state["failed_urls"])
+            self.resources.update(state["resources"])
+            self.file_count = state["file_count"]
+            self.processed_count = len(self.completed_urls)
+            self.stats["total_urls"] = len(self.queued_urls)
+            self.stats["processed_urls"] = self.processed_count
+            self.stats["failed_urls"] = len(self.failed_urls)
+        
+        logger.info(f"Resuming crawl of {self.start_url}: {len(self.completed_urls)} done, "
+                    f"{self._pending_count()} pending")
+        return True
     
     def _status_updater(self):
         """Thread to handle emitting status updates."""
@@ -150,6 +567,10 @@ class WebCrawler:
             try:
                 if not self.message_queue.empty():
                     message, progress = self.message_queue.get(timeout=0.1)
+                    if self._cancel_mode == "abandon":
+                        # The new lease holder reports this task's progress
+                        self.message_queue.task_done()
+                        continue
                     try:
                         self.socketio.emit('status_update', {
                             'task_id': self.task_id,
@@ -159,6 +580,11 @@ class WebCrawler:
                         }, namespace='/')
                     except Exception as emit_error:
                         logger.error(f"Socket emit error: {emit_error}")
+                    if self.progress_callback:
+                        try:
+                            self.progress_callback(message, progress, self.stats)
+                        except Exception as callback_error:
+                            logger.error(f"Progress callback error: {callback_error}")
                     self.message_queue.task_done()
                 else:
                     time.sleep(0.1)
@@ -178,202 +604,257 @@ class WebCrawler:
     def _create_directory_structure(self):
         """Create necessary directory structure for the site."""
         # Create directories for assets
-        (self.task_dir / "css").mkdir(exist_ok=True)
-        (self.task_dir / "js").mkdir(exist_ok=True)
-        (self.task_dir / "images").mkdir(exist_ok=True)
-        (self.task_dir / "fonts").mkdir(exist_ok=True)
+        for directory in RESOURCE_DIRS.values():
+            (self.task_dir / directory).mkdir(exist_ok=True)
+    
+    def _get_session(self):
+        """Return this thread's requests session, creating it on first use."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({
+                'User-Agent': 'Mozilla/5.0 (compatible; WebSiteToZip/1.0; +http://websitetozip.com)'
+            })
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+    
+    def _close_sessions(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
     
-    def _process_url(self, url):
-        """Process a single URL: download, parse, extract links."""
+    def _fetch_stage(self, item):
+        """Download a URL into a spooled temporary file."""
+        if self._stop_event.is_set():
+            return None
+        
+        url = item.url
         logger.debug(f"Processing URL: {url}")
         self._queue_status_update(f"Processing: {url}", 
-                                 int(self.processed_count / max(1, len(self.visited_urls) + len(self.queue)) * 100))
+                                 int(self.processed_count / max(1, len(self.visited_urls) + self._pending_count()) * 100))
         
-        try:
-            # Download the content
-            response = self.session.get(url, timeout=15)
-            response.raise_for_status()
-            
-            # Determine content type
-            content_type = response.headers.get('Content-Type', '').lower()
-            
-            # Process based on content type
-            if 'text/html' in content_type:
-                self._process_html(url, response.text)
-            elif 'text/css' in content_type:
-                self._save_css(url, response.content)
-            elif 'javascript' in content_type or 'text/js' in content_type:
-                self._save_javascript(url, response.content)
-            elif 'image/' in content_type:
-                self._save_image(url, response.content)
-            elif 'font/' in content_type or '.woff' in url or '.ttf' in url:
-                self._save_font(url, response.content)
-            else:
-                self._save_other_resource(url, response.content)
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching {url}: {e}")
-            self.failed_urls.append(url)
-            self.stats["failed_urls"] += 1
-    
-    def _process_html(self, url, html_content):
-        """Process HTML content, extract links, and save the file."""
-        try:
-            # Parse HTML
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Get relative path for this HTML file
-            relative_path = self._get_relative_path(url)
-            
-            # Process and update links
-            self._process_links(soup, url)
-            
-            # Save the modified HTML
-            self._save_html(relative_path, str(soup))
-            
-            self.resources["html"] += 1
-            
-        except Exception as e:
-            logger.error(f"Error processing HTML {url}: {e}")
-            self.failed_urls.append(url)
-            self.stats["failed_urls"] += 1
-    
-    def _process_links(self, soup, base_url):
-        """Process all links in an HTML document and update them."""
-        # Process <a> links
-        for a_tag in soup.find_all('a', href=True):
-            self._process_a_tag(a_tag, base_url)
-        
-        # Process <link> tags (CSS, etc.)
-        for link_tag in soup.find_all('link', href=True):
-            self._process_resource_link(link_tag, 'href', base_url)
-        
-        # Process <script> tags
-        for script_tag in soup.find_all('script', src=True):
-            self._process_resource_link(script_tag, 'src', base_url)
-        
-        # Process <img> tags
-        for img_tag in soup.find_all('img', src=True):
-            self._process_resource_link(img_tag, 'src', base_url)
-        
-        # Process <source> tags (for <picture>, <audio>, <video>)
-        for source_tag in soup.find_all('source', src=True):
-            self._process_resource_link(source_tag, 'src', base_url)
-        
-        # Process srcset attributes
-        for tag in soup.find_all(srcset=True):
-            self._process_srcset(tag, base_url)
-        
-        # Process CSS background images in style attributes
-        for tag in soup.find_all(style=True):
-            self._process_inline_style(tag, base_url)
-    
-    def _process_a_tag(self, a_tag, base_url):
-        """Process an <a> tag and update its href."""
-        href = a_tag['href']
-        
-        # Skip empty, anchor-only, and external links
-        if not href or href.startswith('#') or href.startswith('javascript:'):
-            return
+        with self.scheduler.connection(self.task_id):
+            with self._get_session().get(url, timeout=15, stream=True) as response:
+                with self._lock:
+                    self._responses.add(response)
+                try:
+                    response.raise_for_status()
+                    item.content_type = response.headers.get('Content-Type', '').lower()
+                    
+                    # Small bodies stay in memory, large ones spill to disk
+                    item.body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+                    for chunk in response.iter_content(chunk_size=HTML_CHUNK_BYTES):
+                        if self._cancel_mode:
+                            return None
+                        item.body.write(chunk)
+                    item.body.seek(0)
+                finally:
+                    with self._lock:
+                        self._responses.discard(response)
         
-        # Create absolute URL
-        absolute_url = urljoin(base_url, href)
-        absolute_url, _ = urldefrag(absolute_url)
+        # Throttle requests with shorter delay for faster completion
+        if self.throttle_delay:
+            time.sleep(self.throttle_delay)
+        return item
+    
+    def _classify_stage(self, item):
+        """Work out what kind of resource an item is and where it is saved."""
+        url = item.url
+        content_type = item.content_type
         
-        # Check if the URL is from the same domain
-        parsed_url = urlparse(absolute_url)
-        if parsed_url.netloc != self.base_domain:
-            return
+        # Determine resource kind from the content type
+        if 'text/html' in content_type:
+            item.kind = 'html'
+        elif 'text/css' in content_type:
+            item.kind = 'css'
+        elif 'javascript' in content_type or 'text/js' in content_type:
+            item.kind = 'js'
+        elif 'image/' in content_type:
+            item.kind = 'images'
+        elif 'font/' in content_type or '.woff' in url or '.ttf' in url:
+            item.kind = 'fonts'
+        else:
+            item.kind = 'other'
         
-        # Add to queue if not visited
-        if absolute_url not in self.visited_urls and absolute_url not in self.queue:
-            self.queue.append(absolute_url)
-            self.stats["total_urls"] += 1
+        # Stored where links to the URL were rewritten to point
+        item.relative_path = self._local_path(url)
+        return item
+    
+    def _transform_stage(self, item):
+        """Rewrite links in HTML and CSS; other resources pass through untouched."""
+        if self._cancel_mode:
+            return None
+        if item.kind == 'html':
+            rewritten, item.title = self._rewrite_html(item.url, item.body, item.content_type, item.relative_path)
+        elif item.kind == 'css':
+            # Queue backgrounds, fonts and imported stylesheets as requisites
+            url, document = item.url, item.relative_path
+            content = rewrite_css(item.body.read(), lambda ref: self._rewrite_resource_link(ref, url, document))
+            rewritten = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+            rewritten.write(content)
+            rewritten.seek(0)
+        else:
+            return item
         
-        # Update href to relative path
-        a_tag['href'] = self._get_relative_link_path(absolute_url)
+        item.close()
+        item.body = rewritten
+        return item
     
-    def _process_resource_link(self, tag, attr, base_url):
-        """Process a resource link (CSS, JS, images) and update its attribute."""
-        resource_url = tag[attr]
+    def _store_stage(self, item):
+        """Write an item's body to its file in the task directory."""
+        if self._cancel_mode:
+            return None
+        file_path = self.task_dir / item.relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Skip empty, data URLs, and absolute URLs from different domains
-        if not resource_url or resource_url.startswith('data:'):
-            return
+        # Only complete files ever appear under their final name. The part
+        # name is this crawler's own, as a crawler that lost its lease may
+        # still be writing next to the new holder
+        part_path = file_path.with_name(f"{file_path.name}.{id(self):x}.part")
+        digest = hashlib.sha256()
+        size = 0
+        with open(part_path, 'wb') as f:
+            for chunk in iter(lambda: item.body.read(HTML_CHUNK_BYTES), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        if self._cancel_mode:
+            # Cut off mid-write; an abandoned crawl must not replace the new holder's file
+            part_path.unlink(missing_ok=True)
+            return None
+        os.replace(part_path, file_path)
         
-        # Create absolute URL
-        absolute_url = urljoin(base_url, resource_url)
+        self.manifest.add(item.relative_path, item.url, size, item.content_type or None,
+                          digest.hexdigest(), clean_title(item.title), item.kind)
+        with self._lock:
+            self.file_count += 1
+            self.resources[item.kind] += 1
+            self.stats["bytes_downloaded"] += size
+        return None
+    
+    def _rewrite_html(self, url, body, content_type, document):
+        """
+        Stream an HTML body through the link rewriter into a new spooled file.
         
-        # Check if the URL is from the same domain
-        parsed_url = urlparse(absolute_url)
-        if parsed_url.netloc and parsed_url.netloc != self.base_domain:
-            return
+        The page is never held in memory as a whole: chunks are decoded
+        incrementally, rewritten token by token and written straight out.
+        Links are made relative to document, where the page is stored.
+        Returns the rewritten file and the page's title.
+        """
+        # Read just enough of the body to work out its encoding
+        head = body.read(HTML_CHUNK_BYTES)
+        encoding = sniff_html_encoding(content_type, head)
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
         
-        # Add to queue if not visited
-        if absolute_url not in self.visited_urls and absolute_url not in self.queue:
-            self.queue.append(absolute_url)
-            self.stats["total_urls"] += 1
+        # Write in the source encoding so any <meta charset> stays truthful
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        writer = io.TextIOWrapper(output, encoding=encoding, errors='xmlcharrefreplace', newline='')
+        rewriter = HTMLRewriter(
+            writer,
+            lambda href: self._rewrite_page_link(href, url, document),
+            lambda src: self._rewrite_resource_link(src, url, document)
+        )
+        rewriter.feed(decoder.decode(head))
+        for chunk in iter(lambda: body.read(HTML_CHUNK_BYTES), b''):
+            rewriter.feed(decoder.decode(chunk))
+        rewriter.feed(decoder.decode(b'', final=True))
+        rewriter.close()
         
-        # Update attribute to relative path
-        tag[attr] = self._get_relative_link_path(absolute_url)
+        writer.flush()
+        writer.detach()
+        output.seek(0)
+        return output, rewriter.title
     
-    def _process_srcset(self, tag, base_url):
-        """Process srcset attribute in image tags."""
-        srcset = tag['srcset']
-        srcset_parts = srcset.split(',')
-        new_srcset_parts = []
-        
-        for part in srcset_parts:
-            # Split into URL and size descriptor
-            part = part.strip()
-            if not part:
-                continue
-                
-            url_size = part.split(' ', 1)
-            url = url_size[0].strip()
-            size = url_size[1] if len(url_size) > 1 else ''
-            
-            # Process the URL
-            absolute_url = urljoin(base_url, url)
+    def _enqueue(self, absolute_url, requisite=False):
+        """Add a URL to the crawl queue if it has not been seen yet."""
+        with self._frontier_cond:
+            if absolute_url in self.visited_urls or absolute_url in self.queued_urls:
+                return
             
-            # Add to queue if not visited
-            if absolute_url not in self.visited_urls and absolute_url not in self.queue:
+            self.queued_urls.add(absolute_url)
+            if requisite:
+                self.requisite_queue.append(absolute_url)
+            else:
                 self.queue.append(absolute_url)
-                self.stats["total_urls"] += 1
-            
-            # Create new srcset entry
-            relative_url = self._get_relative_link_path(absolute_url)
-            new_srcset_parts.append(f"{relative_url} {size}".strip())
+            self.stats["total_urls"] += 1
+            self._frontier_cond.notify()
+    
+    def _pending_count(self):
+        """Number of URLs waiting in the crawl queues."""
+        return len(self.requisite_queue) + len(self.queue)
+    
+    def _rewrite_page_link(self, href, base_url, document):
+        """Queue a link to another page and return its href from document."""
+        resolved = self._resolve_link(self._resolution_base(base_url, href), href, True)
+        if resolved is None:
+            return None
         
-        # Update the srcset attribute
-        tag['srcset'] = ', '.join(new_srcset_parts)
+        absolute_url, local_path, fragment = resolved
+        self._enqueue(absolute_url)
+        return relative_link(local_path, document) + fragment
     
-    def _process_inline_style(self, tag, base_url):
-        """Process CSS URLs in inline style attributes."""
-        style = tag['style']
+    def _rewrite_resource_link(self, resource_url, base_url, document):
+        """Queue a page requisite (CSS, JS, images) and return its URL from document."""
+        resolved = self._resolve_link(self._resolution_base(base_url, resource_url), resource_url, False)
+        if resolved is None:
+            return None
         
-        # Find all url(...) patterns
-        for url_match in re.finditer(r'url\s*\(\s*[\'"]?([^\'")]+)[\'"]?\s*\)', style):
-            resource_url = url_match.group(1)
-            
-            # Skip data URLs
-            if resource_url.startswith('data:'):
-                continue
-            
-            # Create absolute URL
-            absolute_url = urljoin(base_url, resource_url)
-            
-            # Add to queue if not visited
-            if absolute_url not in self.visited_urls and absolute_url not in self.queue:
-                self.queue.append(absolute_url)
-                self.stats["total_urls"] += 1
-            
-            # Update URL in style
-            relative_url = self._get_relative_link_path(absolute_url)
-            style = style.replace(url_match.group(1), relative_url)
+        absolute_url, local_path, fragment = resolved
+        self._enqueue(absolute_url, requisite=True)
+        return relative_link(local_path, document) + fragment
+    
+    @staticmethod
+    def _resolution_base(base_url, href):
+        """Return the cache key base for resolving href against base_url."""
+        # Query- and fragment-only references depend on the full page URL
+        if href.startswith('?') or href.startswith('#'):
+            return base_url
+        # Root-relative links resolve the same from every page on the host
+        if href.startswith('/') and not href.startswith('//'):
+            return url_origin(base_url)
+        return url_directory(base_url)
+    
+    def _resolve_link_uncached(self, base, href, is_page):
+        """
+        Resolve an href to its canonical absolute URL and where it is stored.
+        
+        Returns an (absolute_url, local_path, fragment) tuple, where fragment
+        is '' or the href's '#...' part, or None if the link should be left
+        alone. Called through the per-crawler LRU cache.
+        """
+        if is_page:
+            # Skip empty, anchor-only, and javascript links
+            if not href or href.startswith('#') or href.startswith('javascript:'):
+                return None
+        else:
+            # Skip empty and data URLs
+            if not href or href.startswith('data:'):
+                return None
+        
+        # Create absolute URL
+        absolute_url, fragment = urldefrag(urljoin(base, href))
+        
+        # Leave links to other domains and schemes pointing at the original
+        parsed_url = urlparse(absolute_url)
+        if parsed_url.scheme not in ('http', 'https') or parsed_url.netloc != self.base_domain:
+            return None
         
-        # Update the style attribute
-        tag['style'] = style
+        return absolute_url, self._local_path(absolute_url), '#' + fragment if fragment else ''
+    
+    def get_resolve_cache_stats(self):
+        """Hit-rate statistics for the link resolution cache."""
+        info = self._resolve_link.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hit_rate": round(info.hits / lookups, 3) if lookups else 0.0
+        }
     
     def _get_relative_path(self, url):
         """Get the relative file system path for a URL."""
@@ -383,8 +864,11 @@ class WebCrawler:
         if parsed_url.path == '/' or not parsed_url.path:
             return 'index.html'
         
-        # Remove leading and trailing slashes
-        path = parsed_url.path.strip('/')
+        # Collapse dot segments, which can't climb above the root, then
+        # remove leading and trailing slashes
+        path = posixpath.normpath(parsed_url.path).strip('/')
+        if not path:
+            return 'index.html'
         
         # Handle file extensions
         if path.endswith('/') or '.' not in path.split('/')[-1]:
@@ -396,164 +880,33 @@ class WebCrawler:
         
         return path
     
-    def _get_relative_link_path(self, url):
-        """Get the relative link path for internal navigation."""
-        parsed_url = urlparse(url)
-        
-        # Handle external URLs
-        if parsed_url.netloc != self.base_domain:
-            return url  # Keep external URLs as is
-        
-        # Remove query string and fragment
-        path = parsed_url.path
-        
-        # Handle root URL
-        if path == '/' or not path:
-            return '/'
-        
-        # Handle directory-like URLs
-        if path.endswith('/'):
-            return path
+    def _local_path(self, url):
+        """
+        Where a URL of the crawled site is stored, relative to the task directory.
         
-        # Check file extension
-        if '.' not in path.split('/')[-1]:
-            # No file extension, assume it's a directory
-            return path + '/'
-        
-        return path
+        Depends on the URL alone, so links rewritten before their target is
+        fetched point where it will be saved. Stylesheets, scripts, images and
+        fonts go to their resource directory; everything else mirrors the
+        URL's path.
+        """
+        kind = classify_path(urlparse(url).path)
+        if kind in RESOURCE_DIRS:
+            return f"{RESOURCE_DIRS[kind]}/{self._get_resource_filename(url)}"
+        return self._get_relative_path(url)
     
-    def _save_html(self, relative_path, content):
-        """Save HTML content to file."""
-        try:
-            # Create directory if needed
-            file_path = self.task_dir / relative_path
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Save the file
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            self.file_count += 1
-            
-        except Exception as e:
-            logger.error(f"Error saving HTML file {relative_path}: {e}")
-    
-    def _save_css(self, url, content):
-        """Save CSS content to file."""
-        try:
-            # Get the file name from the URL
-            filename = self._get_resource_filename(url, 'css')
-            file_path = self.task_dir / 'css' / filename
-            
-            # Save the file
-            with open(file_path, 'wb') as f:
-                f.write(content)
-            
-            self.file_count += 1
-            self.resources["css"] += 1
-            
-        except Exception as e:
-            logger.error(f"Error saving CSS file {url}: {e}")
-    
-    def _save_javascript(self, url, content):
-        """Save JavaScript content to file."""
-        try:
-            # Get the file name from the URL
-            filename = self._get_resource_filename(url, 'js')
-            file_path = self.task_dir / 'js' / filename
-            
-            # Save the file
-            with open(file_path, 'wb') as f:
-                f.write(content)
-            
-            self.file_count += 1
-            self.resources["js"] += 1
-            
-        except Exception as e:
-            logger.error(f"Error saving JavaScript file {url}: {e}")
-    
-    def _save_image(self, url, content):
-        """Save image content to file."""
-        try:
-            # Get the file name from the URL
-            filename = self._get_resource_filename(url, 'img')
-            file_path = self.task_dir / 'images' / filename
-            
-            # Save the file
-            with open(file_path, 'wb') as f:
-                f.write(content)
-            
-            self.file_count += 1
-            self.resources["images"] += 1
-            
-        except Exception as e:
-            logger.error(f"Error saving image file {url}: {e}")
-    
-    def _save_font(self, url, content):
-        """Save font content to file."""
-        try:
-            # Get the file name from the URL
-            filename = self._get_resource_filename(url, 'font')
-            file_path = self.task_dir / 'fonts' / filename
-            
-            # Save the file
-            with open(file_path, 'wb') as f:
-                f.write(content)
-            
-            self.file_count += 1
-            self.resources["fonts"] += 1
-            
-        except Exception as e:
-            logger.error(f"Error saving font file {url}: {e}")
-    
-    def _save_other_resource(self, url, content):
-        """Save other resource content to file."""
-        try:
-            # Get the file name from the URL
-            relative_path = self._get_relative_path(url)
-            file_path = self.task_dir / relative_path
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Save the file
-            with open(file_path, 'wb') as f:
-                f.write(content)
-            
-            self.file_count += 1
-            self.resources["other"] += 1
-            
-        except Exception as e:
-            logger.error(f"Error saving resource file {url}: {e}")
-    
-    def _get_resource_filename(self, url, resource_type):
-        """Generate a filename for a resource based on its URL."""
-        parsed_url = urlparse(url)
-        path = parsed_url.path
-        
-        # Extract filename from path
-        filename = path.split('/')[-1]
-        
-        # If no filename, generate a unique one
-        if not filename:
-            filename = f"{resource_type}_{str(uuid.uuid4())[:8]}"
+    def _get_resource_filename(self, url):
+        """
+        Generate a filename for a resource based on its URL.
         
-        # Ensure file has appropriate extension
-        extensions = {
-            'css': '.css',
-            'js': '.js',
-            'img': '.jpg',  # Default, actual extension should come from URL
-            'font': '.woff'  # Default, actual extension should come from URL
-        }
-        
-        # Add a random number to ensure uniqueness
-        random_suffix = str(random.randint(1000, 9999))
-        
-        # Keep original extension if present
-        if '.' in filename:
-            safe_filename = re.sub(r'[^a-zA-Z0-9._-]', '_', f"{filename}_{random_suffix}")
-            return safe_filename[:100]  # Limit length
-        else:
-            safe_filename = re.sub(r'[^a-zA-Z0-9._-]', '_', f"{filename}_{random_suffix}" + extensions.get(resource_type, ''))
-            return safe_filename[:100]  # Limit length
+        A hash of the whole URL, query included, keeps resources with the same
+        name apart; the extension is kept last so the file's type is still
+        recognisable.
+        """
+        stem, extension = posixpath.splitext(posixpath.basename(urlparse(url).path))
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+        stem = re.sub(r'[^a-zA-Z0-9._-]', '_', stem)[:80]
+        extension = re.sub(r'[^a-zA-Z0-9._-]', '_', extension)[:10]
+        return f"{stem}-{digest}{extension}"
     
     def _create_redirects_file(self):
         """Create _redirects file for Netlify."""
@@ -565,9 +918,8 @@ class WebCrawler:
     
     def _create_zip_file(self):
         """Create a ZIP file of the crawled content."""
-        domain_name = self.base_domain.replace('.', '_')
-        zip_filename = f"{domain_name}_{int(time.time())}.zip"
-        self.zip_path = os.path.join("temp", zip_filename)
+        self.zip_path = new_archive_path(self.base_domain, self.task_id)
+        zip_filename = os.path.basename(self.zip_path)
         
         # Make sure any previously existing file with the same name is removed
         if os.path.exists(self.zip_path):
@@ -577,18 +929,13 @@ class WebCrawler:
                 logger.error(f"Error removing existing zip file: {e}")
         
         try:
-            with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # Add the netlify _redirects file
-                redirect_path = os.path.join(self.task_dir, "_redirects")
-                if os.path.exists(redirect_path):
-                    zipf.write(redirect_path, "_redirects")
-                
-                # Add all other files from the task directory
-                for root, _, files in os.walk(self.task_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, self.task_dir)
-                        zipf.write(file_path, arcname)
+            # The manifest lists exactly the files stored, so crawl
+            # bookkeeping and files cut off mid-write never get in
+            extra_files = {}
+            redirect_path = os.path.join(self.task_dir, "_redirects")
+            if os.path.exists(redirect_path):
+                extra_files["_redirects"] = redirect_path
+            write_archive(self.zip_path, self.task_dir, read_manifest(self.task_id) or [], extra_files)
             
             # Debug log: Show zip file was created and its size
             if os.path.exists(self.zip_path):
@@ -611,6 +958,11 @@ class WebCrawler:
     
     def get_stats(self):
         """Get crawling statistics."""
+        self.stats["resolve_cache"] = self.get_resolve_cache_stats()
+        self.stats["pipeline"] = self.pipeline.get_stats()
+        fetch_queue = self.scheduler.get_flow_stats(self.task_id)
+        if fetch_queue is not None:
+            self.stats["fetch_queue"] = fetch_queue
         return self.stats
     
     def get_zip_path(self):
@@ -619,45 +971,69 @@ class WebCrawler:
     
     def get_preview_data(self):
         """Get data for preview of crawled content."""
-        # Return information about crawled pages
-        preview_data = {
-            "pages": [],
-            "resources": self.resources,
-            "total_files": self.file_count
-        }
-        
-        # Get a sample of HTML files for preview
-        html_files = list(self.task_dir.glob('**/*.html'))
-        for html_file in html_files[:10]:  # Limit to first 10 files
-            try:
-                with open(html_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Extract title
-                title_match = re.search(r'<title>(.*?)</title>', content, re.IGNORECASE | re.DOTALL)
-                title = title_match.group(1) if title_match else "No title"
-                
-                preview_data["pages"].append({
-                    "path": str(html_file.relative_to(self.task_dir)),
-                    "title": title
-                })
-            except Exception as e:
-                logger.error(f"Error reading HTML file for preview: {e}")
-        
-        return preview_data
+        return build_preview_data(self.task_dir, self.resources, self.file_count)
     
     def cleanup(self):
         """Clean up task files."""
+        return cleanup_task_files(self.task_dir, self.zip_path)
+
+
+def build_preview_data(task_dir, resources, total_files):
+    """
+    Get data for preview of a crawl's output directory.
+    
+    Works from the directory alone, so any process sharing the disk can
+    build a preview without the WebCrawler that produced it. Reads the
+    crawl's manifest where there is one, and only scans the directory for
+    crawls that predate manifests.
+    """
+    task_dir = Path(task_dir)
+    entries = read_manifest(task_dir.name)
+    if entries is not None:
+        return preview_from_manifest(entries, limit=10)
+    
+    # Return information about crawled pages
+    preview_data = {
+        "pages": [],
+        "resources": resources,
+        "total_files": total_files
+    }
+    
+    # Get a sample of HTML files for preview
+    html_files = list(task_dir.glob('**/*.html'))
+    for html_file in html_files[:10]:  # Limit to first 10 files
         try:
-            # Remove the task directory
-            if self.task_dir.exists():
-                shutil.rmtree(self.task_dir)
+            with open(html_file, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read()
             
-            # Remove ZIP file if it exists
-            if self.zip_path and os.path.exists(self.zip_path):
-                os.remove(self.zip_path)
+            # Extract title
+            title_match = re.search(r'<title>(.*?)</title>', content, re.IGNORECASE | re.DOTALL)
+            title = title_match.group(1) if title_match else "No title"
             
-            return True
+            preview_data["pages"].append({
+                "path": str(html_file.relative_to(task_dir)),
+                "title": title
+            })
         except Exception as e:
-            logger.error(f"Cleanup error: {e}")
-            return False
+            logger.error(f"Error reading HTML file for preview: {e}")
+    
+    return preview_data
+
+
+def cleanup_task_files(task_dir, zip_path):
+    """Remove a crawl's output directory, manifest and ZIP file."""
+    try:
+        remove_manifest(Path(task_dir).name)
+        
+        # Remove the task directory
+        if Path(task_dir).exists():
+            shutil.rmtree(task_dir)
+        
+        # Remove ZIP file if it exists
+        if zip_path and os.path.exists(zip_path):
+            os.remove(zip_path)
+        
+        return True
+    except Exception as e:
+        logger.error(f"Cleanup error: {e}")
+        return False
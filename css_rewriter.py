@@ -0,0 +1,73 @@
+import re
+
+# One alternation so a stylesheet is tokenized in a single regex pass.
+# Comments and plain strings are matched only so they can be skipped over;
+# @import "..." and url(...) are the references we rewrite. The lookahead
+# lets the scanner reject most positions on their first character.
+_CSS_TOKEN_PATTERN = r'''
+    (?=[/@uU"'])
+    (?:
+    (?P<comment>/\*.*?\*/)
+  | @import\s+(?P<import_quote>["'])(?P<import>[^"'\n]*)(?P=import_quote)
+  | url\(\s*(?:
+        "(?P<url_dq>[^"\n]*)"
+      | '(?P<url_sq>[^'\n]*)'
+      | (?P<url_bare>[^"'()\s]*)
+    )\s*\)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    )
+'''
+
+_CSS_TOKEN_RE = re.compile(_CSS_TOKEN_PATTERN, re.IGNORECASE | re.DOTALL | re.VERBOSE)
+_CSS_TOKEN_RE_BYTES = re.compile(_CSS_TOKEN_PATTERN.encode('ascii'), re.IGNORECASE | re.DOTALL | re.VERBOSE)
+
+_URL_GROUPS = ('import', 'url_dq', 'url_sq', 'url_bare')
+
+
+def rewrite_css(css, rewrite):
+    """
+    Rewrite every url(...) and @import reference in a CSS document.
+
+    Works on str or bytes. Bytes are never decoded as a whole: only the
+    references themselves are, which is safe for any ASCII-compatible
+    encoding. Quoting is preserved.
+
+    Args:
+        css (str or bytes): The stylesheet or fragment
+        rewrite (callable): Called with each referenced URL (str); returns the
+            replacement URL, or None to leave the reference untouched
+
+    Returns:
+        The rewritten CSS, of the same type as the input
+    """
+    is_bytes = isinstance(css, (bytes, bytearray))
+    token_re = _CSS_TOKEN_RE_BYTES if is_bytes else _CSS_TOKEN_RE
+
+    def replace(match):
+        for group in _URL_GROUPS:
+            start, end = match.span(group)
+            if start != -1:
+                break
+        else:
+            # Comment or string, nothing to rewrite
+            return match.group(0)
+
+        url = match.group(group)
+        if is_bytes:
+            url = url.decode('utf-8', 'surrogateescape')
+        url = url.strip()
+        if not url:
+            return match.group(0)
+
+        new_url = rewrite(url)
+        if new_url is None or new_url == url:
+            return match.group(0)
+        if is_bytes:
+            new_url = new_url.encode('utf-8', 'surrogateescape')
+
+        offset = match.start(0)
+        text = match.group(0)
+        return text[:start - offset] + new_url + text[end - offset:]
+
+    return token_re.sub(replace, css)
+
@@ -1,29 +1,32 @@
-from flask import Flask, send_file, jsonify
+from flask import Flask, jsonify, request
 import os
-import glob
+
+from artifacts import bind_database, get_artifact, list_artifacts, listing_args
+from file_delivery import send_archive
 
 app = Flask(__name__)
+bind_database(app)
 
 @app.route('/api/zip-files')
 def list_files():
-    """List all ZIP files in the current directory."""
+    """List ZIP files from the artifact registry, newest first; page with limit and before."""
     try:
-        # Get a list of all ZIP files in the current directory
-        zip_files = glob.glob('*.zip')
+        limit, before = listing_args(request.args)
+        listing = list_artifacts(limit, before)
         
         # Get file info
         files = []
-        for zip_file in zip_files:
-            size_bytes = os.path.getsize(zip_file)
-            size_kb = size_bytes / 1024
+        for artifact in listing['artifacts']:
+            size_kb = artifact['size'] / 1024
             files.append({
-                'name': zip_file,
-                'size_bytes': size_bytes,
+                'name': artifact['name'],
+                'url': artifact['url'],
+                'size_bytes': artifact['size'],
                 'size_kb': f"{size_kb:.1f} KB",
-                'date': os.path.getmtime(zip_file)
+                'date': artifact['created_at']
             })
         
-        return jsonify({'files': files})
+        return jsonify({'files': files, 'limit': listing['limit'], 'next_before': listing['next_before']})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -33,11 +36,12 @@ def download_file(filename):
     if not filename.endswith('.zip'):
         return jsonify({'error': 'Only ZIP files can be downloaded'}), 400
     
-    file_path = os.path.join(os.getcwd(), filename)
+    # Only registered archives are served, by name, wherever they are kept
+    artifact = get_artifact(filename)
     
-    if os.path.exists(file_path):
+    if artifact is not None and os.path.exists(artifact.path):
         try:
-            return send_file(file_path, as_attachment=True)
+            return send_archive(artifact.path)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     else:
@@ -1,33 +1,37 @@
-from flask import Flask, send_file, render_template
+from flask import Flask, render_template, request
 import os
-import glob
+
+from artifacts import bind_database, get_artifact, list_artifacts, listing_args
+from file_delivery import send_archive
 
 app = Flask(__name__)
+bind_database(app)
 
 @app.route('/')
 def index():
-    # Get a list of all ZIP files in the current directory
-    zip_files = glob.glob('*.zip')
-    # Sort by modification time (newest first)
-    zip_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
+    # One page of the artifact registry, newest first
+    limit, before = listing_args(request.args)
+    listing = list_artifacts(limit, before)
     
     # Create a list of file information
     files = []
-    for zip_file in zip_files:
-        size_kb = os.path.getsize(zip_file) / 1024
+    for artifact in listing['artifacts']:
+        size_kb = artifact['size'] / 1024
         files.append({
-            'name': zip_file,
+            'name': artifact['name'],
             'size': f"{size_kb:.1f} KB",
-            'date': os.path.getmtime(zip_file)
+            'date': artifact['created_at']
         })
     
-    return render_template('download.html', files=files)
+    return render_template('download.html', files=files, limit=listing['limit'],
+                           next_before=listing['next_before'])
 
 @app.route('/download/<filename>')
 def download(filename):
-    # Check if the file exists
-    if os.path.exists(filename):
-        return send_file(filename, as_attachment=True)
+    # Only registered archives are served
+    artifact = get_artifact(filename)
+    if artifact is not None and os.path.exists(artifact.path):
+        return send_archive(artifact.path)
     else:
         return "File not found", 404
 
@@ -78,6 +82,9 @@ if __name__ == '__main__':
                     </div>
                 {% endfor %}
             </div>
+            {% if next_before %}
+                <a href="?before={{ next_before }}&limit={{ limit }}" class="btn btn-secondary mt-3">Older downloads</a>
+            {% endif %}
         {% else %}
             <div class="alert alert-info">
                 No ZIP files available for download.
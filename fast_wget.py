@@ -1,141 +1,106 @@
 #!/usr/bin/env python3
 import os
 import sys
-import subprocess
 import logging
 import time
 import urllib.parse
-import zipfile
 import shutil
 from pathlib import Path
 import uuid
 
+from wget_backend import mirror, get_wget, manifest_recorder
+from manifest import ManifestWriter, record_tree, manifest_urls, write_archive
+from artifacts import new_archive_path
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def crawl_with_wget_sync(url):
+def crawl_with_wget_sync(url, progress_callback=None, task_id=None, build_archive=True, cancel=None):
     """
     Uses wget to crawl a website and returns the path to the ZIP file.
     This is a synchronous version that blocks until completion.
     
     Args:
         url (str): The URL to crawl
+        progress_callback (callable): Called with running stats while wget works
+        task_id (str): Task to record the manifest for; a new ID by default
+        build_archive (bool): If False, keep the downloaded files instead of
+            zipping them, for streaming downloads
+        cancel (Cancellation): Stops wget; with finalize, what was saved is
+            still archived, otherwise None is returned
         
     Returns:
-        str: Path to the ZIP file or None if failed
+        str: Path to the ZIP file, or to the downloaded files when
+        build_archive is False, or None if failed
     """
     try:
-        # First, check if wget is available
-        try:
-            # Check multiple possible wget locations
-            wget_locations = ['wget', '/nix/store/*/bin/wget', '/usr/bin/wget', '/bin/wget']
-            wget_found = False
-            wget_path = None
-            
-            for location in wget_locations:
-                try:
-                    if '*' in location:
-                        # Handle wildcard paths
-                        import glob
-                        matches = glob.glob(location)
-                        for match in matches:
-                            if os.path.exists(match) and os.access(match, os.X_OK):
-                                wget_path = match
-                                wget_found = True
-                                break
-                    else:
-                        # Direct path check
-                        result = subprocess.run(['which', location], capture_output=True, text=True)
-                        if result.returncode == 0:
-                            wget_path = result.stdout.strip()
-                            wget_found = True
-                            break
-                except Exception:
-                    continue
-            
-            if not wget_found:
-                logger.error("wget is not available on this system")
-                logger.error(f"Checked locations: {wget_locations}")
-                logger.error(f"PATH: {os.environ.get('PATH', 'Not set')}")
-                return None
-            
-            logger.info(f"wget found at: {wget_path}")
-        except Exception as e:
-            logger.error(f"Error checking wget availability: {e}")
+        # wget is probed once per process; fail fast if there is none
+        if get_wget() is None:
+            logger.error("wget is not available on this system")
             return None
         
         # Parse URL to get domain for ZIP file naming
         parsed_url = urllib.parse.urlparse(url)
         domain = parsed_url.netloc
         
-        # Create a unique task ID and temporary directory
-        task_id = str(uuid.uuid4())
+        # Create a unique task ID and temporary directory. A caller that
+        # passes its own task ID owns the directory and removes it itself.
+        owns_temp_dir = task_id is None
+        task_id = task_id or str(uuid.uuid4())
         temp_dir = Path("temp") / task_id
         temp_dir.mkdir(parents=True, exist_ok=True)
         
         logger.info(f"Starting wget crawl for {url} in {temp_dir}")
         
-        # Build wget command for fast, complete website downloading
-        # Use system wget (installed via apt-get in Docker)
-        wget_cmd = '/usr/bin/wget'
-        
-        cmd = [
-            wget_cmd,
-            '--mirror',               # Mirror the website
-            '--convert-links',        # Convert links to work locally
-            '--adjust-extension',     # Add extensions to files (.html)
-            '--page-requisites',      # Get all assets (CSS, JS, images)
-            '--no-parent',            # Don't go to parent directory
-            '--directory-prefix=' + str(temp_dir),  # Output directory
-            '--no-verbose',           # Reduce output verbosity
+        # Give up on slow servers rather than hang the job
+        extra_args = [
             '--timeout=30',           # Add timeout
             '--tries=3',              # Retry failed downloads
-            url
         ]
         
-        logger.info(f"Running wget command: {' '.join(cmd)}")
-        
-        # Execute wget command and wait for completion
-        process = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False  # Don't raise exception on non-zero exit
-        )
-        
-        # Log the full output for debugging
-        logger.info(f"wget stdout: {process.stdout}")
-        logger.info(f"wget stderr: {process.stderr}")
-        logger.info(f"wget return code: {process.returncode}")
+        # Mirror the site and wait for completion, following wget's log as it runs;
+        # files are listed in the manifest as they are saved so snapshots can include them
+        with ManifestWriter(task_id, append=True) as writer:
+            result = mirror(url, temp_dir, extra_args, progress_callback, cancel=cancel,
+                            on_saved=manifest_recorder(writer, temp_dir, domain))
+        returncode = result["returncode"]
+        logger.info(f"wget return code: {returncode}")
+        
+        # A killed wget's return code means nothing; keep a partial archive only if asked
+        cancelled = cancel is not None and cancel.is_set()
+        if cancelled and not cancel.finalize:
+            logger.info(f"wget download of {url} cancelled")
+            return None
         
         # Check if wget was successful or partially successful
         # Return code 8 means some URLs couldn't be downloaded, but the core site was likely downloaded
-        if process.returncode != 0 and process.returncode != 8:
-            logger.error(f"wget failed with return code {process.returncode}: {process.stderr}")
+        if cancelled:
+            logger.info(f"wget download of {url} cancelled; archiving what was saved")
+        elif returncode != 0 and returncode != 8:
+            logger.error(f"wget failed with return code {returncode}: {result['log_tail']}")
             
             # Provide more specific error messages based on return codes
-            if process.returncode == 1:
+            if returncode == 1:
                 error_msg = "Generic error occurred during download. The website might be unavailable or blocked."
-            elif process.returncode == 2:
+            elif returncode == 2:
                 error_msg = "Parse error. The URL format might be invalid."
-            elif process.returncode == 3:
+            elif returncode == 3:
                 error_msg = "File I/O error. Check disk space and permissions."
-            elif process.returncode == 4:
+            elif returncode == 4:
                 error_msg = "Network failure. Check your internet connection."
-            elif process.returncode == 5:
+            elif returncode == 5:
                 error_msg = "SSL verification failed. The website might have certificate issues."
-            elif process.returncode == 6:
+            elif returncode == 6:
                 error_msg = "Username/password authentication failed."
-            elif process.returncode == 7:
+            elif returncode == 7:
                 error_msg = "Protocol error. The website might not support the required protocol."
             else:
-                error_msg = f"wget failed with error code {process.returncode}. Please try a different website."
+                error_msg = f"wget failed with error code {returncode}. Please try a different website."
             
             logger.error(f"Specific error: {error_msg}")
             return None
-        elif process.returncode == 8:
+        elif returncode == 8:
             # This is a partial success - some URLs were too long or had other issues
             logger.warning(f"wget completed with partial success (code 8). Some URLs may have been skipped.")
             # Continue processing since we likely have most of the content
@@ -152,34 +117,33 @@ def crawl_with_wget_sync(url):
         if not domain_dir.exists():
             domain_dir = temp_dir
         
+        # Record every file once; the archive and its stats come from the manifest
+        entries = record_tree(task_id, domain_dir, manifest_urls(task_id),
+                              skip=("_redirects",))
+        
         # Create _redirects file for Netlify
         redirects_path = domain_dir / "_redirects"
         with open(redirects_path, 'w') as f:
             f.write("/*    /index.html   404\n")
+        
+        if not build_archive:
+            # Downloads zip the files as they are sent; no archive lands on disk
+            logger.info(f"Wget crawl completed for {url}, keeping {len(entries)} files in {domain_dir}")
+            return str(domain_dir)
             
         # Create ZIP file
-        timestamp = int(time.time())
-        zip_filename = f"{domain.replace('.', '_')}_{timestamp}.zip"
-        zip_path = str(Path(".") / zip_filename)  # Save to current directory for easy access
+        zip_path = new_archive_path(domain, task_id)
         
         logger.info(f"Creating ZIP file at {zip_path}")
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # If domain directory exists, archive its contents
-            for root, _, files in os.walk(domain_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, domain_dir)
-                    zipf.write(file_path, arcname)
-        
-        # Count files
-        files_downloaded = sum(1 for _ in zipfile.ZipFile(zip_path, 'r').namelist())
+        files_downloaded = write_archive(zip_path, domain_dir, entries, {"_redirects": redirects_path})
         
         logger.info(f"Wget crawl completed for {url}")
         logger.info(f"Downloaded {files_downloaded} files")
         logger.info(f"ZIP file created at {zip_path}")
         
         # Clean up temp directory
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        if owns_temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
         
         return zip_path
         
@@ -0,0 +1,146 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+# Fetch connections shared by every crawl on every worker process; each process
+# takes an equal share of them (see worker_registry)
+FETCH_CONNECTIONS = int(os.environ.get("FETCH_CONNECTIONS", 8))
+
+
+class _Flow:
+    """Scheduling state for one crawl."""
+
+    __slots__ = ("weight", "last_finish", "waiting", "active", "granted", "total_wait")
+
+    def __init__(self, weight):
+        self.weight = weight
+        self.last_finish = 0.0
+        self.waiting = 0
+        self.active = 0
+        self.granted = 0
+        self.total_wait = 0.0
+
+
+class FetchScheduler:
+    """
+    Shares a budget of concurrent fetch connections between crawls.
+
+    Crawls queue for a connection before every request and are served by
+    weighted fair queuing: each request is tagged with a virtual finish time
+    of max(now, the crawl's previous tag) + 1 / weight, and the smallest tag
+    is served first. A crawl with weight 2 gets twice the connections of one
+    with weight 1 while both are busy, and a crawl that has just started is
+    served straight away instead of waiting behind a big crawl's backlog.
+
+    Args:
+        connections (int): Maximum fetches in flight across all crawls
+    """
+
+    def __init__(self, connections=FETCH_CONNECTIONS):
+        self.connections = max(1, int(connections))
+        self._cond = threading.Condition()
+        self._flows = {}
+        # Heap of (finish tag, sequence, task ID) for fetches waiting on a connection
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._active = 0
+
+    def set_connections(self, connections):
+        """Change the connection budget, waking fetches a bigger one lets through."""
+        with self._cond:
+            self.connections = max(1, int(connections))
+            self._cond.notify_all()
+
+    def register(self, task_id, weight=1.0):
+        """Add a crawl to the schedule with its share weight."""
+        with self._cond:
+            self._flows[task_id] = _Flow(max(float(weight), 0.01))
+
+    def unregister(self, task_id):
+        """Remove a crawl once it has no more fetches to make."""
+        with self._cond:
+            self._flows.pop(task_id, None)
+
+    def acquire(self, task_id):
+        """Wait for this crawl's turn at a fetch connection."""
+        with self._cond:
+            flow = self._flows.get(task_id)
+            if flow is None:
+                flow = self._flows[task_id] = _Flow(1.0)
+
+            finish = max(self._virtual_time, flow.last_finish) + 1.0 / flow.weight
+            flow.last_finish = finish
+            ticket = (finish, next(self._sequence), task_id)
+            heapq.heappush(self._waiting, ticket)
+            flow.waiting += 1
+
+            start = time.perf_counter()
+            while self._active >= self.connections or self._waiting[0] is not ticket:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+
+            # Virtual time follows the requests being served, so a crawl that
+            # sat idle does not bank credit to starve the others later
+            self._virtual_time = max(self._virtual_time, finish - 1.0 / flow.weight)
+            self._active += 1
+            flow.waiting -= 1
+            flow.active += 1
+            flow.granted += 1
+            flow.total_wait += time.perf_counter() - start
+
+            # The next ticket may be ours to hand a free connection to
+            self._cond.notify_all()
+
+    def release(self, task_id):
+        """Give a fetch connection back."""
+        with self._cond:
+            self._active -= 1
+            flow = self._flows.get(task_id)
+            if flow is not None:
+                flow.active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def connection(self, task_id):
+        """Hold a fetch connection for the duration of a with block."""
+        self.acquire(task_id)
+        try:
+            yield
+        finally:
+            self.release(task_id)
+
+    def get_flow_stats(self, task_id):
+        """Queueing stats for one crawl, or None if it is not registered."""
+        with self._cond:
+            flow = self._flows.get(task_id)
+            if flow is None:
+                return None
+            return self._flow_stats(flow)
+
+    def get_stats(self):
+        """Connection usage and per-crawl queueing stats."""
+        with self._cond:
+            return {
+                "connections": self.connections,
+                "active": self._active,
+                "waiting": len(self._waiting),
+                "crawls": {task_id: self._flow_stats(flow) for task_id, flow in self._flows.items()}
+            }
+
+    @staticmethod
+    def _flow_stats(flow):
+        return {
+            "weight": flow.weight,
+            "active": flow.active,
+            "waiting": flow.waiting,
+            "fetches": flow.granted,
+            "avg_wait_ms": round(flow.total_wait / flow.granted * 1000, 2) if flow.granted else 0.0
+        }
+
+
+# Shared by every WebCrawler in this process
+fetch_scheduler = FetchScheduler()
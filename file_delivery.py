@@ -0,0 +1,79 @@
+"""
+Sending finished archives to clients.
+
+Archive downloads are conditional and resumable: send_file answers
+If-None-Match/If-Modified-Since with 304 and Range/If-Range with 206.
+Where the WSGI server has a wsgi.file_wrapper (gunicorn does), send_file
+hands a full body to it as the open file, so the server can use sendfile()
+instead of reading the file through Python. A 206 body is send_file's
+range-limited wrapper around it, which stops at the end of the range.
+
+Behind nginx or Apache the bytes needn't pass through the app at all: with
+ARCHIVE_OFFLOAD set, the response carries only headers and an
+X-Accel-Redirect or X-Sendfile header telling the front server which file to
+send.
+"""
+import os
+import logging
+
+from flask import send_file, make_response
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+from artifacts import ARCHIVE_DIR
+
+logger = logging.getLogger(__name__)
+
+# "x-accel-redirect" (nginx), "x-sendfile" (Apache, lighttpd) or empty to
+# send archives from the app
+ARCHIVE_OFFLOAD = os.environ.get("ARCHIVE_OFFLOAD", "").strip().lower()
+
+# For X-Accel-Redirect: the internal nginx location archives are served
+# from, and the directory that location maps to
+ARCHIVE_OFFLOAD_PREFIX = os.environ.get("ARCHIVE_OFFLOAD_PREFIX", "/_archives/")
+ARCHIVE_OFFLOAD_ROOT = os.environ.get("ARCHIVE_OFFLOAD_ROOT", ARCHIVE_DIR)
+
+
+def _offload_response(path, download_name):
+    """Headers-only response asking the front server to send the file, or None."""
+    if ARCHIVE_OFFLOAD == "x-sendfile":
+        header, value = "X-Sendfile", os.path.abspath(path)
+    elif ARCHIVE_OFFLOAD == "x-accel-redirect":
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(ARCHIVE_OFFLOAD_ROOT))
+        if relative.startswith(os.pardir):
+            logger.warning(f"{path} is outside ARCHIVE_OFFLOAD_ROOT; sending it from the app")
+            return None
+        header, value = "X-Accel-Redirect", ARCHIVE_OFFLOAD_PREFIX.rstrip('/') + '/' + relative.replace(os.sep, '/')
+    else:
+        return None
+
+    response = make_response('')
+    response.headers[header] = value
+    response.headers['Content-Type'] = 'application/zip'
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    return response
+
+
+def send_archive(path, download_name=None):
+    """
+    Send an archive as a resumable download.
+
+    Args:
+        path (str): Archive on disk
+        download_name (str): File name for the client; the archive's own by default
+
+    Returns:
+        Response: 200, 206, 304 or 416, or a header-only offload response
+    """
+    download_name = download_name or os.path.basename(path)
+    response = _offload_response(path, download_name)
+    if response is not None:
+        return response
+
+    try:
+        response = send_file(path, mimetype='application/zip', as_attachment=True,
+                             download_name=download_name, conditional=True, etag=True)
+    except RequestedRangeNotSatisfiable as e:
+        # Routes catch every exception as a 500; a bad range is the client's
+        return e.get_response()
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,168 @@
+from html import escape
+from html.parser import HTMLParser
+
+from css_rewriter import rewrite_css
+
+# Attributes that hold a single URL, by tag. Links to other pages are crawled
+# as pages, everything else is fetched as a page requisite.
+URL_ATTRIBUTES = {
+    'a': {'href': 'page'},
+    'link': {'href': 'resource'},
+    'script': {'src': 'resource'},
+    'img': {'src': 'resource'},
+    'source': {'src': 'resource'},
+}
+
+
+def rewrite_srcset(srcset, rewrite):
+    """Rewrite each candidate URL in a srcset attribute."""
+    new_parts = []
+    for part in srcset.split(','):
+        part = part.strip()
+        if not part:
+            continue
+
+        url_size = part.split(' ', 1)
+        url = url_size[0].strip()
+        size = url_size[1] if len(url_size) > 1 else ''
+
+        new_url = rewrite(url)
+        if new_url is None:
+            new_url = url
+        new_parts.append(f"{new_url} {size}".strip())
+
+    return ', '.join(new_parts)
+
+
+class HTMLRewriter(HTMLParser):
+    """
+    Token-stream HTML rewriter.
+
+    Rewrites URL attributes, srcset and inline style url()s on start tags, and
+    url()/@import references in <style> blocks, and writes everything else
+    through untouched as it is parsed. Memory stays bounded by the size of the
+    largest single token or <style> block rather than the document.
+
+    The text of the first <title> is kept in the title attribute as it
+    streams past, so the page never has to be parsed again for it.
+
+    Args:
+        out: Text stream to write the rewritten document to
+        rewrite_page: Callback for links to other pages; returns the new URL or None
+        rewrite_resource: Callback for page requisites; returns the new URL or None
+    """
+
+    def __init__(self, out, rewrite_page, rewrite_resource):
+        super().__init__(convert_charrefs=False)
+        self.out = out
+        self.rewrite_page = rewrite_page
+        self.rewrite_resource = rewrite_resource
+        # Contents of the <style> block being parsed, if any
+        self._style_parts = None
+        self.title = None
+        # Raw text of the <title> being parsed, if any
+        self._title_parts = None
+
+    def _rewrite_attrs(self, tag, attrs):
+        """Return the rewritten attribute list, or None if nothing changed."""
+        url_attrs = URL_ATTRIBUTES.get(tag, {})
+        changed = False
+        new_attrs = []
+
+        for name, value in attrs:
+            new_value = None
+            if value is not None:
+                kind = url_attrs.get(name)
+                if kind == 'page':
+                    new_value = self.rewrite_page(value)
+                elif kind == 'resource':
+                    new_value = self.rewrite_resource(value)
+                elif name == 'srcset':
+                    new_value = rewrite_srcset(value, self.rewrite_resource)
+                elif name == 'style':
+                    new_value = rewrite_css(value, self.rewrite_resource)
+
+            if new_value is not None and new_value != value:
+                changed = True
+                new_attrs.append((name, new_value))
+            else:
+                new_attrs.append((name, value))
+
+        return new_attrs if changed else None
+
+    def _write_tag(self, tag, attrs, self_closing):
+        new_attrs = self._rewrite_attrs(tag, attrs)
+        if new_attrs is None:
+            # Nothing to rewrite, keep the original markup byte for byte
+            self.out.write(self.get_starttag_text())
+            return
+
+        parts = [tag]
+        for name, value in new_attrs:
+            if value is None:
+                parts.append(name)
+            else:
+                parts.append(f'{name}="{escape(value, quote=True)}"')
+        self.out.write(f"<{' '.join(parts)}{' /' if self_closing else ''}>")
+
+    def handle_starttag(self, tag, attrs):
+        self._write_tag(tag, attrs, False)
+        if tag == 'style':
+            self._style_parts = []
+        elif tag == 'title' and self.title is None:
+            self._title_parts = []
+
+    def handle_startendtag(self, tag, attrs):
+        self._write_tag(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        if tag == 'style' and self._style_parts is not None:
+            # The parser may hand a style block over in pieces
+            self.out.write(rewrite_css(''.join(self._style_parts), self.rewrite_resource))
+            self._style_parts = None
+        elif tag == 'title' and self._title_parts is not None:
+            self.title = ''.join(self._title_parts)
+            self._title_parts = None
+        self.out.write(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self._style_parts is not None:
+            self._style_parts.append(data)
+        else:
+            if self._title_parts is not None:
+                self._title_parts.append(data)
+            self.out.write(data)
+
+    def handle_entityref(self, name):
+        if self._title_parts is not None:
+            self._title_parts.append(f"&{name};")
+        self.out.write(f"&{name};")
+
+    def handle_charref(self, name):
+        if self._title_parts is not None:
+            self._title_parts.append(f"&#{name};")
+        self.out.write(f"&#{name};")
+
+    def handle_comment(self, data):
+        self.out.write(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.out.write(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self.out.write(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        # HTMLParser strips "]]>" from CDATA sections but only "]>" from
+        # other marked sections such as <![endif]>
+        if data.startswith('CDATA['):
+            self.out.write(f"<![{data}]]>")
+        else:
+            self.out.write(f"<![{data}]>")
+
+    def close(self):
+        super().close()
+        # Flush an unterminated <style> block as-is
+        if self._style_parts is not None:
+            self.out.write(''.join(self._style_parts))
+            self._style_parts = None
@@ -0,0 +1,323 @@
+"""
+Background clean-up of finished crawls.
+
+Clients rarely call /cleanup, so without this temp/ and the archive
+directory only grow. Each sweep:
+
+1. expires finished tasks not used for JANITOR_TASK_TTL, deleting their
+   archive, working files, manifest and preview index;
+2. evicts the least recently used finished tasks, and archives without a
+   task, until temp/ and the archive directory fit in JANITOR_DISK_QUOTA_MB;
+3. removes files no task accounts for, such as directories of deleted
+   tasks, once they are older than JANITOR_ORPHAN_AGE;
+4. deletes records of failed, cancelled and expired tasks after
+   JANITOR_RECORD_TTL.
+
+Queued and running tasks, and anything they may still write to, are never
+touched. Every crawl worker process starts a janitor thread, but only the
+longest-running live process in the worker registry sweeps, every
+JANITOR_INTERVAL seconds; if it stops, the next oldest takes over. A sweep
+can also be run once, e.g. from cron, with `python janitor.py --once`.
+
+What the janitor reclaims is counted in the database (metrics.increment_total),
+so /metrics on any process reports the deployment's totals.
+"""
+import os
+import shutil
+import logging
+import argparse
+import datetime
+import threading
+
+from sqlalchemy import func
+
+from models import db, CrawlTask, Artifact
+from jobs import ACTIVE_STATUSES
+from task_registry import delete_task
+from result_cache import evict_task, tree_size, temp_dir
+from manifest import MANIFEST_SUFFIX, manifest_path
+from artifacts import ARCHIVE_DIR, forget_artifact
+from worker_registry import is_leader
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps; 0 disables the janitor thread
+JANITOR_INTERVAL = float(os.environ.get("JANITOR_INTERVAL", 300))
+
+# Finished tasks unused for this many seconds lose their files
+JANITOR_TASK_TTL = int(os.environ.get("JANITOR_TASK_TTL", 24 * 3600))
+
+# Combined size of temp/ and the archive directory; 0 disables the quota
+JANITOR_DISK_QUOTA_BYTES = int(os.environ.get("JANITOR_DISK_QUOTA_MB", 10240)) * 1024 * 1024
+
+# Files no task accounts for are removed once this old, so files of a task
+# that is only just being created are left alone
+JANITOR_ORPHAN_AGE = int(os.environ.get("JANITOR_ORPHAN_AGE", 3600))
+
+# Failed, cancelled and expired task records are deleted this long after finishing
+JANITOR_RECORD_TTL = int(os.environ.get("JANITOR_RECORD_TTL", 7 * 24 * 3600))
+
+def _last_used():
+    return func.coalesce(CrawlTask.last_accessed_at, CrawlTask.finished_at, CrawlTask.created_at)
+
+
+def _finished_tasks():
+    """Completed, failed and cancelled tasks, least recently used first."""
+    return (CrawlTask.query
+            .filter(CrawlTask.status.in_(("completed", "failed", "cancelled")))
+            .order_by(_last_used()))
+
+
+def _has_files(task):
+    """Whether a finished task still has anything on disk to evict."""
+    return bool(task.zip_path or task.files_root or (temp_dir / task.id).exists()
+                or manifest_path(task.id).exists())
+
+
+def _evict(task, reason):
+    freed = evict_task(task)
+    db.session.commit()
+    metrics.increment_total("janitor.evicted_tasks")
+    metrics.increment_total("janitor.reclaimed_bytes", freed)
+    logger.info(f"Janitor evicted task {task.id} ({reason}): {freed / (1024 * 1024):.1f} MB")
+    return freed
+
+
+def expire_stale_tasks(now):
+    """Evict finished tasks unused for longer than JANITOR_TASK_TTL."""
+    if JANITOR_TASK_TTL <= 0:
+        return 0
+    cutoff = now - datetime.timedelta(seconds=JANITOR_TASK_TTL)
+    reclaimed = 0
+    for task in _finished_tasks().filter(_last_used() < cutoff).all():
+        if _has_files(task):
+            reclaimed += _evict(task, "expired")
+    return reclaimed
+
+
+def disk_usage():
+    """Bytes used by temp/ and the archive directory."""
+    return tree_size(temp_dir) + tree_size(ARCHIVE_DIR)
+
+
+def _remove_artifact(artifact):
+    """Delete an archive that belongs to no task, and its registry entry."""
+    freed = 0
+    try:
+        if os.path.exists(artifact.path):
+            freed = os.path.getsize(artifact.path)
+            os.remove(artifact.path)
+    except OSError as e:
+        logger.error(f"Error removing archive {artifact.path}: {e}")
+        return 0
+    forget_artifact(artifact.path)
+    db.session.commit()
+    metrics.increment_total("janitor.reclaimed_bytes", freed)
+    logger.info(f"Janitor removed archive {artifact.name}: {freed / (1024 * 1024):.1f} MB")
+    return freed
+
+
+def enforce_quota():
+    """
+    Evict least recently used finished tasks, then the oldest archives that
+    belong to no task, until disk usage fits JANITOR_DISK_QUOTA_BYTES.
+
+    Returns:
+        int: Bytes reclaimed
+    """
+    if JANITOR_DISK_QUOTA_BYTES <= 0:
+        return 0
+    usage = disk_usage()
+    if usage <= JANITOR_DISK_QUOTA_BYTES:
+        return 0
+
+    reclaimed = 0
+    for task in _finished_tasks().all():
+        if usage - reclaimed <= JANITOR_DISK_QUOTA_BYTES:
+            return reclaimed
+        if _has_files(task):
+            reclaimed += _evict(task, "over quota")
+
+    task_archives = db.session.query(CrawlTask.id).filter(CrawlTask.zip_path.isnot(None))
+    loose = (Artifact.query
+             .filter((Artifact.task_id.is_(None)) | (Artifact.task_id.notin_(task_archives)))
+             .order_by(Artifact.id))
+    for artifact in loose.all():
+        if usage - reclaimed <= JANITOR_DISK_QUOTA_BYTES:
+            break
+        reclaimed += _remove_artifact(artifact)
+
+    if usage - reclaimed > JANITOR_DISK_QUOTA_BYTES:
+        logger.warning(f"Disk usage still {(usage - reclaimed) / (1024 * 1024):.1f} MB after eviction; "
+                       f"the rest belongs to running tasks")
+    return reclaimed
+
+
+def _is_old(path, now_ts):
+    try:
+        return now_ts - os.path.getmtime(path) >= JANITOR_ORPHAN_AGE
+    except OSError:
+        return False
+
+
+def _remove_orphan(path):
+    freed = tree_size(path)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"Error removing {path}: {e}")
+            return 0
+    metrics.increment_total("janitor.orphans_removed")
+    metrics.increment_total("janitor.reclaimed_bytes", freed)
+    logger.info(f"Janitor removed orphaned {path}: {freed / (1024 * 1024):.1f} MB")
+    return freed
+
+
+def purge_orphans(now):
+    """
+    Remove task directories, manifests and archives that no live task uses.
+
+    A task directory is kept while its task is queued or running, failed
+    (until the TTL takes it), or completed without an archive, since
+    streaming-only tasks are served from it.
+
+    Returns:
+        int: Bytes reclaimed
+    """
+    now_ts = now.replace(tzinfo=datetime.timezone.utc).timestamp()
+    tasks = {task_id: (status, zip_path) for task_id, status, zip_path
+             in db.session.query(CrawlTask.id, CrawlTask.status, CrawlTask.zip_path)}
+    archives = {path for path, in db.session.query(CrawlTask.zip_path).filter(CrawlTask.zip_path.isnot(None))}
+    archives |= {path for path, in db.session.query(Artifact.path)}
+    archive_names = {os.path.basename(path) for path in archives}
+
+    reclaimed = 0
+    if temp_dir.exists():
+        for entry in os.scandir(temp_dir):
+            if entry.is_dir():
+                task = tasks.get(entry.name)
+                in_use = task is not None and (task[0] in ACTIVE_STATUSES or task[0] == "failed"
+                                               or (task[0] == "completed" and not task[1]))
+            elif entry.name.endswith(MANIFEST_SUFFIX):
+                in_use = entry.name[:-len(MANIFEST_SUFFIX)] in tasks
+            elif entry.name.endswith('.zip'):
+                in_use = entry.name in archive_names
+            else:
+                continue
+            if not in_use and _is_old(entry.path, now_ts):
+                reclaimed += _remove_orphan(entry.path)
+
+    if os.path.isdir(ARCHIVE_DIR):
+        for entry in os.scandir(ARCHIVE_DIR):
+            if (entry.is_file() and entry.name.endswith('.zip') and entry.name not in archive_names
+                    and _is_old(entry.path, now_ts)):
+                reclaimed += _remove_orphan(entry.path)
+    return reclaimed
+
+
+def delete_old_records(now):
+    """Delete failed, cancelled and expired task records that finished over JANITOR_RECORD_TTL ago."""
+    if JANITOR_RECORD_TTL <= 0:
+        return 0
+    cutoff = now - datetime.timedelta(seconds=JANITOR_RECORD_TTL)
+    old = (CrawlTask.query
+           .filter(CrawlTask.status.in_(("failed", "expired", "cancelled")),
+                   func.coalesce(CrawlTask.finished_at, CrawlTask.created_at) < cutoff)
+           .all())
+    for task in old:
+        evict_task(task)
+        delete_task(task.id)
+    metrics.increment_total("janitor.records_deleted", len(old))
+    return len(old)
+
+
+def janitor_settings():
+    """The janitor's configuration, for /metrics."""
+    return {
+        "interval": JANITOR_INTERVAL,
+        "task_ttl": JANITOR_TASK_TTL,
+        "disk_quota_bytes": JANITOR_DISK_QUOTA_BYTES,
+        "orphan_age": JANITOR_ORPHAN_AGE,
+        "record_ttl": JANITOR_RECORD_TTL
+    }
+
+
+def sweep():
+    """
+    Run every clean-up step once; needs an application context.
+
+    Returns:
+        dict: Bytes reclaimed by expiry, quota and orphan removal, and
+        records deleted
+    """
+    now = datetime.datetime.utcnow()
+    result = {
+        "expired_bytes": expire_stale_tasks(now),
+        "quota_bytes": enforce_quota(),
+        "orphan_bytes": purge_orphans(now),
+        "records_deleted": delete_old_records(now)
+    }
+    metrics.increment_total("janitor.sweeps")
+    reclaimed = result["expired_bytes"] + result["quota_bytes"] + result["orphan_bytes"]
+    if reclaimed or result["records_deleted"]:
+        logger.info(f"Janitor reclaimed {reclaimed / (1024 * 1024):.1f} MB and "
+                    f"deleted {result['records_deleted']} task records")
+    return result
+
+
+def janitor_loop(app, stop_event, interval=JANITOR_INTERVAL, proc_id=None):
+    """
+    Sweep every interval seconds until stop_event is set.
+
+    With proc_id, a worker registry ID, only sweep while that process is
+    the registry's leader, so a deployment runs one janitor at a time.
+    """
+    logger.info(f"Janitor started, sweeping every {interval:.0f}s")
+    while not stop_event.wait(interval):
+        try:
+            with app.app_context():
+                if proc_id is None or is_leader(proc_id):
+                    sweep()
+        except Exception as e:
+            logger.error(f"Janitor error: {e}")
+            db.session.rollback()
+
+
+def start_janitor(app, stop_event=None, proc_id=None):
+    """Start the janitor thread in this process, unless JANITOR_INTERVAL is 0."""
+    if JANITOR_INTERVAL <= 0:
+        return None
+    thread = threading.Thread(target=janitor_loop, args=(app, stop_event or threading.Event()),
+                              kwargs={"proc_id": proc_id}, name="janitor")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evict stale crawl data and orphaned files.")
+    parser.add_argument("--once", action="store_true", help="sweep once and exit")
+    args = parser.parse_args(argv)
+
+    # Only the janitor should run here, not embedded crawl workers
+    os.environ["EMBEDDED_CRAWL_WORKERS"] = "0"
+    from app import app
+
+    if args.once:
+        with app.app_context():
+            print(sweep())
+        return
+
+    stop_event = threading.Event()
+    try:
+        janitor_loop(app, stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+
+if __name__ == '__main__':
+    main()
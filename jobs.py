@@ -0,0 +1,350 @@
+import os
+import time
+import json
+import hashlib
+import datetime
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from models import db, CrawlTask, CrawlSubscription
+from task_registry import create_task, get_task, add_subscriber, count_subscribers
+from crawler import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# Task statuses that still hold or are waiting for a crawl worker
+ACTIVE_STATUSES = ("queued", "starting", "crawling")
+
+# Statuses of jobs that a worker holds a lease on
+LEASED_STATUSES = ("starting", "crawling")
+
+# How long a lease lasts without a heartbeat, and how often workers renew it
+LEASE_SECONDS = int(os.environ.get("CRAWL_LEASE_SECONDS", 60))
+HEARTBEAT_INTERVAL = LEASE_SECONDS / 4
+
+# A job whose lease has expired this many times is failed instead of re-queued
+MAX_JOB_ATTEMPTS = int(os.environ.get("CRAWL_MAX_ATTEMPTS", 3))
+
+# Seconds between a running job's checks for a cancel request
+CANCEL_POLL_INTERVAL = float(os.environ.get("CRAWL_CANCEL_POLL_INTERVAL", 1.0))
+
+# Crawls allowed to run at once across all workers and web processes
+CRAWL_SLOTS = int(os.environ.get("CRAWL_SLOTS", 4))
+
+
+def enqueue_job(task_id, url, wget_mode=False, user_id=None, **fields):
+    """Queue a crawl job for the next free crawl worker."""
+    return create_task(task_id, url, wget_mode=wget_mode, user_id=user_id, status="queued", **fields)
+
+
+def crawl_key(url, engine):
+    """
+    Key under which identical crawl requests are coalesced.
+
+    Args:
+        url (str): Start URL
+        engine (str): What runs the crawl: "crawler", "wget" or "fast_wget"
+
+    Returns:
+        str: Hex digest of the canonical URL and options
+    """
+    return hashlib.sha256(f"{engine}\n{canonical_url(url)}".encode('utf-8')).hexdigest()
+
+
+def _oldest_active_job(key):
+    return (CrawlTask.query
+            .filter(CrawlTask.dedupe_key == key, CrawlTask.status.in_(ACTIVE_STATUSES))
+            .order_by(CrawlTask.created_at)
+            .first())
+
+
+def owner_key(user_id=None, api_key_id=None, client_addr=None):
+    """
+    Subscription owner for a caller, from the fields app.request_owner returns.
+
+    API keys count as their user, so a user's keys and web session share
+    their subscriptions.
+    """
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"addr:{client_addr}"
+
+
+def _attach(task_id, owner):
+    if not CrawlTask.query.filter(CrawlTask.id == task_id, CrawlTask.status.in_(ACTIVE_STATUSES)).count():
+        return False
+    add_subscriber(task_id, owner)
+    return True
+
+
+def join_active_job(key, owner):
+    """
+    Subscribe a caller to an unfinished job with the same crawl key.
+
+    Returns the job to follow, or None if there is no such job.
+    """
+    task = _oldest_active_job(key)
+    if task is not None and _attach(task.id, owner):
+        return task
+    return None
+
+
+def coalesce_job(task_id, key, owner):
+    """
+    Resolve a race between callers that created jobs for the same key at once.
+
+    The oldest active job wins. If that is not task_id, task_id is deleted
+    before it starts and its caller is subscribed to the winner instead.
+    Returns the ID of the job the caller should follow.
+    """
+    first = _oldest_active_job(key)
+    if first is None or first.id == task_id or not _attach(first.id, owner):
+        return task_id
+
+    CrawlSubscription.query.filter_by(task_id=task_id).delete()
+    CrawlTask.query.filter_by(id=task_id).delete()
+    db.session.commit()
+    logger.info(f"Coalesced job {task_id} into identical job {first.id}")
+    return first.id
+
+
+def is_subscribed(task_id, owner):
+    """
+    Whether a caller may cancel or clean up a job: they are subscribed to
+    it. Jobs from before subscriptions were recorded belong to whoever
+    admission recorded as submitting them, or to anyone if nobody was.
+    """
+    owners = {row.owner for row in CrawlSubscription.query.filter_by(task_id=task_id)}
+    if owners:
+        return owner in owners
+    task = get_task(task_id)
+    if task is None:
+        return False
+    if task.user_id is None and task.client_addr is None:
+        return True
+    return owner_key(user_id=task.user_id, client_addr=task.client_addr) == owner
+
+
+def release_subscriber(task_id, owner):
+    """
+    Detach a caller from a job other callers are still subscribed to.
+
+    Only the caller's own subscription is removed, and only while someone
+    else's remains, so the last subscriber is never detached: they are the
+    one who gets to cancel or clean up the job.
+
+    Returns:
+        bool: True if the caller was detached and the job, with its files,
+        must be kept for the others
+    """
+    other = aliased(CrawlSubscription)
+    others = (select(other.id)
+              .where(other.task_id == task_id, other.owner != owner)
+              .correlate(None)
+              .exists())
+    released = (CrawlSubscription.query
+                .filter(CrawlSubscription.task_id == task_id, CrawlSubscription.owner == owner, others)
+                .delete(synchronize_session=False))
+    if released:
+        count_subscribers(task_id)
+    db.session.commit()
+    return bool(released)
+
+
+def wait_for_job(task_id, poll_interval=1.0):
+    """Block until a job has finished and return it, or None if it was deleted."""
+    while True:
+        # Drop cached rows so each poll sees other processes' updates
+        db.session.expire_all()
+        task = get_task(task_id)
+        if task is None or task.status not in ACTIVE_STATUSES:
+            return task
+        time.sleep(poll_interval)
+
+
+def running_count():
+    """Number of crawl slots in use, i.e. jobs currently leased."""
+    return CrawlTask.query.filter(CrawlTask.status.in_(LEASED_STATUSES)).count()
+
+
+def queued_count():
+    """Number of jobs waiting for a crawl slot."""
+    return CrawlTask.query.filter_by(status="queued").count()
+
+
+def lease_job(worker_id):
+    """
+    Claim the oldest queued job for a worker.
+
+    The claim is a conditional UPDATE on the job's status, so when several
+    workers race for the same job exactly one of them gets it. Returns the
+    leased CrawlTask, or None if the queue is empty or every crawl slot is
+    in use.
+    """
+    if running_count() >= CRAWL_SLOTS:
+        return None
+
+    candidates = (db.session.query(CrawlTask.id)
+                  .filter_by(status="queued")
+                  .order_by(CrawlTask.created_at)
+                  .limit(5)
+                  .all())
+
+    now = datetime.datetime.utcnow()
+    for (task_id,) in candidates:
+        claimed = (CrawlTask.query
+                   .filter_by(id=task_id, status="queued")
+                   .update({"status": "starting", "worker_id": worker_id,
+                            "started_at": now, "updated_at": now, "heartbeat_at": now,
+                            "lease_expires_at": now + datetime.timedelta(seconds=LEASE_SECONDS),
+                            "attempts": CrawlTask.attempts + 1}))
+        db.session.commit()
+        if not claimed:
+            continue
+
+        # Workers that checked the slot count at the same moment can overshoot
+        # it; whoever finds too many jobs running hands theirs back
+        if running_count() > CRAWL_SLOTS:
+            (CrawlTask.query
+             .filter_by(id=task_id, worker_id=worker_id, status="starting")
+             .update({"status": "queued", "worker_id": None, "lease_expires_at": None,
+                      "attempts": CrawlTask.attempts - 1}))
+            db.session.commit()
+            return None
+
+        logger.info(f"Worker {worker_id} leased job {task_id}")
+        return db.session.get(CrawlTask, task_id)
+    return None
+
+
+def queue_position(task_id):
+    """1-based position of a queued job, or 0 if it is no longer queued."""
+    task = db.session.get(CrawlTask, task_id)
+    if task is None or task.status != "queued":
+        return 0
+    ahead = (CrawlTask.query
+             .filter(CrawlTask.status == "queued", CrawlTask.created_at < task.created_at)
+             .count())
+    return ahead + 1
+
+
+def heartbeat(task_id, worker_id):
+    """
+    Renew a worker's lease on a job.
+
+    Returns False if the worker no longer holds the lease, because it expired
+    and the job was re-queued or leased elsewhere, or the job has finished.
+    """
+    now = datetime.datetime.utcnow()
+    renewed = (CrawlTask.query
+               .filter(CrawlTask.id == task_id,
+                       CrawlTask.worker_id == worker_id,
+                       CrawlTask.status.in_(LEASED_STATUSES))
+               .update({"heartbeat_at": now,
+                        "lease_expires_at": now + datetime.timedelta(seconds=LEASE_SECONDS)},
+                       synchronize_session=False))
+    db.session.commit()
+    return bool(renewed)
+
+
+def finish_job(task_id, worker_id, **fields):
+    """
+    Record a job's outcome, but only if the worker still holds its lease.
+
+    A worker that lost its lease must not overwrite the state of whoever
+    picked the job up after it. Returns whether the update was applied.
+    """
+    if "stats" in fields:
+        fields["stats_json"] = json.dumps(fields.pop("stats"))
+    now = datetime.datetime.utcnow()
+    fields.setdefault("finished_at", now)
+    fields["updated_at"] = now
+    fields["lease_expires_at"] = None
+
+    applied = (CrawlTask.query
+               .filter(CrawlTask.id == task_id,
+                       CrawlTask.worker_id == worker_id,
+                       CrawlTask.status.in_(LEASED_STATUSES))
+               .update(fields, synchronize_session=False))
+    db.session.commit()
+    return bool(applied)
+
+
+def request_cancel(task_id, finalize=False):
+    """
+    Cancel a job.
+
+    A queued job is cancelled on the spot. A running job is flagged, and
+    its worker stops it within CANCEL_POLL_INTERVAL or so and records the
+    outcome.
+
+    Args:
+        task_id (str): Job to cancel
+        finalize (bool): Archive what a running job has saved so far
+
+    Returns:
+        str: "cancelled", "cancelling", or the status of a job that had
+        already finished; None if there is no such job
+    """
+    now = datetime.datetime.utcnow()
+    dequeued = (CrawlTask.query
+                .filter_by(id=task_id, status="queued")
+                .update({"status": "cancelled", "finished_at": now, "updated_at": now},
+                        synchronize_session=False))
+    db.session.commit()
+    if dequeued:
+        logger.info(f"Cancelled queued job {task_id}")
+        return "cancelled"
+
+    flagged = (CrawlTask.query
+               .filter(CrawlTask.id == task_id, CrawlTask.status.in_(LEASED_STATUSES))
+               .update({"cancel_requested": "finalize" if finalize else "discard", "updated_at": now},
+                       synchronize_session=False))
+    db.session.commit()
+    if flagged:
+        logger.info(f"Requested cancel of running job {task_id}")
+        return "cancelling"
+
+    task = db.session.get(CrawlTask, task_id, populate_existing=True)
+    return task.status if task is not None else None
+
+
+def cancel_mode(task_id):
+    """The cancel requested for a running job, "discard" or "finalize", or None."""
+    return db.session.query(CrawlTask.cancel_requested).filter_by(id=task_id).scalar()
+
+
+def reap_expired_leases():
+    """
+    Re-queue jobs whose worker stopped heartbeating.
+
+    Jobs that have already used up MAX_JOB_ATTEMPTS leases are failed
+    instead, so a crawl that keeps killing workers does not loop forever.
+    Returns the number of jobs re-queued.
+    """
+    now = datetime.datetime.utcnow()
+    expired = (CrawlTask.query
+               .filter(CrawlTask.status.in_(LEASED_STATUSES),
+                       CrawlTask.lease_expires_at < now))
+
+    # A job cancelled while its worker was dying is not worth re-queueing
+    cancelled = (expired.filter(CrawlTask.cancel_requested.isnot(None))
+                 .update({"status": "cancelled", "lease_expires_at": None, "finished_at": now,
+                          "updated_at": now},
+                         synchronize_session=False))
+    failed = (expired.filter(CrawlTask.attempts >= MAX_JOB_ATTEMPTS)
+              .update({"status": "failed", "lease_expires_at": None, "finished_at": now,
+                       "updated_at": now, "error": "Crawl worker stopped responding"},
+                      synchronize_session=False))
+    requeued = (expired.filter(CrawlTask.attempts < MAX_JOB_ATTEMPTS)
+                .update({"status": "queued", "worker_id": None, "lease_expires_at": None,
+                         "updated_at": now},
+                        synchronize_session=False))
+    db.session.commit()
+
+    if failed or requeued or cancelled:
+        logger.warning(f"Reaped expired job leases: {requeued} re-queued, {failed} failed, "
+                       f"{cancelled} cancelled")
+    return requeued
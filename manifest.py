@@ -0,0 +1,285 @@
+"""
+Per-crawl manifest of saved files.
+
+Every engine records each file once as it is saved: its path in the
+archive, source URL, size, MIME type, SHA-256 and, for pages, the title.
+Stats, previews and the archive writer read the manifest instead of
+walking and re-reading the output tree.
+
+The manifest is a JSON Lines file next to the task directory, at
+temp/<task_id>.manifest.jsonl, so it outlives the directory itself.
+"""
+import os
+import re
+import json
+import html
+import hashlib
+import logging
+import zipfile
+import threading
+import mimetypes
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.jsonl"
+
+# Chunk size for hashing saved files
+HASH_CHUNK_BYTES = 256 * 1024
+
+# How far into a page to look for its <title>
+TITLE_SNIFF_BYTES = 64 * 1024
+
+# Longest title kept in the manifest
+MAX_TITLE_LENGTH = 300
+
+RESOURCE_EXTENSIONS = {
+    'html': ('.html', '.htm'),
+    'css': ('.css',),
+    'js': ('.js',),
+    'images': ('.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp'),
+    'fonts': ('.woff', '.woff2', '.ttf', '.eot'),
+}
+
+# Formats that are already compressed; deflating them only costs CPU, and
+# stored entries can be served straight from a memory-mapped archive
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.woff', '.woff2',
+                     '.mp3', '.mp4', '.webm', '.zip', '.gz')
+STORED_MIME_PREFIXES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/avif',
+                        'font/woff', 'audio/', 'video/', 'application/zip', 'application/gzip')
+
+_TITLE_RE = re.compile(rb'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+
+temp_dir = Path("temp")
+
+
+def classify_path(path):
+    """Resource type of a downloaded file, by extension."""
+    lower = path.lower()
+    for kind, extensions in RESOURCE_EXTENSIONS.items():
+        if lower.endswith(extensions):
+            return kind
+    return 'other'
+
+
+def empty_resources():
+    return {'html': 0, 'css': 0, 'js': 0, 'images': 0, 'fonts': 0, 'other': 0}
+
+
+def manifest_path(task_id):
+    """Where a task's manifest is kept."""
+    return temp_dir / f"{task_id}{MANIFEST_SUFFIX}"
+
+
+def clean_title(title):
+    """Collapse whitespace and decode entities in a page title."""
+    if title is None:
+        return None
+    title = ' '.join(html.unescape(title).split())
+    return title[:MAX_TITLE_LENGTH] or None
+
+
+def scan_file(path, kind=None):
+    """
+    Read a saved file once for its manifest facts.
+
+    Args:
+        path (str): File to scan
+        kind (str): Resource kind, if already known
+
+    Returns:
+        dict: size, sha256 and, for HTML, title
+    """
+    kind = kind or classify_path(str(path))
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+            size += len(chunk)
+            if kind == 'html' and len(head) < TITLE_SNIFF_BYTES:
+                head += chunk[:TITLE_SNIFF_BYTES - len(head)]
+
+    title = None
+    if head:
+        match = _TITLE_RE.search(head)
+        if match:
+            title = clean_title(match.group(1).decode('utf-8', errors='replace'))
+    return {"size": size, "sha256": digest.hexdigest(), "title": title}
+
+
+class ManifestWriter:
+    """
+    Appends manifest entries as files are saved; safe to share between threads.
+
+    Each entry reaches the file as soon as it is added, so snapshots of a
+    running crawl see every file recorded so far.
+
+    Args:
+        task_id (str): Task the manifest belongs to
+        append (bool): Keep entries from an earlier attempt at the task
+    """
+
+    def __init__(self, task_id, append=False):
+        self.path = manifest_path(task_id)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a' if append else 'w', encoding='utf-8', buffering=1)
+
+    def add(self, path, url=None, size=0, mime=None, sha256=None, title=None, kind=None):
+        """Record one saved file; path is relative to the archive root."""
+        path = path.replace(os.sep, '/')
+        entry = {
+            "path": path,
+            "url": url,
+            "size": size,
+            "mime": (mime or mimetypes.guess_type(path)[0] or "application/octet-stream").split(';')[0].strip(),
+            "sha256": sha256,
+            "title": title,
+            "kind": kind or classify_path(path)
+        }
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._file.write(line)
+        return entry
+
+    def add_file(self, root, path, url=None, mime=None):
+        """Scan a file already on disk under root and record it."""
+        kind = classify_path(path)
+        facts = scan_file(os.path.join(root, path), kind)
+        return self.add(path, url, facts["size"], mime, facts["sha256"], facts["title"], kind)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_manifest(task_id):
+    """
+    Load a task's manifest, one entry per path (the latest record wins).
+
+    Returns:
+        list: Entries in the order files were first saved, or None if the
+        task has no manifest
+    """
+    entries = {}
+    try:
+        with open(manifest_path(task_id), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crawl still writing may leave a partial last line
+                    continue
+                entries[entry["path"]] = entry
+    except FileNotFoundError:
+        return None
+    return list(entries.values())
+
+
+def manifest_urls(task_id):
+    """The URL each path in a task's manifest was fetched from, by path."""
+    return {entry["path"]: entry["url"] for entry in read_manifest(task_id) or () if entry.get("url")}
+
+
+def summarize(entries):
+    """File count, total bytes and per-kind counts of manifest entries."""
+    resources = empty_resources()
+    total_bytes = 0
+    for entry in entries:
+        resources[entry["kind"]] = resources.get(entry["kind"], 0) + 1
+        total_bytes += entry["size"]
+    return {"files": len(entries), "bytes": total_bytes, "resources": resources}
+
+
+def preview_from_manifest(entries, limit=20):
+    """Preview data (sample pages, resource counts) from manifest entries."""
+    summary = summarize(entries)
+    pages = [{"path": entry["path"], "title": entry["title"] or entry["path"]}
+             for entry in entries if entry["kind"] == 'html'][:limit]
+    return {
+        "pages": pages,
+        "resources": summary["resources"],
+        "total_files": summary["files"],
+        "total_bytes": summary["bytes"]
+    }
+
+
+def is_precompressed(entry):
+    """Whether a manifest entry's format is already compressed."""
+    return entry["path"].lower().endswith(STORED_EXTENSIONS) or (entry["mime"] or '').startswith(STORED_MIME_PREFIXES)
+
+
+def write_archive(zip_path, root, entries, extra_files=None):
+    """
+    Write a ZIP of the files listed in a manifest.
+
+    Args:
+        zip_path (str): Archive to create
+        root (str): Directory the entry paths are relative to
+        entries (list): Manifest entries to include
+        extra_files (dict): Further archive name -> file path, e.g. _redirects
+
+    Returns:
+        int: Number of files written
+    """
+    written = 0
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for arcname, file_path in (extra_files or {}).items():
+            zipf.write(file_path, arcname)
+            written += 1
+        for entry in entries:
+            file_path = os.path.join(root, entry["path"])
+            if entry["path"] in (extra_files or {}) or not os.path.exists(file_path):
+                continue
+            compress_type = zipfile.ZIP_STORED if is_precompressed(entry) else None
+            zipf.write(file_path, entry["path"], compress_type)
+            written += 1
+    return written
+
+
+def remove_manifest(task_id):
+    try:
+        manifest_path(task_id).unlink(missing_ok=True)
+    except OSError as e:
+        logger.error(f"Error removing manifest for task {task_id}: {e}")
+
+
+def record_tree(task_id, root, urls=None, skip=()):
+    """
+    Scan every file under root into a fresh manifest.
+
+    For engines that can't record files as they save them, such as wget,
+    whose --convert-links rewrites pages only once the mirror is done.
+
+    Args:
+        task_id (str): Task the manifest belongs to
+        root (str): Directory to scan; entry paths are relative to it
+        urls (dict): Source URL by relative path, where known
+        skip (tuple): File names to leave out
+
+    Returns:
+        list: The recorded entries
+    """
+    urls = urls or {}
+    entries = []
+    with ManifestWriter(task_id) as writer:
+        for dirpath, _, files in os.walk(root):
+            for name in sorted(files):
+                if name in skip:
+                    continue
+                path = os.path.relpath(os.path.join(dirpath, name), root).replace(os.sep, '/')
+                entries.append(writer.add_file(root, path, urls.get(path)))
+    return entries
@@ -0,0 +1,54 @@
+import threading
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Counter
+
+# Process-wide event counters, e.g. admitted and rejected crawl requests.
+# Each web process counts its own events; /metrics reports this process's.
+_counters = {}
+_lock = threading.Lock()
+
+
+def increment(name, amount=1):
+    """Add amount to the named counter, creating it at zero if needed."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def get_counters():
+    """Snapshot of every counter, by name."""
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+# Counters of work done in crawl worker processes, such as janitor sweeps and
+# result cache evictions, are kept in the database instead, so /metrics on any
+# web process reports the totals for the whole deployment.
+
+def increment_total(name, amount=1):
+    """
+    Add amount to the named deployment-wide counter; needs an application
+    context, and commits the session.
+    """
+    if not amount:
+        return
+    for _ in range(2):
+        updated = db.session.execute(
+            update(Counter).where(Counter.name == name).values(value=Counter.value + amount)).rowcount
+        if updated:
+            break
+        db.session.add(Counter(name=name, value=amount))
+        try:
+            db.session.commit()
+            return
+        except IntegrityError:
+            # Another process created it first; add to theirs
+            db.session.rollback()
+    db.session.commit()
+
+
+def get_totals():
+    """Every deployment-wide counter, by name."""
+    return {name: value for name, value in db.session.query(Counter.name, Counter.value).order_by(Counter.name)}
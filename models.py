@@ -1,11 +1,48 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 import secrets
 import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
 
+def create_schema():
+    """
+    Create missing tables, then add columns that existing tables lack.
+    
+    db.create_all() never alters a table that already exists, so columns
+    added to a model later (e.g. users.fetch_weight) are added here with
+    ALTER TABLE. New columns must be nullable or have a server default.
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.error(f"Cannot add column {table.name}.{column.name}: it is NOT NULL without a server default")
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            if column.server_default is not None:
+                default = column.server_default.arg
+                default = "'" + default.replace("'", "''") + "'" if isinstance(default, str) else str(default)
+                ddl += f" DEFAULT {default}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            with db.engine.begin() as connection:
+                connection.execute(text(ddl))
+            logger.info(f"Added column {table.name}.{column.name}")
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -14,6 +51,8 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Share of fetch connections the user's crawls get next to other crawls
+    fetch_weight = db.Column(db.Float, nullable=False, default=1.0, server_default='1.0')
     
     # One-to-many relationship with API keys
     api_keys = db.relationship('ApiKey', backref='user', lazy=True, cascade="all, delete-orphan")
@@ -44,6 +83,8 @@ class ApiKey(db.Model):
     name = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     last_used_at = db.Column(db.DateTime, nullable=True)
+    # Overrides the owner's fetch_weight for crawls started with this key
+    fetch_weight = db.Column(db.Float, nullable=True)
     
     def __repr__(self):
         return f"<ApiKey {self.name}>"
@@ -51,4 +92,177 @@ class ApiKey(db.Model):
     def mark_used(self):
         """Update the last_used_at timestamp"""
         self.last_used_at = datetime.datetime.utcnow()
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+
+class CrawlTask(db.Model):
+    """A crawl job, shared by every web and crawl worker so any of them can serve it"""
+    __tablename__ = 'crawl_tasks'
+    __table_args__ = (
+        db.Index('ix_crawl_tasks_user_created', 'user_id', 'created_at'),
+    )
+    
+    # The task ID handed out to clients
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    # Who the crawl counts against for concurrency caps: the API key it was
+    # started with, or the client address for anonymous web requests
+    api_key_id = db.Column(db.Integer, db.ForeignKey('api_keys.id', ondelete='SET NULL'), nullable=True, index=True)
+    client_addr = db.Column(db.String(45), nullable=True)
+    url = db.Column(db.String(2048), nullable=False)
+    wget_mode = db.Column(db.Boolean, nullable=False, default=False)
+    # What runs the crawl: "crawler", "wget" (simplified_wget) or "fast_wget"
+    engine = db.Column(db.String(20), nullable=False, default='crawler')
+    fetch_weight = db.Column(db.Float, nullable=False, default=1.0)
+    # Hash of the canonical URL and crawl options; identical requests share a job
+    dedupe_key = db.Column(db.String(64), nullable=True, index=True)
+    # Number of callers subscribed to the job (see CrawlSubscription); its
+    # files are removed when the last one cleans up
+    subscribers = db.Column(db.Integer, nullable=False, default=1)
+    # queued -> starting -> crawling -> completed / failed / cancelled; a
+    # completed task becomes expired once the result cache evicts its archive
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    # Set by a cancel request while the job runs: "discard", or "finalize"
+    # to archive what was saved so far; the worker polls for it
+    cancel_requested = db.Column(db.String(10), nullable=True)
+    message = db.Column(db.String(500), nullable=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    stats_json = db.Column(db.Text, nullable=True)
+    zip_path = db.Column(db.String(512), nullable=True)
+    # False for streaming-only jobs: no ZIP is built, the files are kept at
+    # files_root and zipped as they are downloaded
+    archive = db.Column(db.Boolean, nullable=False, default=True, server_default='1')
+    files_root = db.Column(db.String(512), nullable=True)
+    # Number of pages in the preview index, once it has been built
+    pages_indexed = db.Column(db.Integer, nullable=True)
+    # Set once the archive is in the result cache, which evicts by last access
+    archive_size = db.Column(db.BigInteger, nullable=True)
+    last_accessed_at = db.Column(db.DateTime, nullable=True, index=True)
+    error = db.Column(db.Text, nullable=True)
+    # Crawl worker that leased the job, as host:pid:slot
+    worker_id = db.Column(db.String(100), nullable=True)
+    # The lease is renewed by heartbeats; once it expires the job is re-queued
+    lease_expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    user = db.relationship('User', backref=db.backref('crawl_tasks', lazy='dynamic'))
+    
+    def __repr__(self):
+        return f"<CrawlTask {self.id} {self.status}>"
+    
+    @property
+    def stats(self):
+        """Crawl statistics as last reported by the crawler"""
+        return json.loads(self.stats_json) if self.stats_json else {}
+    
+    @stats.setter
+    def stats(self, value):
+        self.stats_json = json.dumps(value)
+    
+    @property
+    def start_time(self):
+        """Creation time as a Unix timestamp"""
+        return self.created_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+class CrawlPage(db.Model):
+    """A page saved by a crawl, indexed so previews don't have to read the files"""
+    __tablename__ = 'crawl_pages'
+    __table_args__ = (
+        db.Index('ix_crawl_pages_task_id', 'task_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.String(36), db.ForeignKey('crawl_tasks.id', ondelete='CASCADE'), nullable=False)
+    # Path of the page inside the archive
+    path = db.Column(db.String(1024), nullable=False)
+    url = db.Column(db.String(2048), nullable=True)
+    title = db.Column(db.String(300), nullable=True)
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "url": self.url,
+            "title": self.title or self.path,
+            "size": self.size
+        }
+
+class CrawlSubscription(db.Model):
+    """A caller following a crawl job, so shared jobs are only cancelled or cleaned up by their last caller"""
+    __tablename__ = 'crawl_subscriptions'
+    __table_args__ = (
+        db.UniqueConstraint('task_id', 'owner', name='uq_crawl_subscriptions_task_owner'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.String(36), db.ForeignKey('crawl_tasks.id', ondelete='CASCADE'), nullable=False)
+    # "user:<id>" for signed-in and API callers, "addr:<ip>" for anonymous ones
+    owner = db.Column(db.String(80), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class Artifact(db.Model):
+    """A finished archive on disk, recorded when it is produced so listings needn't scan directories"""
+    __tablename__ = 'artifacts'
+    __table_args__ = (
+        db.Index('ix_artifacts_user_id', 'user_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # File name, unique because names carry a per-archive suffix
+    name = db.Column(db.String(255), unique=True, nullable=False)
+    path = db.Column(db.String(512), nullable=False)
+    url = db.Column(db.String(2048), nullable=True)
+    # Not a foreign key: the archive can outlive its task record
+    task_id = db.Column(db.String(36), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "url": self.url,
+            "task_id": self.task_id,
+            "size": self.size,
+            # Unix timestamp, like the file modification times listings used to show
+            "created_at": self.created_at.replace(tzinfo=datetime.timezone.utc).timestamp() if self.created_at else None
+        }
+
+class WorkerProcess(db.Model):
+    """A process running crawl workers, so limits shared by every worker can be split between them"""
+    __tablename__ = 'worker_processes'
+    
+    # "<host>:<pid>"
+    id = db.Column(db.String(100), primary_key=True)
+    started_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    # Fetch scheduler stats as last published by the process
+    stats_json = db.Column(db.Text, nullable=True)
+    
+    @property
+    def stats(self):
+        return json.loads(self.stats_json) if self.stats_json else {}
+    
+    @stats.setter
+    def stats(self, value):
+        self.stats_json = json.dumps(value)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "started_at": self.started_at.replace(tzinfo=datetime.timezone.utc).timestamp() if self.started_at else None,
+            "heartbeat_at": self.heartbeat_at.replace(tzinfo=datetime.timezone.utc).timestamp() if self.heartbeat_at else None,
+            "fetch_scheduler": self.stats
+        }
+
+class Counter(db.Model):
+    """A deployment-wide event counter, updated by whichever process did the work"""
+    __tablename__ = 'counters'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
@@ -0,0 +1,90 @@
+import logging
+
+from sqlalchemy import or_
+
+from models import db, CrawlTask, CrawlPage
+from manifest import read_manifest
+
+logger = logging.getLogger(__name__)
+
+# Page size for /preview, and the most one request may ask for
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+# Rows inserted per statement when building an index
+INSERT_BATCH = 1000
+
+
+def index_pages(task_id):
+    """
+    Build a completed task's preview index from the pages in its manifest.
+
+    Titles were taken from each page as it was saved, so this reads only the
+    manifest, never the pages themselves.
+
+    Returns:
+        int: Number of pages indexed, or None if the task hasn't completed
+        or has no manifest
+    """
+    task = db.session.get(CrawlTask, task_id, populate_existing=True)
+    if task is None or task.status != "completed":
+        return None
+    entries = read_manifest(task_id)
+    if entries is None:
+        return None
+
+    CrawlPage.query.filter_by(task_id=task_id).delete(synchronize_session=False)
+    rows = [{"task_id": task_id, "path": entry["path"][:1024], "url": entry["url"],
+             "title": entry["title"], "size": entry["size"]}
+            for entry in entries if entry["kind"] == 'html']
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(CrawlPage.__table__.insert(), rows[start:start + INSERT_BATCH])
+
+    CrawlTask.query.filter_by(id=task_id).update({"pages_indexed": len(rows)}, synchronize_session=False)
+    db.session.commit()
+    logger.info(f"Indexed {len(rows)} pages for task {task_id}")
+    return len(rows)
+
+
+def delete_pages(task_id):
+    """Drop a task's preview index; the caller commits."""
+    CrawlPage.query.filter_by(task_id=task_id).delete(synchronize_session=False)
+    CrawlTask.query.filter_by(id=task_id).update({"pages_indexed": None}, synchronize_session=False)
+
+
+def _like_pattern(q):
+    escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def query_pages(task_id, offset=0, limit=DEFAULT_PAGE_LIMIT, q=None):
+    """
+    One page of a task's indexed pages, in the order they were saved.
+
+    Args:
+        task_id (str): Task to list
+        offset (int): Pages to skip
+        limit (int): Pages to return, at most MAX_PAGE_LIMIT
+        q (str): Only pages whose title or path contains this, ignoring case
+
+    Returns:
+        dict: pages, total (matching pages), offset, limit, next_offset and q
+    """
+    offset = max(0, offset)
+    limit = max(1, min(limit, MAX_PAGE_LIMIT))
+    query = CrawlPage.query.filter_by(task_id=task_id)
+    if q:
+        pattern = _like_pattern(q)
+        query = query.filter(or_(CrawlPage.title.ilike(pattern, escape='\\'),
+                                 CrawlPage.path.ilike(pattern, escape='\\')))
+
+    total = query.count()
+    pages = query.order_by(CrawlPage.id).offset(offset).limit(limit).all()
+    return {
+        "pages": [page.to_dict() for page in pages],
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + limit if offset + limit < total else None,
+        "q": q
+    }
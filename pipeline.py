@@ -0,0 +1,143 @@
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Placed on a stage's queue once per worker to shut it down
+_STOP = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline: a pool of worker threads draining a bounded queue.
+
+    The handler is called with each item and returns the item to pass to the
+    next stage, or None when the item is finished. A full queue blocks the
+    stage upstream of it, which is what provides backpressure.
+
+    Args:
+        name (str): Stage name used in stats and logs
+        handler (callable): Function called with each item
+        workers (int): Number of worker threads
+        queue_size (int): Maximum items waiting in front of this stage
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=64):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.next_stage = None
+        self.on_complete = None
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # Stats for the frontend
+        self._processed = 0
+        self._errors = 0
+        self._busy = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def start(self):
+        """Start the worker threads."""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item):
+        """Queue an item for this stage, blocking while the queue is full."""
+        self.queue.put(item)
+
+    def stop(self):
+        """Let the workers finish the queued items, then wait for them to exit."""
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+
+            with self._lock:
+                self._busy += 1
+            start = time.perf_counter()
+            error = None
+            result = None
+            try:
+                result = self.handler(item)
+            except Exception as e:
+                # Reported to on_complete, which knows what the item was
+                error = e
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._busy -= 1
+                self._processed += 1
+                self._total_latency += elapsed
+                self._max_latency = max(self._max_latency, elapsed)
+                if error is not None:
+                    self._errors += 1
+
+            try:
+                if error is None and result is not None and self.next_stage is not None:
+                    self.next_stage.put(result)
+                elif self.on_complete is not None:
+                    self.on_complete(item if result is None else result, error)
+            except Exception as e:
+                logger.error(f"Pipeline stage {self.name} could not hand off item: {e}")
+
+    def get_stats(self):
+        """Queue depth, throughput and latency for this stage."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "busy_workers": self._busy,
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "processed": self._processed,
+                "errors": self._errors,
+                "avg_latency_ms": round(self._total_latency / self._processed * 1000, 2) if self._processed else 0.0,
+                "max_latency_ms": round(self._max_latency * 1000, 2)
+            }
+
+
+class Pipeline:
+    """
+    A chain of Stages connected by bounded queues.
+
+    Every item that enters the pipeline leaves it exactly once, through
+    on_complete(item, error): after the last stage, when a handler returns
+    None, or when a handler raises.
+    """
+
+    def __init__(self, stages, on_complete):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+        for stage in stages:
+            stage.on_complete = on_complete
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item):
+        """Feed an item into the first stage, blocking on backpressure."""
+        self.stages[0].put(item)
+
+    def stop(self):
+        """Drain and stop the stages in order."""
+        for stage in self.stages:
+            stage.stop()
+
+    def get_stats(self):
+        return {stage.name: stage.get_stats() for stage in self.stages}
@@ -0,0 +1,168 @@
+import os
+import shutil
+import logging
+import datetime
+from pathlib import Path
+
+from sqlalchemy import func
+
+from models import db, CrawlTask
+from task_registry import add_subscriber
+from manifest import remove_manifest, manifest_path
+from page_index import delete_pages
+from artifacts import forget_artifact
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Archives younger than this are served again instead of re-crawling,
+# unless a request asks for a different max_age
+RESULT_CACHE_MAX_AGE = int(os.environ.get("RESULT_CACHE_MAX_AGE", 3600))
+
+# Total size of cached archives kept on disk; least recently used ones are
+# evicted beyond this. 0 disables the cache.
+RESULT_CACHE_BUDGET_BYTES = int(os.environ.get("RESULT_CACHE_BUDGET_MB", 2048)) * 1024 * 1024
+
+temp_dir = Path("temp")
+
+
+def _cached_archives():
+    return CrawlTask.query.filter(CrawlTask.status == "completed", CrawlTask.archive_size.isnot(None))
+
+
+def find_cached_result(key, owner, max_age=RESULT_CACHE_MAX_AGE):
+    """
+    Look up a finished archive for a crawl key.
+
+    A hit counts as a use for LRU eviction and subscribes the caller to
+    the task like an in-flight join does.
+
+    Args:
+        key (str): Crawl key from jobs.crawl_key
+        owner (str): Subscription owner of the caller, from jobs.owner_key
+        max_age (int): Oldest acceptable archive, in seconds
+
+    Returns:
+        CrawlTask: The cached task, or None on a miss
+    """
+    if RESULT_CACHE_BUDGET_BYTES <= 0 or max_age <= 0:
+        return None
+
+    now = datetime.datetime.utcnow()
+    task = (_cached_archives()
+            .filter(CrawlTask.dedupe_key == key,
+                    CrawlTask.finished_at >= now - datetime.timedelta(seconds=max_age))
+            .order_by(CrawlTask.finished_at.desc())
+            .first())
+
+    if task is None or not task.zip_path or not os.path.exists(task.zip_path):
+        metrics.increment("result_cache.misses")
+        return None
+
+    CrawlTask.query.filter_by(id=task.id).update({"last_accessed_at": now}, synchronize_session=False)
+    add_subscriber(task.id, owner)
+    metrics.increment("result_cache.hits")
+    logger.info(f"Serving cached archive of {task.url} from task {task.id}")
+    return task
+
+
+def store_result(task_id):
+    """Add a just-finished task's archive to the cache, evicting others if needed."""
+    task = db.session.get(CrawlTask, task_id, populate_existing=True)
+    if task is None or task.status != "completed" or not task.zip_path or not os.path.exists(task.zip_path):
+        return
+
+    task.archive_size = os.path.getsize(task.zip_path)
+    task.last_accessed_at = datetime.datetime.utcnow()
+    db.session.commit()
+    enforce_budget()
+
+
+def enforce_budget(budget=None):
+    """
+    Evict least recently used archives until the cache fits its budget.
+
+    Returns:
+        int: Bytes reclaimed
+    """
+    budget = RESULT_CACHE_BUDGET_BYTES if budget is None else budget
+    total = _cached_archives().with_entities(func.coalesce(func.sum(CrawlTask.archive_size), 0)).scalar()
+    if total <= budget:
+        return 0
+
+    reclaimed = 0
+    evicted = 0
+    for task in _cached_archives().order_by(CrawlTask.last_accessed_at).all():
+        if total - reclaimed <= budget:
+            break
+        reclaimed += task.archive_size
+        evicted += 1
+        evict_task(task)
+
+    db.session.commit()
+    # Evictions happen in crawl workers, so count them where /metrics can see them
+    metrics.increment_total("result_cache.evictions", evicted)
+    metrics.increment_total("result_cache.evicted_bytes", reclaimed)
+    logger.info(f"Result cache over budget: evicted {reclaimed / (1024 * 1024):.1f} MB")
+    return reclaimed
+
+
+def tree_size(path):
+    """Total size of the files under path, or of path itself if it is a file."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def evict_task(task):
+    """
+    Delete a finished task's archive, working files, manifest and preview
+    index; the caller commits.
+
+    A completed task becomes expired; a failed one stays failed.
+
+    Returns:
+        int: Bytes freed on disk
+    """
+    freed = 0
+    try:
+        if task.zip_path and os.path.exists(task.zip_path):
+            freed += os.path.getsize(task.zip_path)
+            os.remove(task.zip_path)
+        forget_artifact(task.zip_path)
+        task_dir = temp_dir / task.id
+        if task_dir.exists():
+            freed += tree_size(task_dir)
+            shutil.rmtree(task_dir, ignore_errors=True)
+        if manifest_path(task.id).exists():
+            freed += manifest_path(task.id).stat().st_size
+        remove_manifest(task.id)
+    except OSError as e:
+        logger.error(f"Error evicting archive for task {task.id}: {e}")
+
+    delete_pages(task.id)
+    if task.status == "completed":
+        task.status = "expired"
+    task.zip_path = None
+    task.files_root = None
+    task.archive_size = None
+    return freed
+
+
+def cache_usage():
+    """Number and total size of cached archives, and the budget."""
+    count, total = _cached_archives().with_entities(
+        func.count(CrawlTask.id), func.coalesce(func.sum(CrawlTask.archive_size), 0)).one()
+    return {
+        "archives": count,
+        "bytes": total,
+        "budget_bytes": RESULT_CACHE_BUDGET_BYTES,
+        "default_max_age": RESULT_CACHE_MAX_AGE
+    }
@@ -1,7 +1,11 @@
-from flask import Flask, send_file, render_template_string
+from flask import Flask, render_template_string
 import os
 
+from artifacts import bind_database, latest_artifact
+from file_delivery import send_archive
+
 app = Flask(__name__)
+bind_database(app)
 
 HTML_TEMPLATE = """<!DOCTYPE html>
 <html>
@@ -69,34 +73,26 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 
 @app.route('/')
 def index():
-    # Find the latest zip file
-    zip_files = [f for f in os.listdir('.') if f.endswith('.zip')]
-    if not zip_files:
+    # The newest archive in the artifact registry
+    artifact = latest_artifact()
+    if artifact is None or not os.path.exists(artifact.path):
         return "No ZIP files found", 404
     
-    # Sort by modification time (newest first)
-    zip_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-    latest_zip = zip_files[0]
-    
     # Calculate size
-    size_kb = os.path.getsize(latest_zip) / 1024
+    size_kb = artifact.size / 1024
     
     return render_template_string(HTML_TEMPLATE, 
-                                 filename=latest_zip,
+                                 filename=artifact.name,
                                  size=f"{size_kb:.1f}")
 
 @app.route('/download')
 def download():
-    # Find the latest zip file
-    zip_files = [f for f in os.listdir('.') if f.endswith('.zip')]
-    if not zip_files:
+    # The newest archive in the artifact registry
+    artifact = latest_artifact()
+    if artifact is None or not os.path.exists(artifact.path):
         return "No ZIP files found", 404
     
-    # Sort by modification time (newest first)
-    zip_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-    latest_zip = zip_files[0]
-    
-    return send_file(latest_zip, as_attachment=True)
+    return send_archive(artifact.path)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
@@ -1,19 +1,21 @@
 #!/usr/bin/env python3
 import os
 import sys
-import subprocess
 import logging
 import time
 import urllib.parse
-import zipfile
 import shutil
 from pathlib import Path
 
+from wget_backend import mirror, manifest_recorder
+from manifest import ManifestWriter, record_tree, manifest_urls, summarize, write_archive
+from artifacts import new_archive_path
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def crawl_with_wget(url, task_id, output_dir):
+def crawl_with_wget(url, task_id, output_dir, progress_callback=None, cancel=None):
     """
     Uses wget to crawl a website and returns statistics about the crawl.
     
@@ -21,9 +23,12 @@ def crawl_with_wget(url, task_id, output_dir):
         url (str): The URL to crawl
         task_id (str): A unique ID for this crawl task
         output_dir (Path): Directory to save the crawled files
+        progress_callback (callable): Called with running stats while wget works
+        cancel (Cancellation): Stops wget; with finalize, what was saved is
+            still archived
         
     Returns:
-        dict: Statistics about the crawl
+        dict: Statistics about the crawl; status is "cancelled" after a cancel
     """
     try:
         # Make sure output directory exists
@@ -33,52 +38,29 @@ def crawl_with_wget(url, task_id, output_dir):
         parsed_url = urllib.parse.urlparse(url)
         domain = parsed_url.netloc
         
-        # Build wget command
-        cmd = [
-            'wget',
-            '--mirror',                 # Mirror the website
-            '--convert-links',          # Convert links to work locally
-            '--adjust-extension',       # Add extensions to files (.html)
-            '--page-requisites',        # Get all assets (CSS, JS, images)
-            '--no-parent',              # Don't go to parent directory
-            '--directory-prefix=' + str(output_dir),  # Output directory
-            '--no-verbose',             # Reduce output verbosity
-            url
-        ]
-        
         logger.info(f"Starting wget crawl for {url}")
-        logger.info(f"Command: {' '.join(cmd)}")
         
-        # Execute wget command
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        # Mirror the site, following wget's log as it runs; files are listed
+        # in the manifest as they are saved so snapshots can include them.
+        # A re-leased job keeps the entries of files the last attempt saved.
+        with ManifestWriter(task_id, append=True) as writer:
+            result = mirror(url, output_dir, progress_callback=progress_callback, cancel=cancel,
+                            on_saved=manifest_recorder(writer, output_dir, domain))
         
-        # Capture output before waiting
-        stdout, stderr = process.communicate()
+        # A killed wget's return code means nothing; keep a partial archive only if asked
+        cancelled = cancel is not None and cancel.is_set()
+        if cancelled and not cancel.finalize:
+            logger.info(f"wget crawl of {url} cancelled")
+            return {"status": "cancelled"}
         
         # Check if wget was successful
-        if process.returncode != 0:
-            logger.error(f"wget failed with return code {process.returncode}: {stderr}")
+        if result["returncode"] != 0 and not cancelled:
+            logger.error(f"wget failed with return code {result['returncode']}: {result['log_tail']}")
             return {
                 "status": "failed",
-                "error": f"wget failed with return code {process.returncode}"
+                "error": f"wget failed with return code {result['returncode']}"
             }
         
-        # Count files and categorize them
-        files_downloaded = 0
-        resources = {
-            'html': 0,
-            'css': 0,
-            'js': 0, 
-            'images': 0,
-            'fonts': 0,
-            'other': 0
-        }
-        
         # Find the domain directory (wget creates a directory structure)
         domain_dir = output_dir / domain
         if not domain_dir.exists():
@@ -91,25 +73,13 @@ def crawl_with_wget(url, task_id, output_dir):
         if not domain_dir.exists():
             domain_dir = output_dir
         
-        # Walk through the directory and count files
-        logger.info(f"Counting files in {domain_dir}")
-        for root, _, files in os.walk(domain_dir):
-            for file in files:
-                files_downloaded += 1
-                
-                # Update resource counts based on file extension
-                if file.endswith('.html') or file.endswith('.htm'):
-                    resources['html'] += 1
-                elif file.endswith('.css'):
-                    resources['css'] += 1
-                elif file.endswith('.js'):
-                    resources['js'] += 1
-                elif any(file.endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp']):
-                    resources['images'] += 1
-                elif any(file.endswith(ext) for ext in ['.woff', '.woff2', '.ttf', '.eot']):
-                    resources['fonts'] += 1
-                else:
-                    resources['other'] += 1
+        # Record every file once; counts and the archive come from the manifest
+        logger.info(f"Recording manifest of {domain_dir}")
+        entries = record_tree(task_id, domain_dir, manifest_urls(task_id),
+                              skip=("_redirects",))
+        summary = summarize(entries)
+        files_downloaded = summary["files"]
+        resources = summary["resources"]
         
         # Create _redirects file for Netlify
         redirects_path = domain_dir / "_redirects"
@@ -117,24 +87,17 @@ def crawl_with_wget(url, task_id, output_dir):
             f.write("/*    /index.html   404\n")
             
         # Create ZIP file
-        timestamp = int(time.time())
-        zip_filename = f"{domain.replace('.', '_')}_{timestamp}.zip"
-        zip_path = str(output_dir.parent / zip_filename)
+        zip_path = new_archive_path(domain, task_id)
         
         logger.info(f"Creating ZIP file at {zip_path}")
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # If domain directory exists, archive its contents
-            for root, _, files in os.walk(domain_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, domain_dir)
-                    zipf.write(file_path, arcname)
+        write_archive(zip_path, domain_dir, entries, {"_redirects": redirects_path})
         
         # Create success result
         result = {
-            "status": "completed",
+            "status": "cancelled" if cancelled else "completed",
             "zip_path": zip_path,
             "files_downloaded": files_downloaded,
+            "bytes_downloaded": summary["bytes"],
             "resources": resources
         }
         
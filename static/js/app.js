@@ -4,6 +4,7 @@
 let currentTaskId = null;
 let statusCheckInterval = null;
 let socket = null;
+let lastSocketUpdate = 0;
 
 // DOM elements
 const urlForm = document.getElementById('urlForm');
@@ -42,6 +43,7 @@ function initializeSocket() {
     socket.on('status_update', (data) => {
         console.log('Status update received:', data);
         if (data.task_id === currentTaskId) {
+            lastSocketUpdate = Date.now();
             updateProgress(data.message, data.progress, data.stats);
         }
     });
@@ -118,11 +120,10 @@ async function handleFormSubmit(event) {
             initialSection.classList.add('hidden');
             statusSection.classList.remove('hidden');
             
-            // If socket is connected, we'll get updates through it
-            // Otherwise, fall back to polling
-            if (!socket.connected) {
-                startStatusChecking();
-            }
+            // Crawls may run in a separate worker process that cannot reach
+            // this socket, so always poll; polling backs off while socket
+            // updates are arriving
+            startStatusChecking();
             
             // Update button state
             crawlButton.innerHTML = 'Crawling...';
@@ -154,11 +155,42 @@ function startStatusChecking() {
 async function checkStatus() {
     if (!currentTaskId) return;
     
+    // Socket updates are fresher; only poll when they have gone quiet
+    const socketActive = socket && socket.connected && Date.now() - lastSocketUpdate < 5000;
+    
     try {
         const response = await fetch(`/status/${currentTaskId}`);
         const data = await response.json();
         
         if (response.ok) {
+            if (data.status === 'failed') {
+                showError(data.error || 'Crawling failed');
+                clearInterval(statusCheckInterval);
+                crawlButton.disabled = false;
+                crawlButton.innerHTML = 'Crawl Website';
+                return;
+            }
+            
+            if (data.status === 'cancelled') {
+                clearInterval(statusCheckInterval);
+                updateProgress('Crawling cancelled', -1);
+                showCancelled(data.download_url);
+                crawlButton.disabled = false;
+                crawlButton.innerHTML = 'Crawl Website';
+                return;
+            }
+            
+            if (data.status === 'queued') {
+                if (!socketActive) {
+                    updateProgress(`Waiting for a crawl worker (position ${data.queue_position} in queue)...`, 0, data.crawled_urls);
+                }
+                return;
+            }
+            
+            if (socketActive && data.status !== 'completed') {
+                return;
+            }
+            
             // Calculate progress percentage
             let progress = Math.min(
                 Math.floor((data.crawled_urls.processed_urls / Math.max(1, data.crawled_urls.total_urls)) * 100),
@@ -280,6 +312,7 @@ async function handlePreview() {
             previewHtml += '</div>';
             previewHtml += `<div class="mt-3">
                 <p>Total files: <strong>${data.total_files}</strong></p>
+                ${data.total_pages !== undefined ? `<p>Showing ${data.pages.length} of <strong>${data.total_pages}</strong> pages</p>` : ''}
             </div>`;
             
             previewContent.innerHTML = previewHtml;
@@ -318,7 +351,7 @@ function showError(message) {
 }
 
 // Handle fast wget button click
-function handleFastWget() {
+async function handleFastWget() {
     const url = urlInput.value.trim();
     if (!url) {
         showError('Please enter a valid URL');
@@ -343,35 +376,85 @@ function handleFastWget() {
     fastWgetButton.disabled = true;
     fastWgetButton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Downloading...';
     
-    // Create a form for direct download
-    const form = document.createElement('form');
-    form.method = 'POST';
-    form.action = '/fast_wget';
-    
-    // Create the URL input
-    const urlField = document.createElement('input');
-    urlField.type = 'hidden';
-    urlField.name = 'url';
-    urlField.value = processedUrl;
-    
-    // Add to form and submit
-    form.appendChild(urlField);
-    document.body.appendChild(form);
-    
-    // Set a timeout to reset the button state and show a message if download doesn't start
-    setTimeout(() => {
-        fastWgetButton.disabled = false;
-        fastWgetButton.innerHTML = '<i class="fas fa-bolt me-2"></i>Instant Download with wget';
+    try {
+        const formData = new FormData();
+        formData.append('url', processedUrl);
         
-        // Show a message if it's taking too long
-        showError('If the download did not start, there might be an issue with the website URL or the server. Please try again.');
-    }, 10000);
-    
-    // Submit the form to trigger download
-    form.submit();
+        // The server queues the download and answers 202 with URLs to follow
+        const response = await fetch('/fast_wget', {
+            method: 'POST',
+            body: formData
+        });
+        const data = await response.json();
+        
+        if (!response.ok) {
+            showError(data.error || 'Failed to start the download');
+            resetFastWgetButton();
+            return;
+        }
+        
+        pollFastWget(data.status_url, data.download_url);
+    } catch (error) {
+        console.error('Error starting fast wget download:', error);
+        showError('Server error. Please try again.');
+        resetFastWgetButton();
+    }
+}
+
+// Poll a queued fast wget download and fetch the ZIP once it is ready
+function pollFastWget(statusUrl, downloadUrl) {
+    const interval = setInterval(async () => {
+        try {
+            const response = await fetch(statusUrl);
+            const data = await response.json();
+            
+            if (!response.ok || data.status === 'failed' || data.status === 'expired') {
+                clearInterval(interval);
+                showError(data.error || 'Failed to download website with wget. Please try a different website.');
+                resetFastWgetButton();
+            } else if (data.status === 'completed') {
+                clearInterval(interval);
+                window.location.href = downloadUrl;
+                resetFastWgetButton();
+            } else if (data.status === 'cancelled') {
+                clearInterval(interval);
+                showCancelled(data.download_url);
+                resetFastWgetButton();
+            }
+        } catch (error) {
+            console.error('Error checking fast wget status:', error);
+        }
+    }, 2000);
+}
+
+// Tell the user a job was cancelled, linking to the partial archive if the cancel kept one
+function showCancelled(downloadUrl) {
+    const notice = document.createElement('div');
+    notice.className = 'alert alert-warning alert-dismissible fade show';
+    notice.role = 'alert';
+    notice.append(downloadUrl ? 'The download was cancelled. ' : 'The download was cancelled.');
+    if (downloadUrl) {
+        const link = document.createElement('a');
+        link.href = downloadUrl;
+        link.className = 'alert-link';
+        link.textContent = 'Download what was saved';
+        notice.append(link);
+    }
+    const close = document.createElement('button');
+    close.type = 'button';
+    close.className = 'btn-close';
+    close.setAttribute('data-bs-dismiss', 'alert');
+    close.setAttribute('aria-label', 'Close');
+    notice.append(close);
     
-    // Clean up
-    document.body.removeChild(form);
+    const container = document.querySelector('.container');
+    container.insertBefore(notice, container.firstChild);
+}
+
+// Restore the fast wget button after a download finishes or fails
+function resetFastWgetButton() {
+    fastWgetButton.disabled = false;
+    fastWgetButton.innerHTML = '<i class="fas fa-bolt me-2"></i>Instant Download with wget';
 }
 
 // Reset UI state
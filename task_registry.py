@@ -0,0 +1,137 @@
+import json
+import time
+import logging
+import datetime
+import threading
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, CrawlTask, CrawlPage, CrawlSubscription
+
+logger = logging.getLogger(__name__)
+
+# Progress is written to the database at most this often per task
+PROGRESS_FLUSH_INTERVAL = 2.0
+
+
+def create_task(task_id, url, wget_mode=False, user_id=None, status="starting", **fields):
+    """Register a new crawl task and return it. Extra fields are CrawlTask columns."""
+    task = CrawlTask(id=task_id, url=url, wget_mode=wget_mode, user_id=user_id, status=status, **fields)
+    db.session.add(task)
+    db.session.commit()
+    return task
+
+
+def get_task(task_id):
+    """Look up a crawl task by ID, or None if there is no such task."""
+    return db.session.get(CrawlTask, task_id)
+
+
+def get_user_tasks(user_id, limit=50):
+    """Most recent crawl tasks for a user, newest first."""
+    return (CrawlTask.query
+            .filter_by(user_id=user_id)
+            .order_by(CrawlTask.created_at.desc())
+            .limit(limit)
+            .all())
+
+
+def update_task(task_id, **fields):
+    """
+    Update a crawl task in a single statement.
+
+    Accepts any CrawlTask column, plus 'stats' which is stored as JSON.
+    Returns False if the task no longer exists.
+    """
+    if "stats" in fields:
+        fields["stats_json"] = json.dumps(fields.pop("stats"))
+    fields["updated_at"] = datetime.datetime.utcnow()
+
+    updated = CrawlTask.query.filter_by(id=task_id).update(fields)
+    db.session.commit()
+    return bool(updated)
+
+
+def delete_task(task_id):
+    """Remove a crawl task record, its preview index and its subscriptions."""
+    CrawlPage.query.filter_by(task_id=task_id).delete()
+    CrawlSubscription.query.filter_by(task_id=task_id).delete()
+    CrawlTask.query.filter_by(id=task_id).delete()
+    db.session.commit()
+
+
+def count_subscribers(task_id):
+    """Refresh a task's subscriber count from its subscriptions; the caller commits."""
+    count = (select(func.count(CrawlSubscription.id))
+             .where(CrawlSubscription.task_id == task_id)
+             .scalar_subquery())
+    CrawlTask.query.filter_by(id=task_id).update({"subscribers": count}, synchronize_session=False)
+
+
+def add_subscriber(task_id, owner):
+    """
+    Subscribe a caller to a task.
+
+    A caller is subscribed at most once, however often they submit the
+    same crawl, so they can't add themselves twice and later release
+    someone else's place.
+    """
+    try:
+        if CrawlSubscription.query.filter_by(task_id=task_id, owner=owner).first() is None:
+            db.session.add(CrawlSubscription(task_id=task_id, owner=owner))
+            db.session.flush()
+            count_subscribers(task_id)
+        db.session.commit()
+    except IntegrityError:
+        # The same caller subscribed from another request just now
+        db.session.rollback()
+
+
+class ProgressRecorder:
+    """
+    Coalesces a crawl's progress updates into batched database writes.
+
+    Crawlers report progress for nearly every URL. Writing each report would
+    mean one commit per URL, so only the latest report is kept and written at
+    most once per interval, plus a final flush when the crawl ends.
+
+    Args:
+        app: Flask app, for an application context in crawler threads
+        task_id (str): Task to record progress for
+        interval (float): Minimum seconds between database writes
+    """
+
+    def __init__(self, app, task_id, interval=PROGRESS_FLUSH_INTERVAL):
+        self.app = app
+        self.task_id = task_id
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = None
+        self._last_flush = 0.0
+
+    def __call__(self, message, progress, stats):
+        """Record a progress report, writing it out if the interval has passed."""
+        with self._lock:
+            self._pending = {
+                "message": (message or "")[:500],
+                "progress": max(0, min(int(progress), 100)),
+                "stats": stats,
+            }
+            due = time.monotonic() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the latest unsaved progress report, if any."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._last_flush = time.monotonic()
+        if pending is None:
+            return
+
+        try:
+            with self.app.app_context():
+                update_task(self.task_id, **pending)
+        except Exception as e:
+            logger.error(f"Error recording progress for task {self.task_id}: {e}")
@@ -0,0 +1,17 @@
+import pytest
+from flask import Flask
+
+from models import db, create_schema
+
+
+@pytest.fixture
+def app():
+    """A bare app bound to an in-memory database, without the web routes or crawl workers."""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        create_schema()
+        yield app
+        db.session.remove()
+        db.drop_all()
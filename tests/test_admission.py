@@ -0,0 +1,94 @@
+import itertools
+
+import pytest
+
+import admission
+from admission import check_admission, too_busy_response
+from jobs import enqueue_job
+from task_registry import update_task
+
+
+@pytest.fixture(autouse=True)
+def caps(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_CRAWLS_PER_API_KEY", 2)
+    monkeypatch.setattr(admission, "MAX_CRAWLS_PER_USER", 2)
+    monkeypatch.setattr(admission, "MAX_QUEUED_CRAWLS", 10)
+
+
+_ids = itertools.count()
+
+
+def queue(count, **owner):
+    """Queue count crawls for an owner and return their task IDs."""
+    task_ids = [f"t{next(_ids)}" for _ in range(count)]
+    for task_id in task_ids:
+        enqueue_job(task_id, "http://example.com/", **owner)
+    return task_ids
+
+
+def test_admitted_under_every_cap(app):
+    queue(1, api_key_id=1, user_id=1)
+    assert check_admission(api_key_id=1, user_id=1) is None
+
+
+def test_api_key_cap(app):
+    queue(2, api_key_id=1, user_id=1)
+
+    rejection = check_admission(api_key_id=1, user_id=1)
+    assert rejection["reason"] == "api_key_limit"
+    # Another key of the same user has its own cap
+    assert check_admission(api_key_id=2, user_id=3) is None
+
+
+def test_user_cap(app):
+    queue(2, user_id=1)
+    assert check_admission(user_id=1)["reason"] == "user_limit"
+    assert check_admission(user_id=2) is None
+
+
+def test_anonymous_callers_are_capped_by_address(app):
+    queue(2, client_addr="10.0.0.1")
+
+    assert check_admission(client_addr="10.0.0.1")["reason"] == "user_limit"
+    assert check_admission(client_addr="10.0.0.2") is None
+    # A signed-in user behind the same address is counted by user instead
+    assert check_admission(user_id=1, client_addr="10.0.0.1") is None
+
+
+def test_finished_crawls_do_not_count(app):
+    done, failed = queue(2, user_id=1)
+    update_task(done, status="completed")
+    update_task(failed, status="failed")
+    assert check_admission(user_id=1) is None
+
+
+def test_running_crawls_count(app):
+    running, _ = queue(2, user_id=1)
+    update_task(running, status="crawling")
+    assert check_admission(user_id=1)["reason"] == "user_limit"
+
+
+def test_full_queue_refuses_everyone(app, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_QUEUED_CRAWLS", 3)
+    queue(1, user_id=1)
+    queue(1, user_id=2)
+    queue(1, client_addr="10.0.0.1")
+
+    rejection = check_admission(user_id=9)
+    assert rejection["reason"] == "queue_full"
+    assert rejection["queue_position"] == 4
+    assert rejection["crawl_slots"]["queued"] == 3
+
+
+def test_rejection_is_a_429_with_retry_after_and_queue_position(app, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_QUEUED_CRAWLS", 1)
+    queue(1, user_id=1)
+
+    response = too_busy_response(check_admission(user_id=2))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(admission.RETRY_AFTER_SECONDS)
+    body = response.get_json()
+    assert body["reason"] == "queue_full"
+    assert body["queue_position"] == 2
+    assert body["retry_after"] == admission.RETRY_AFTER_SECONDS
+    assert "queue is full" in body["error"]
@@ -0,0 +1,100 @@
+import os
+import zipfile
+
+import pytest
+
+import archive_reader
+from archive_reader import ArchiveReader, get_reader
+
+PAGE = b"<html><body>" + b"hello " * 5000 + b"</body></html>"
+IMAGE = bytes(range(256)) * 600
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "site.zip"
+    with zipfile.ZipFile(path, "w") as zipf:
+        zipf.writestr("index.html", PAGE, compress_type=zipfile.ZIP_DEFLATED)
+        zipf.writestr("docs/index.html", b"<p>docs</p>", compress_type=zipfile.ZIP_DEFLATED)
+        # A long extra field moves the data away from the fixed header size
+        info = zipfile.ZipInfo("images/logo-1a2b3c4d.png")
+        info.extra = b"\x99\x99\x04\x00abcd"
+        zipf.writestr(info, IMAGE, compress_type=zipfile.ZIP_STORED)
+        zipf.writestr("data", b"{}", compress_type=zipfile.ZIP_STORED)
+        zipf.writestr("empty/", b"")
+    return str(path)
+
+
+def test_central_directory_lists_files_only(archive):
+    reader = ArchiveReader(archive)
+    assert sorted(reader.entries) == ["data", "docs/index.html", "images/logo-1a2b3c4d.png", "index.html"]
+    reader.close()
+
+
+def test_find_resolves_directories_to_their_index(archive):
+    reader = ArchiveReader(archive)
+    assert reader.find("") == "index.html"
+    assert reader.find("/docs/") == "docs/index.html"
+    assert reader.find("images/logo-1a2b3c4d.png") == "images/logo-1a2b3c4d.png"
+    assert reader.find("missing.html") is None
+    assert reader.is_directory("docs")
+    assert not reader.is_directory("images")
+    reader.close()
+
+
+def test_stored_and_deflated_entries_stream_their_contents(archive, monkeypatch):
+    monkeypatch.setattr(archive_reader, "STREAM_CHUNK_BYTES", 4096)
+    reader = ArchiveReader(archive)
+    assert reader.entries["images/logo-1a2b3c4d.png"].compress_type == zipfile.ZIP_STORED
+    chunks = list(reader.iter_file("images/logo-1a2b3c4d.png"))
+    assert b"".join(chunks) == IMAGE
+    assert all(len(chunk) <= 4096 for chunk in chunks)
+    assert b"".join(reader.iter_file("index.html")) == PAGE
+    assert b"".join(reader.iter_file("data")) == b"{}"
+    reader.close()
+
+
+def test_mime_types_prefer_the_manifest(archive):
+    reader = ArchiveReader(archive, {"data": "application/json"})
+    assert reader.mime_type("data") == "application/json"
+    assert reader.mime_type("index.html") == "text/html"
+    assert reader.mime_type("images/logo-1a2b3c4d.png") == "image/png"
+    reader.close()
+
+
+def test_etag_changes_with_the_contents(archive, tmp_path):
+    other = tmp_path / "other.zip"
+    with zipfile.ZipFile(other, "w") as zipf:
+        zipf.writestr("index.html", b"<p>changed</p>")
+    assert ArchiveReader(archive).etag("index.html") != ArchiveReader(str(other)).etag("index.html")
+
+
+def test_reader_cache_reuses_evicts_and_reopens(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_reader, "_readers", archive_reader.OrderedDict())
+    monkeypatch.setattr(archive_reader, "READER_CACHE_SIZE", 2)
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / f"{name}.zip"
+        with zipfile.ZipFile(path, "w") as zipf:
+            zipf.writestr("index.html", name)
+        paths.append(str(path))
+
+    loads = []
+    first = get_reader(paths[0], lambda: loads.append("a") or {})
+    assert get_reader(paths[0], lambda: loads.append("a") or {}) is first
+    assert loads == ["a"]
+
+    get_reader(paths[1])
+    get_reader(paths[0])
+    get_reader(paths[2])
+    # b was the least recently used
+    assert [key[0] for key in archive_reader._readers] == [paths[0], paths[2]]
+    assert get_reader(paths[0]) is first
+
+    # A rewritten archive is opened afresh
+    with zipfile.ZipFile(paths[0], "w") as zipf:
+        zipf.writestr("index.html", "rewritten, and longer")
+    os.utime(paths[0], ns=(0, 10 ** 9))
+    reopened = get_reader(paths[0])
+    assert reopened is not first
+    assert b"".join(reopened.iter_file("index.html")) == b"rewritten, and longer"
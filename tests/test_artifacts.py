@@ -0,0 +1,35 @@
+import os
+
+from artifacts import new_archive_path, register_task_artifact, list_artifacts
+from models import CrawlTask
+
+
+def finished(tmp_path, task_id, status, archive=True):
+    zip_path = None
+    if archive:
+        zip_path = tmp_path / f"{task_id}.zip"
+        zip_path.write_bytes(b"PK")
+    return CrawlTask(id=task_id, url=f"http://{task_id}/", status=status,
+                     zip_path=str(zip_path) if zip_path else None)
+
+
+def test_completed_and_finalized_cancelled_archives_are_registered(app, tmp_path):
+    assert register_task_artifact(finished(tmp_path, "done", "completed")).task_id == "done"
+    assert register_task_artifact(finished(tmp_path, "partial", "cancelled")).task_id == "partial"
+
+    assert register_task_artifact(finished(tmp_path, "discarded", "cancelled", archive=False)) is None
+    assert register_task_artifact(finished(tmp_path, "broken", "failed")) is None
+    assert register_task_artifact(None) is None
+
+    assert sorted(artifact["task_id"] for artifact in list_artifacts()["artifacts"]) == ["done", "partial"]
+
+
+def test_new_archive_path_is_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("artifacts.ARCHIVE_DIR", "archives")
+
+    path = new_archive_path("example.com:8080", "abc-def-123")
+    assert os.path.isabs(path)
+    assert os.path.dirname(path) == str(tmp_path / "archives")
+    assert os.path.basename(path).startswith("example_com_8080_")
+    assert path.endswith("_abcdef12.zip")
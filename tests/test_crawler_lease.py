@@ -0,0 +1,96 @@
+import json
+import time
+import functools
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+from crawler import WebCrawler, CRAWL_STATE_FILE
+from manifest import read_manifest
+
+PAGES = 40
+
+
+class _SlowSite(SimpleHTTPRequestHandler):
+    """Serves an index linking to PAGES pages, each taking a while to send."""
+
+    def do_GET(self):
+        if self.path == "/":
+            body = "".join(f'<a href="p{i}.html">{i}</a>' for i in range(PAGES))
+        else:
+            time.sleep(0.05)
+            body = f"<html><title>{self.path}</title></html>"
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _SocketIO:
+    def emit(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_SlowSite))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("artifacts.ARCHIVE_DIR", str(tmp_path / "archives"))
+    return tmp_path
+
+
+def test_abandoned_crawl_leaves_the_new_holders_state_alone(site, workdir):
+    reports = []
+    crawler = WebCrawler(site, "t1", _SocketIO(), throttle_delay=0, fetch_workers=2,
+                         progress_callback=lambda message, progress, stats: reports.append(message))
+    thread = threading.Thread(target=crawler.start_crawling)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while crawler.file_count < 5:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    # The job was re-leased: the new holder has checkpointed in the same directory
+    state_path = crawler.task_dir / CRAWL_STATE_FILE
+    state_path.write_text(json.dumps({"start_url": site, "holder": "new"}))
+    crawler.abandon()
+    reported = len(reports)
+    thread.join(10)
+
+    assert crawler.status == "abandoned"
+    assert json.loads(state_path.read_text())["holder"] == "new"
+    assert crawler.get_zip_path() is None
+    assert not list(crawler.task_dir.rglob("*.part"))
+    # Every manifest entry is a whole file; nothing was left half written
+    for entry in read_manifest("t1"):
+        assert (crawler.task_dir / entry["path"]).stat().st_size == entry["size"]
+    assert crawler.file_count < PAGES
+    # No final "stopped" report overwrites the new holder's progress
+    assert len(reports) <= reported + 1
+    assert not any("stopped" in message or "cancelled" in message for message in reports)
+
+
+def test_stopped_crawl_checkpoints_for_a_resume(site, workdir):
+    crawler = WebCrawler(site, "t2", _SocketIO(), throttle_delay=0, fetch_workers=2)
+    thread = threading.Thread(target=crawler.start_crawling)
+    thread.start()
+    while crawler.file_count < 5:
+        time.sleep(0.01)
+    crawler.stop()
+    thread.join(10)
+
+    assert crawler.status == "stopped"
+    assert json.loads((crawler.task_dir / CRAWL_STATE_FILE).read_text())["start_url"] == site
@@ -0,0 +1,153 @@
+import re
+import zipfile
+import functools
+import posixpath
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+from crawler import WebCrawler, relative_link
+
+SITE = {
+    "index.html": '<html><head><link rel="stylesheet" href="/css/site.css"><title>Home</title></head><body>'
+                  '<img src="img/logo.png"><a href="/docs/">Docs</a><a href="about.html#team">About</a>'
+                  '<a href="https://elsewhere.example/">Out</a></body></html>',
+    "about.html": '<html><body style="background: url(img/bg.png?v=2)"><a href="/">Home</a>'
+                  '<a href="docs/guide.html">Guide</a></body></html>',
+    "docs/index.html": '<html><head><link rel="stylesheet" href="../css/site.css"></head><body>'
+                       '<a href="guide.html">Guide</a><img src="/img/logo.png"></body></html>',
+    "docs/guide.html": '<html><body><a href="../about.html">About</a><a href="./">Docs</a></body></html>',
+    "css/site.css": '@import "more.css"; body { background: url(../img/bg.png) }',
+    "css/more.css": "h1 { background: url('/img/logo.png') } @font-face { src: url(../fonts/a.woff2) }",
+    "img/logo.png": b"\x89PNG logo",
+    "img/bg.png": b"\x89PNG bg",
+    "fonts/a.woff2": b"wOF2",
+}
+
+_LINK_RE = re.compile(r'''(?:href|src)="([^"]*)"|url\(\s*['"]?([^'")]*)|@import\s+"([^"]*)"''')
+
+
+class _Quiet(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _SocketIO:
+    def emit(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    root = tmp_path / "site"
+    for path, content in SITE.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(content, bytes):
+            (root / path).write_bytes(content)
+        else:
+            (root / path).write_text(content)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_Quiet, directory=str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("artifacts.ARCHIVE_DIR", str(tmp_path / "archives"))
+    return tmp_path
+
+
+def test_relative_link():
+    assert relative_link("css/a.css", "index.html") == "css/a.css"
+    assert relative_link("css/a.css", "docs/guide/index.html") == "../../css/a.css"
+    assert relative_link("images/b.png", "css/a.css") == "../images/b.png"
+    assert relative_link("index.html", "index.html") == "index.html"
+
+
+def test_every_rewritten_link_resolves_inside_the_archive(site, workdir):
+    crawler = WebCrawler(site, "t1", _SocketIO(), throttle_delay=0)
+    crawler.start_crawling()
+    assert crawler.status == "completed"
+
+    with zipfile.ZipFile(crawler.get_zip_path()) as zipf:
+        names = set(zipf.namelist())
+        documents = [name for name in names if name.endswith((".html", ".css"))]
+        # Every file of the site was saved, bg.png twice as it is also linked with a query
+        assert len(names - {"_redirects"}) == len(SITE) + 1
+
+        checked = 0
+        for document in documents:
+            text = zipf.read(document).decode()
+            for match in _LINK_RE.finditer(text):
+                link = next(group for group in match.groups() if group is not None)
+                if link.startswith("https://elsewhere.example"):
+                    continue
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(document), link.split("#")[0]))
+                assert target in names, f"{link} in {document}"
+                checked += 1
+        assert checked >= 15
+
+        index = zipf.read("index.html").decode()
+        assert 'href="about.html#team"' in index
+        assert 'href="https://elsewhere.example/"' in index
+
+
+PAGES = [
+    "http://example.com/",
+    "http://example.com/docs/guide.html",
+    "http://example.com/docs/guide.html?lang=fr&next=/a/b/",
+    "http://example.com/docs/intro.html?v=2#top",
+    "http://example.com/docs/deep/page?x=1",
+    "http://example.com/docs",
+]
+
+HREFS = ["about.html", "../about.html", "../../../x.html", "./", "sub/../y.html", "?page=2", "#team",
+         "/css/a.css", "/../b.html", "//example.com/c.html", "..", "img/logo.png?v=3#x", "https://other.example/"]
+
+
+def test_cached_resolution_matches_resolving_each_page(workdir):
+    crawler = WebCrawler("http://example.com/", "t1", _SocketIO())
+
+    # Every page is resolved twice, so the second round is all cache hits
+    for _ in range(2):
+        for page in PAGES:
+            for href in HREFS:
+                cached = crawler._resolve_link(crawler._resolution_base(page, href), href, False)
+                assert cached == crawler._resolve_link_uncached(page, href, False), (page, href)
+
+    assert crawler.get_resolve_cache_stats()["hits"] >= len(PAGES) * len(HREFS)
+
+
+def test_resolution_is_keyed_on_directory_or_origin(workdir):
+    crawler = WebCrawler("http://example.com/", "t1", _SocketIO())
+    base = crawler._resolution_base
+
+    # The page's query and fragment don't change where relative links point
+    assert base("http://example.com/docs/a.html?next=/x/y/", "b.html") == "http://example.com/docs/"
+    assert base("http://example.com/docs/b.html#top", "../c.html") == "http://example.com/docs/"
+    assert base("http://example.com/docs", "b.html") == "http://example.com/"
+    assert base("http://example.com", "b.html") == "http://example.com/"
+    # Root-relative links resolve the same from every page on the host
+    assert base("http://example.com/docs/deep/a.html?q=1", "/b.html") == "http://example.com/"
+    assert base("http://example.com/docs/a.html", "//example.com/b.html") == "http://example.com/docs/"
+    # Query- and fragment-only links depend on the whole page URL
+    assert base("http://example.com/docs/a.html?x=1", "?x=2") == "http://example.com/docs/a.html?x=1"
+    assert base("http://example.com/docs/a.html", "#top") == "http://example.com/docs/a.html"
+
+
+def test_query_only_links_are_not_shared_between_pages(workdir):
+    crawler = WebCrawler("http://example.com/", "t1", _SocketIO())
+
+    first = crawler._resolve_link(crawler._resolution_base("http://example.com/a.html", "?p=2"), "?p=2", True)
+    second = crawler._resolve_link(crawler._resolution_base("http://example.com/b.html", "?p=2"), "?p=2", True)
+    assert first[0] == "http://example.com/a.html?p=2"
+    assert second[0] == "http://example.com/b.html?p=2"
+
+    # Pages in one directory share the entry for a relative link, whatever their query
+    for page in ("http://example.com/docs/a.html?x=1", "http://example.com/docs/b.html?x=2"):
+        resolved = crawler._resolve_link(crawler._resolution_base(page, "../up.html"), "../up.html", True)
+        assert resolved[0] == "http://example.com/up.html"
+    assert crawler.get_resolve_cache_stats()["hits"] == 1
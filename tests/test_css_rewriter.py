@@ -0,0 +1,36 @@
+import pytest
+
+from css_rewriter import rewrite_css
+
+
+def prefix(url):
+    return "local/" + url
+
+
+@pytest.mark.parametrize("css", [
+    "body { color: red }",
+    "/* url(a.png) @import 'b.css'; */ p { content: \"url(c.png)\" }",
+    "a { background: url() }",
+])
+def test_css_without_references_is_untouched(css):
+    assert rewrite_css(css, prefix) == css
+
+
+def test_rewrites_every_reference_form_keeping_quotes():
+    css = ('@import "a.css"; @import \'b.css\';\n'
+           'p { background: url(c.png) } q { background: URL( "d.png" ) } r { src: url(\'e.woff\') }')
+    assert rewrite_css(css, prefix) == (
+        '@import "local/a.css"; @import \'local/b.css\';\n'
+        'p { background: url(local/c.png) } q { background: URL( "local/d.png" ) } '
+        'r { src: url(\'local/e.woff\') }')
+
+
+def test_none_leaves_a_reference_alone():
+    css = "p { background: url(data:image/png;base64,AAAA) } q { background: url(x.png) }"
+    rewritten = rewrite_css(css, lambda url: None if url.startswith("data:") else prefix(url))
+    assert rewritten == "p { background: url(data:image/png;base64,AAAA) } q { background: url(local/x.png) }"
+
+
+def test_bytes_in_bytes_out():
+    css = "p::before { content: \"é\" } p { background: url(x.png) }".encode("latin-1")
+    assert rewrite_css(css, prefix) == "p::before { content: \"é\" } p { background: url(local/x.png) }".encode("latin-1")
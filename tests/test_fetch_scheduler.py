@@ -0,0 +1,144 @@
+import time
+import datetime
+import threading
+
+import pytest
+
+import worker_registry
+from fetch_scheduler import FetchScheduler
+from worker_registry import beat, leave, live_processes, fetch_share, publish
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def queue_fetches(scheduler, task_id, count, order):
+    """Start count threads that each take one connection, note the grant and give it back."""
+    def fetch():
+        with scheduler.connection(task_id):
+            order.append(task_id)
+
+    waiting = scheduler.get_stats()["waiting"]
+    threads = []
+    for _ in range(count):
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        threads.append(thread)
+        # One at a time, so the queue order is the start order
+        waiting += 1
+        wait_for(lambda: scheduler.get_stats()["waiting"] == waiting)
+    return threads
+
+
+def test_connections_are_shared_by_weight():
+    scheduler = FetchScheduler(connections=1)
+    scheduler.register("heavy", weight=2)
+    scheduler.register("light", weight=1)
+    scheduler.acquire("holder")
+
+    order = []
+    threads = queue_fetches(scheduler, "heavy", 6, order) + queue_fetches(scheduler, "light", 6, order)
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join()
+
+    # While both are backlogged, heavy gets two grants for each of light's
+    assert order[:6].count("heavy") == 4
+    assert order[:9].count("heavy") == 6
+    assert scheduler.get_flow_stats("heavy")["fetches"] == 6
+
+
+def test_new_crawl_is_not_queued_behind_a_backlog():
+    scheduler = FetchScheduler(connections=1)
+    scheduler.acquire("holder")
+
+    order = []
+    threads = queue_fetches(scheduler, "big", 10, order) + queue_fetches(scheduler, "small", 1, order)
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join()
+
+    assert order.index("small") <= 1
+
+
+def test_fetches_in_flight_never_exceed_the_budget():
+    scheduler = FetchScheduler(connections=3)
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def fetch(task_id):
+        with scheduler.connection(task_id):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.005)
+            with lock:
+                in_flight[0] -= 1
+
+    threads = [threading.Thread(target=fetch, args=(f"t{i % 4}",)) for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 3
+    stats = scheduler.get_stats()
+    assert (stats["active"], stats["waiting"]) == (0, 0)
+
+
+def test_raising_the_budget_wakes_waiting_fetches():
+    scheduler = FetchScheduler(connections=1)
+    scheduler.acquire("holder")
+    order = []
+    threads = queue_fetches(scheduler, "t", 2, order)
+
+    scheduler.set_connections(3)
+    for thread in threads:
+        thread.join()
+    assert order == ["t", "t"]
+    scheduler.release("holder")
+
+    scheduler.set_connections(0)
+    assert scheduler.connections == 1
+
+
+def test_fetch_budget_is_split_between_live_processes(monkeypatch):
+    monkeypatch.setattr(worker_registry, "FETCH_CONNECTIONS", 8)
+    assert fetch_share(1) == 8
+    assert fetch_share(3) == 2
+    assert fetch_share(0) == 8
+    # Every process keeps a connection, even past the budget
+    assert fetch_share(20) == 1
+
+
+def test_registry_counts_live_processes_and_drops_stale_ones(app):
+    now = datetime.datetime.utcnow()
+    stale = now - datetime.timedelta(seconds=worker_registry.PROCESS_TIMEOUT + 1)
+
+    assert beat("old:1", {}, now=stale) == 1
+    assert beat("a:1", {"active": 1}, now=now) == 1
+    assert beat("b:2", {"active": 2}, now=now) == 2
+    assert [row.id for row in live_processes(now)] == ["a:1", "b:2"]
+
+    leave("a:1")
+    assert [row.id for row in live_processes(now)] == ["b:2"]
+
+
+def test_publish_takes_a_share_and_reports_scheduler_stats(app, monkeypatch):
+    scheduler = FetchScheduler(connections=8)
+    monkeypatch.setattr(worker_registry, "fetch_scheduler", scheduler)
+    monkeypatch.setattr(worker_registry, "FETCH_CONNECTIONS", 8)
+    beat("other:1", {})
+    scheduler.register("task-1", weight=2)
+
+    assert publish("me:1") == 2
+    assert scheduler.connections == 4
+    metrics = worker_registry.fetch_metrics()
+    assert metrics["connections"] == 8
+    mine = next(p for p in metrics["processes"] if p["id"] == "me:1")
+    assert mine["fetch_scheduler"]["crawls"]["task-1"]["weight"] == pytest.approx(2.0)
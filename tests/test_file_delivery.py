@@ -0,0 +1,122 @@
+import os
+
+import pytest
+from flask import Flask
+
+import file_delivery
+from file_delivery import send_archive
+
+BODY = bytes(range(256)) * 40
+
+
+class RecordingFileWrapper:
+    """A wsgi.file_wrapper that notes each file it is given, then reads it to EOF as servers do."""
+
+    def __init__(self):
+        self.files = []
+
+    def __call__(self, f, block_size=8192):
+        self.files.append(f)
+        return iter(lambda: f.read(block_size), b'')
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "archives" / "site.zip"
+    path.parent.mkdir()
+    path.write_bytes(BODY)
+    return str(path)
+
+
+@pytest.fixture
+def client(archive):
+    app = Flask(__name__)
+    app.add_url_rule('/download', 'download', lambda: send_archive(archive))
+    return app.test_client()
+
+
+@pytest.fixture
+def file_wrapper(client):
+    wrapper = RecordingFileWrapper()
+    client.environ_base["wsgi.file_wrapper"] = wrapper
+    return wrapper
+
+
+def test_full_download_goes_through_the_file_wrapper(client, file_wrapper):
+    response = client.get('/download')
+
+    assert response.status_code == 200
+    assert response.data == BODY
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=site.zip'
+    assert len(file_wrapper.files) == 1
+
+
+def test_range_sends_only_its_bytes(client, file_wrapper):
+    response = client.get('/download', headers={'Range': 'bytes=100-199'})
+
+    assert response.status_code == 206
+    assert response.data == BODY[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(BODY)}'
+    assert response.headers['Content-Length'] == '100'
+    # The server's file wrapper reads to EOF; the range must still stop at 199
+    assert len(file_wrapper.files) == 1
+
+
+def test_resumed_download_with_if_range(client):
+    etag = client.get('/download').headers['ETag']
+
+    response = client.get('/download', headers={'Range': f'bytes={len(BODY) - 10}-', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == BODY[-10:]
+
+    # A changed archive is sent whole
+    response = client.get('/download', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == BODY
+
+
+def test_unchanged_archive_is_not_modified(client):
+    first = client.get('/download')
+
+    response = client.get('/download', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get('/download', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert response.status_code == 304
+
+
+def test_unsatisfiable_range(client):
+    response = client.get('/download', headers={'Range': f'bytes={len(BODY) + 10}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(BODY)}'
+
+
+def test_x_sendfile_offload(client, archive, monkeypatch):
+    monkeypatch.setattr(file_delivery, "ARCHIVE_OFFLOAD", "x-sendfile")
+
+    response = client.get('/download')
+    assert response.status_code == 200
+    assert response.headers['X-Sendfile'] == os.path.abspath(archive)
+    assert response.headers['Content-Type'] == 'application/zip'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="site.zip"'
+    assert response.data == b''
+
+
+def test_x_accel_redirect_offload(client, archive, monkeypatch):
+    monkeypatch.setattr(file_delivery, "ARCHIVE_OFFLOAD", "x-accel-redirect")
+    monkeypatch.setattr(file_delivery, "ARCHIVE_OFFLOAD_ROOT", os.path.dirname(archive))
+
+    response = client.get('/download')
+    assert response.headers['X-Accel-Redirect'] == '/_archives/site.zip'
+    assert response.data == b''
+
+
+def test_x_accel_redirect_outside_the_root_is_sent_from_the_app(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_delivery, "ARCHIVE_OFFLOAD", "x-accel-redirect")
+    monkeypatch.setattr(file_delivery, "ARCHIVE_OFFLOAD_ROOT", str(tmp_path / "elsewhere"))
+
+    response = client.get('/download')
+    assert 'X-Accel-Redirect' not in response.headers
+    assert response.data == BODY
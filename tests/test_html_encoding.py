@@ -0,0 +1,80 @@
+import codecs
+
+import pytest
+
+import crawler
+from crawler import detect_html_encoding, sniff_html_encoding
+
+TEXT = "Les élèves ont réussi leur épreuve à côté du château."
+META_LATIN1 = b'<html><head><meta charset="iso-8859-1"></head>'
+META_HTTP_EQUIV = b'<meta http-equiv="Content-Type" content="text/html; charset=windows-1251">'
+
+
+@pytest.fixture
+def detections(monkeypatch):
+    """Record each body that goes through full charset detection."""
+    calls = []
+    from_bytes = crawler.charset_normalizer.from_bytes
+
+    def spy(body):
+        calls.append(body)
+        return from_bytes(body)
+
+    monkeypatch.setattr(crawler.charset_normalizer, "from_bytes", spy)
+    return calls
+
+
+def test_header_beats_bom_and_meta():
+    body = codecs.BOM_UTF8 + META_LATIN1
+    assert detect_html_encoding("text/html; charset=Shift_JIS", body) == "shift_jis"
+    assert detect_html_encoding('text/html; charset="koi8-r"', body) == "koi8-r"
+
+
+def test_unknown_header_charset_falls_through_to_the_bom():
+    body = codecs.BOM_UTF8 + META_LATIN1
+    assert detect_html_encoding("text/html; charset=no-such-codec", body) == "utf-8-sig"
+    assert detect_html_encoding("text/html", body) == "utf-8-sig"
+
+
+def test_bom_beats_meta():
+    assert detect_html_encoding("", codecs.BOM_UTF16_LE + META_LATIN1) == "utf-16-le"
+    assert detect_html_encoding("", codecs.BOM_UTF16_BE + META_LATIN1) == "utf-16-be"
+    # The UTF-32 LE BOM starts with the UTF-16 LE one
+    assert detect_html_encoding("", codecs.BOM_UTF32_LE + META_LATIN1) == "utf-32-le"
+
+
+def test_meta_when_nothing_else_declares_it():
+    assert detect_html_encoding("text/html", META_LATIN1) == "iso8859-1"
+    assert detect_html_encoding(None, META_HTTP_EQUIV) == "cp1251"
+    # A meta tag readable as ASCII can't be in UTF-16
+    assert detect_html_encoding("", b'<meta charset="utf-16">') == "utf-8"
+
+
+def test_meta_past_the_sniffed_head_is_ignored():
+    body = b"<!--" + b" " * crawler.CHARSET_SNIFF_BYTES + b"-->" + META_LATIN1
+    assert detect_html_encoding("text/html", body) is None
+
+
+def test_declared_encodings_skip_detection(detections):
+    body = TEXT.encode("cp1252")
+    assert sniff_html_encoding("text/html; charset=windows-1252", body) == "cp1252"
+    assert sniff_html_encoding("text/html", codecs.BOM_UTF8 + body) == "utf-8-sig"
+    assert sniff_html_encoding("text/html", META_LATIN1 + body) == "iso8859-1"
+    assert detections == []
+
+
+def test_undeclared_utf8_skips_detection(detections):
+    body = TEXT.encode("utf-8")
+    assert sniff_html_encoding("text/html", body) == "utf-8"
+    # A multi-byte character cut off at the end of the chunk is still UTF-8
+    assert sniff_html_encoding("text/html", body[:body.index("é".encode()) + 1]) == "utf-8"
+    assert detections == []
+
+
+def test_detection_is_the_last_resort(detections):
+    body = TEXT.encode("cp1252")
+    encoding = sniff_html_encoding("text/html", body)
+
+    assert detections == [body]
+    assert encoding != "utf-8"
+    body.decode(encoding)
@@ -0,0 +1,59 @@
+import io
+
+import pytest
+
+from html_rewriter import HTMLRewriter
+
+
+def rewrite(document, rewrite_page=None, rewrite_resource=None, chunk_size=None):
+    out = io.StringIO()
+    rewriter = HTMLRewriter(out, rewrite_page or (lambda url: None), rewrite_resource or (lambda url: None))
+    if chunk_size:
+        for start in range(0, len(document), chunk_size):
+            rewriter.feed(document[start:start + chunk_size])
+    else:
+        rewriter.feed(document)
+    rewriter.close()
+    return out.getvalue(), rewriter
+
+
+@pytest.mark.parametrize("document", [
+    '<!DOCTYPE html><html><head><title>A &amp; B</title></head><body><p class="x">Hi &#169;</p></body></html>',
+    '<svg><![CDATA[ x < y ]]></svg>',
+    '<!--[if IE]><p>old</p><![endif]-->',
+    '<![if !IE]><p>a</p><![endif]>',
+    '<?xml version="1.0"?><p>pi</p>',
+    '<script>if (a < b) { document.write("</p>"); }</script>',
+])
+def test_untouched_documents_round_trip(document):
+    assert rewrite(document)[0] == document
+
+
+def test_cdata_round_trips_when_fed_in_chunks():
+    document = '<svg><style><![CDATA[ .a { fill: red } ]]></style><![CDATA[ raw ]]></svg>'
+    assert rewrite(document, chunk_size=3)[0] == document
+
+
+def test_rewrites_url_attributes_srcset_and_inline_styles():
+    document = ('<a href="/page">p</a><img src="/a.png" srcset="/a.png 1x, /b.png 2x">'
+                '<div style="background: url(/bg.png)"></div>')
+    output, _ = rewrite(document,
+                        rewrite_page=lambda url: "page.html",
+                        rewrite_resource=lambda url: "local" + url)
+    assert 'href="page.html"' in output
+    assert 'src="local/a.png"' in output
+    assert 'srcset="local/a.png 1x, local/b.png 2x"' in output
+    assert 'url(local/bg.png)' in output or 'url("local/bg.png")' in output
+
+
+def test_rewrites_style_blocks_split_across_feeds():
+    document = '<style>body { background: url("/bg.png") }</style>'
+    output, _ = rewrite(document, rewrite_resource=lambda url: "local" + url, chunk_size=5)
+    assert 'local/bg.png' in output
+    assert '</style>' in output
+
+
+def test_records_first_title():
+    _, rewriter = rewrite('<title>First &amp; best</title><title>Second</title>')
+    assert 'First' in rewriter.title
+    assert 'Second' not in rewriter.title
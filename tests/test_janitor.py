@@ -0,0 +1,134 @@
+import os
+import time
+import datetime
+
+import pytest
+
+import janitor
+import metrics
+from models import db, CrawlTask
+from task_registry import get_task
+from worker_registry import beat, is_leader
+
+NOW = datetime.datetime.utcnow()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in a scratch directory, so temp/ and archives/ are the test's own."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(janitor, "ARCHIVE_DIR", "archives")
+    os.makedirs("temp")
+    os.makedirs("archives")
+    return tmp_path
+
+
+def add_task(task_id, status="completed", age=0, archive_bytes=0, files_bytes=0):
+    """A finished task last used age seconds ago, with an archive and working files of the given sizes."""
+    used = NOW - datetime.timedelta(seconds=age)
+    task = CrawlTask(id=task_id, url=f"http://{task_id}/", status=status,
+                     finished_at=used, last_accessed_at=used)
+    if archive_bytes:
+        task.zip_path = os.path.join("archives", f"{task_id}.zip")
+        write(task.zip_path, archive_bytes)
+    if files_bytes:
+        write(os.path.join("temp", task_id, "index.html"), files_bytes)
+    db.session.add(task)
+    db.session.commit()
+    return task
+
+
+def write(path, size, age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+
+
+def test_ttl_expires_unused_tasks(app, workdir, monkeypatch):
+    monkeypatch.setattr(janitor, "JANITOR_TASK_TTL", 3600)
+    add_task("stale", age=7200, archive_bytes=100, files_bytes=50)
+    add_task("fresh", age=60, archive_bytes=100)
+    add_task("failed", status="failed", age=7200, files_bytes=30)
+    add_task("running", status="crawling", age=7200, files_bytes=40)
+
+    assert janitor.expire_stale_tasks(NOW) == 180
+
+    assert get_task("stale").status == "expired"
+    assert not os.path.exists("archives/stale.zip") and not os.path.exists("temp/stale")
+    assert get_task("failed").status == "failed"
+    assert not os.path.exists("temp/failed")
+    assert os.path.exists("archives/fresh.zip")
+    assert os.path.exists("temp/running")
+    assert metrics.get_totals() == {"janitor.evicted_tasks": 2, "janitor.reclaimed_bytes": 180}
+
+
+def test_quota_evicts_least_recently_used_first(app, workdir, monkeypatch):
+    monkeypatch.setattr(janitor, "JANITOR_DISK_QUOTA_BYTES", 250)
+    add_task("oldest", age=300, archive_bytes=100)
+    add_task("older", age=200, archive_bytes=100)
+    add_task("newest", age=100, archive_bytes=100)
+    add_task("running", status="crawling", files_bytes=100)
+
+    # 400 bytes in use: the two least recently used go, the running task stays
+    assert janitor.enforce_quota() == 200
+    assert [get_task(t).status for t in ("oldest", "older", "newest", "running")] == \
+        ["expired", "expired", "completed", "crawling"]
+    assert janitor.disk_usage() == 200
+
+
+def test_quota_is_left_alone_when_it_fits(app, workdir, monkeypatch):
+    monkeypatch.setattr(janitor, "JANITOR_DISK_QUOTA_BYTES", 1000)
+    add_task("a", archive_bytes=100)
+    assert janitor.enforce_quota() == 0
+    assert get_task("a").status == "completed"
+
+
+def test_orphans_are_removed_once_old(app, workdir, monkeypatch):
+    monkeypatch.setattr(janitor, "JANITOR_ORPHAN_AGE", 3600)
+    add_task("kept", archive_bytes=10)
+    write("temp/deleted-task/index.html", 20, age=7200)
+    write("temp/deleted-task.manifest.jsonl", 5, age=7200)
+    write("archives/stray.zip", 30, age=7200)
+    write("temp/new-task/index.html", 40)
+    write("archives/new.zip", 50)
+    os.utime("temp/deleted-task", (time.time() - 7200,) * 2)
+
+    assert janitor.purge_orphans(NOW) == 55
+
+    assert sorted(os.listdir("temp")) == ["new-task"]
+    assert sorted(os.listdir("archives")) == ["kept.zip", "new.zip"]
+    assert metrics.get_totals()["janitor.orphans_removed"] == 3
+
+
+def test_totals_accumulate_across_calls(app):
+    metrics.increment_total("x", 2)
+    metrics.increment_total("x", 3)
+    metrics.increment_total("y", 0)
+    assert metrics.get_totals() == {"x": 5}
+
+
+def test_only_the_oldest_process_sweeps(app, workdir, monkeypatch):
+    beat("first:1", {}, now=NOW - datetime.timedelta(seconds=5))
+    beat("first:1", {})
+    beat("second:2", {})
+    assert is_leader("first:1")
+    assert not is_leader("second:2")
+
+    sweeps = []
+    monkeypatch.setattr(janitor, "sweep", lambda: sweeps.append(1))
+
+    class Once:
+        """A stop event that lets the loop run one sweep."""
+        calls = 0
+
+        def wait(self, timeout):
+            self.calls += 1
+            return self.calls > 1
+
+    janitor.janitor_loop(app, Once(), interval=0, proc_id="second:2")
+    assert sweeps == []
+    janitor.janitor_loop(app, Once(), interval=0, proc_id="first:1")
+    assert sweeps == [1]
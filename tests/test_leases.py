@@ -0,0 +1,78 @@
+import datetime
+
+import jobs
+from jobs import enqueue_job, lease_job, heartbeat, finish_job, reap_expired_leases
+from task_registry import get_task
+from models import db
+
+
+def expire(task_id):
+    get_task(task_id).lease_expires_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_jobs_are_leased_oldest_first_and_once(app):
+    enqueue_job("a", "http://a/")
+    enqueue_job("b", "http://b/")
+
+    assert lease_job("w1").id == "a"
+    assert lease_job("w2").id == "b"
+    assert lease_job("w3") is None
+    task = get_task("a")
+    assert (task.status, task.worker_id, task.attempts) == ("starting", "w1", 1)
+
+
+def test_no_lease_while_every_slot_is_taken(app, monkeypatch):
+    monkeypatch.setattr(jobs, "CRAWL_SLOTS", 1)
+    enqueue_job("a", "http://a/")
+    enqueue_job("b", "http://b/")
+    assert lease_job("w1").id == "a"
+    assert lease_job("w2") is None
+    assert get_task("b").status == "queued"
+
+
+def test_expired_lease_is_requeued_and_the_old_worker_locked_out(app):
+    enqueue_job("a", "http://a/")
+    lease_job("w1")
+    expire("a")
+
+    assert reap_expired_leases() == 1
+    assert get_task("a").status == "queued"
+    assert not heartbeat("a", "w1")
+
+    assert lease_job("w2").id == "a"
+    assert get_task("a").attempts == 2
+    assert not finish_job("a", "w1", status="completed")
+    assert finish_job("a", "w2", status="completed")
+    assert get_task("a").status == "completed"
+
+
+def test_live_leases_are_left_alone(app):
+    enqueue_job("a", "http://a/")
+    lease_job("w1")
+    assert reap_expired_leases() == 0
+    assert heartbeat("a", "w1")
+    assert get_task("a").status == "starting"
+
+
+def test_job_that_keeps_losing_its_worker_is_failed(app, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_JOB_ATTEMPTS", 2)
+    enqueue_job("a", "http://a/")
+    for worker_id in ("w1", "w2"):
+        lease_job(worker_id)
+        expire("a")
+        reap_expired_leases()
+
+    task = get_task("a")
+    assert task.status == "failed"
+    assert task.error == "Crawl worker stopped responding"
+
+
+def test_expired_job_with_a_cancel_request_is_cancelled(app):
+    enqueue_job("a", "http://a/")
+    lease_job("w1")
+    get_task("a").cancel_requested = "discard"
+    expire("a")
+
+    assert reap_expired_leases() == 0
+    assert get_task("a").status == "cancelled"
@@ -0,0 +1,66 @@
+import pytest
+
+import manifest
+from manifest import ManifestWriter, read_manifest, record_tree, summarize, manifest_urls
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "temp_dir", tmp_path)
+    return tmp_path
+
+
+def test_missing_manifest_reads_as_none():
+    assert read_manifest("nope") is None
+
+
+def test_latest_entry_for_a_path_wins_in_first_saved_order():
+    with ManifestWriter("t") as writer:
+        writer.add("index.html", "http://x/", size=1)
+        writer.add("a.css", "http://x/a.css", size=2)
+        writer.add("index.html", "http://x/", size=3, title="Home")
+
+    entries = read_manifest("t")
+    assert [entry["path"] for entry in entries] == ["index.html", "a.css"]
+    assert entries[0]["size"] == 3 and entries[0]["title"] == "Home"
+    assert summarize(entries) == {"files": 2, "bytes": 5,
+                                  "resources": {**manifest.empty_resources(), "html": 1, "css": 1}}
+
+
+def test_appending_keeps_an_earlier_attempts_entries():
+    with ManifestWriter("t") as writer:
+        writer.add("a.css", size=1)
+    with ManifestWriter("t", append=True) as writer:
+        writer.add("b.js", size=2)
+    assert [entry["path"] for entry in read_manifest("t")] == ["a.css", "b.js"]
+
+
+def test_manifest_urls_maps_recorded_paths_to_their_urls():
+    assert manifest_urls("nope") == {}
+    with ManifestWriter("t") as writer:
+        writer.add("index.html", "http://x/", size=1)
+        writer.add("_redirects", size=2)
+        writer.add("a.css", "http://x/a.css?v=2", size=3)
+    assert manifest_urls("t") == {"index.html": "http://x/", "a.css": "http://x/a.css?v=2"}
+
+
+def test_partial_last_line_is_skipped(temp_dir):
+    with ManifestWriter("t") as writer:
+        writer.add("a.css", size=1)
+    with open(manifest.manifest_path("t"), "a") as f:
+        f.write('{"path": "b.')
+    assert [entry["path"] for entry in read_manifest("t")] == ["a.css"]
+
+
+def test_record_tree_replaces_the_size_only_entries(temp_dir):
+    root = temp_dir / "site"
+    root.mkdir()
+    (root / "index.html").write_text("<title> Hello\n world </title>")
+    with ManifestWriter("t") as writer:
+        writer.add("index.html", "http://x/", size=0)
+
+    record_tree("t", root, {"index.html": "http://x/"})
+    [entry] = read_manifest("t")
+    assert entry["title"] == "Hello world"
+    assert entry["size"] == len("<title> Hello\n world </title>")
+    assert entry["sha256"]
@@ -0,0 +1,95 @@
+import time
+import threading
+from collections import Counter
+
+from pipeline import Stage, Pipeline
+
+
+class Completions:
+    """An on_complete callback that records each item and error it is given."""
+
+    def __init__(self):
+        self.items = Counter()
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, item, error):
+        with self._lock:
+            self.items[item] += 1
+            if error is not None:
+                self.errors[item] = error
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_every_item_completes_exactly_once():
+    def check(n):
+        if n % 5 == 0:
+            raise ValueError(n)
+        return None if n % 3 == 0 else n
+
+    done = Completions()
+    pipeline = Pipeline([Stage("first", lambda n: n, workers=3, queue_size=4),
+                         Stage("check", check, workers=2, queue_size=4),
+                         Stage("last", lambda n: n, workers=3, queue_size=4)], done)
+    pipeline.start()
+    for n in range(1, 101):
+        pipeline.put(n)
+    pipeline.stop()
+
+    # Finished after the last stage, dropped by check, or failed in it: once each
+    assert done.items == Counter(range(1, 101))
+    assert sorted(done.errors) == list(range(5, 101, 5))
+    stats = pipeline.get_stats()
+    assert stats["first"]["processed"] == stats["check"]["processed"] == 100
+    assert stats["check"]["errors"] == 20
+    assert stats["last"]["processed"] == 100 - 20 - 27
+    assert all(stage["queue_depth"] == 0 for stage in stats.values())
+
+
+def test_stop_drains_queued_items_before_returning():
+    done = Completions()
+    pipeline = Pipeline([Stage("slow", lambda n: time.sleep(0.01) or n, queue_size=20),
+                         Stage("store", lambda n: None, queue_size=20)], done)
+    pipeline.start()
+    for n in range(20):
+        pipeline.put(n)
+    pipeline.stop()
+
+    assert done.items == Counter(range(20))
+    assert all(not stage._threads for stage in pipeline.stages)
+
+
+def test_full_stage_queue_blocks_the_stages_upstream():
+    release = threading.Event()
+    done = Completions()
+    first = Stage("first", lambda n: n, queue_size=1)
+    blocked = Stage("blocked", lambda n: release.wait() and None, queue_size=1)
+    pipeline = Pipeline([first, blocked], done)
+    pipeline.start()
+
+    fed = []
+
+    def feed():
+        for n in range(10):
+            pipeline.put(n)
+            fed.append(n)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    # One item in each stage's handler or hand-off, one in each queue, then the feeder waits
+    wait_until(lambda: first.queue.full() and blocked.queue.full())
+    time.sleep(0.1)
+    assert feeder.is_alive()
+    assert len(fed) == 4
+    assert not done.items
+
+    release.set()
+    feeder.join(5)
+    pipeline.stop()
+    assert done.items == Counter(range(10))
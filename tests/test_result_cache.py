@@ -0,0 +1,96 @@
+import os
+import datetime
+
+import pytest
+
+import metrics
+import result_cache
+from result_cache import find_cached_result, enforce_budget, evict_task
+from task_registry import get_task
+from models import db, CrawlTask
+
+KEY = "k" * 64
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("archives")
+    return tmp_path
+
+
+def cached(task_id, finished_ago=0, used_ago=0, size=100, status="completed"):
+    """A finished task with an archive of size bytes in the cache."""
+    now = datetime.datetime.utcnow()
+    path = os.path.join("archives", f"{task_id}.zip")
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    task = CrawlTask(id=task_id, url="http://example.com/", dedupe_key=KEY, status=status,
+                     zip_path=path, archive_size=size,
+                     finished_at=now - datetime.timedelta(seconds=finished_ago),
+                     last_accessed_at=now - datetime.timedelta(seconds=used_ago))
+    db.session.add(task)
+    db.session.commit()
+    return task
+
+
+def test_hit_only_within_max_age(app, workdir):
+    cached("a", finished_ago=600)
+
+    assert find_cached_result(KEY, "addr:1", max_age=60) is None
+    assert find_cached_result(KEY, "addr:1", max_age=3600).id == "a"
+    assert find_cached_result(KEY, "addr:1", max_age=0) is None
+
+
+def test_hit_prefers_the_newest_archive_and_counts_as_use(app, workdir):
+    cached("old", finished_ago=300, used_ago=300)
+    cached("new", finished_ago=100, used_ago=100)
+
+    assert find_cached_result(KEY, "addr:1").id == "new"
+    db.session.expire_all()
+    assert get_task("new").last_accessed_at > get_task("old").last_accessed_at
+    assert get_task("new").subscribers == 1
+
+
+def test_missing_archive_is_a_miss(app, workdir):
+    os.remove(cached("a").zip_path)
+    assert find_cached_result(KEY, "addr:1") is None
+
+
+def test_budget_evicts_least_recently_used_first(app, workdir):
+    cached("used-first", used_ago=300)
+    cached("used-last", used_ago=10)
+    cached("used-second", used_ago=200)
+
+    assert enforce_budget(budget=150) == 200
+
+    statuses = {task_id: get_task(task_id).status for task_id in ("used-first", "used-second", "used-last")}
+    assert statuses == {"used-first": "expired", "used-second": "expired", "used-last": "completed"}
+    assert sorted(os.listdir("archives")) == ["used-last.zip"]
+    assert metrics.get_totals() == {"result_cache.evicted_bytes": 200, "result_cache.evictions": 2}
+
+
+def test_budget_not_exceeded_evicts_nothing(app, workdir):
+    cached("a")
+    assert enforce_budget(budget=100) == 0
+    assert metrics.get_totals() == {}
+
+
+def test_evicting_completed_task_expires_it(app, workdir, monkeypatch):
+    monkeypatch.setattr(result_cache, "temp_dir", workdir / "temp")
+    task = cached("a", size=40)
+    (workdir / "temp" / "a").mkdir(parents=True)
+    (workdir / "temp" / "a" / "index.html").write_bytes(b"y" * 10)
+
+    assert evict_task(task) == 50
+    db.session.commit()
+
+    task = get_task("a")
+    assert (task.status, task.zip_path, task.archive_size) == ("expired", None, None)
+    assert not (workdir / "temp" / "a").exists()
+
+
+def test_evicting_failed_task_keeps_it_failed(app, workdir):
+    task = cached("a", status="failed")
+    evict_task(task)
+    assert task.status == "failed"
@@ -0,0 +1,75 @@
+from jobs import enqueue_job, crawl_key, join_active_job, coalesce_job, owner_key, is_subscribed, release_subscriber
+from task_registry import add_subscriber, get_task, delete_task
+from models import CrawlSubscription
+
+URL = "http://example.com/"
+KEY = crawl_key(URL, "crawler")
+
+
+def submit(task_id, owner):
+    """What app.submit_crawl does for a caller that finds no job to join."""
+    enqueue_job(task_id, URL, dedupe_key=KEY)
+    add_subscriber(task_id, owner)
+    return coalesce_job(task_id, KEY, owner)
+
+
+def test_owner_key_prefers_the_user():
+    assert owner_key(user_id=3, api_key_id=7, client_addr="10.0.0.1") == "user:3"
+    assert owner_key(client_addr="10.0.0.1") == "addr:10.0.0.1"
+
+
+def test_joining_twice_subscribes_once(app):
+    submit("a", "addr:1")
+    assert join_active_job(KEY, "addr:2").id == "a"
+    assert join_active_job(KEY, "addr:2").id == "a"
+    assert get_task("a").subscribers == 2
+
+
+def test_coalescing_moves_the_loser_to_the_winner(app):
+    enqueue_job("a", URL, dedupe_key=KEY)
+    add_subscriber("a", "addr:1")
+    assert submit("b", "addr:2") == "a"
+    assert get_task("b") is None
+    assert CrawlSubscription.query.filter_by(task_id="b").count() == 0
+    assert get_task("a").subscribers == 2
+
+
+def test_release_only_detaches_the_callers_own_subscription(app):
+    submit("a", "addr:1")
+    join_active_job(KEY, "addr:2")
+
+    assert release_subscriber("a", "addr:1")
+    # Calling again doesn't eat into anyone else's subscription
+    assert not release_subscriber("a", "addr:1")
+    assert not is_subscribed("a", "addr:1")
+    assert get_task("a").subscribers == 1
+
+
+def test_last_subscriber_is_never_detached(app):
+    submit("a", "addr:1")
+    assert not release_subscriber("a", "addr:1")
+    assert is_subscribed("a", "addr:1")
+
+
+def test_strangers_are_not_subscribed(app):
+    submit("a", "addr:1")
+    assert not is_subscribed("a", "addr:9")
+    assert not release_subscriber("a", "addr:9")
+    assert get_task("a").subscribers == 1
+
+
+def test_jobs_without_subscriptions_are_open_to_everyone(app):
+    enqueue_job("legacy", URL)
+    assert is_subscribed("legacy", "addr:9")
+
+
+def test_delete_task_drops_subscriptions(app):
+    submit("a", "addr:1")
+    delete_task("a")
+    assert CrawlSubscription.query.count() == 0
+
+
+def test_jobs_without_subscriptions_belong_to_their_submitter(app):
+    enqueue_job("legacy", URL, client_addr="10.0.0.1")
+    assert is_subscribed("legacy", "addr:10.0.0.1")
+    assert not is_subscribed("legacy", "addr:10.0.0.2")
@@ -0,0 +1,125 @@
+import os
+import stat
+import textwrap
+
+import pytest
+
+import wget_backend
+from wget_backend import WgetProgress, Wget2Progress, mirror
+
+WGET_LOG = """\
+2024-05-01 10:00:00 URL:http://example.com/ [120/120] -> "out/example.com/index.html" [1]
+2024-05-01 10:00:00 URL: http://example.com/a.css [30] -> "out/example.com/a.css" [1]
+http://example.com/missing.png:
+2024-05-01 10:00:01 ERROR 404: Not Found.
+"""
+
+# wget2 in its default verbose mode, two threads interleaving; the second
+# thread's CSS and the first thread's page are saved out of order
+WGET2_LOG = """\
+[0] Downloading 'http://example.com/robots.txt' ...
+HTTP ERROR response 404 Not Found [http://example.com/robots.txt]
+[0] Downloading 'http://example.com/' ...
+Saving 'out/example.com/index.html'
+HTTP response 200 OK [http://example.com/]
+Adding URL: http://example.com/about
+Adding URL: http://example.com/css/a%20b.css?v=2
+[1] Downloading 'http://example.com/css/a%20b.css?v=2' ...
+[0] Downloading 'http://example.com/about' ...
+Saving 'out/example.com/about.html'
+Saving 'out/example.com/css/a b.css?v=2'
+HTTP response 200 OK [http://example.com/css/a%20b.css?v=2]
+HTTP response 200 OK [http://example.com/about]
+[1] Downloading 'http://example.com/old' ...
+HTTP response 301 Moved Permanently [http://example.com/old]
+[1] Downloading 'http://example.com/same.png' ...
+HTTP response 304 Not Modified [http://example.com/same.png]
+"""
+
+WGET2_FILES = {
+    "out/example.com/index.html": b"<p>home</p>",
+    "out/example.com/about.html": b"<p>about us</p>",
+    "out/example.com/css/a b.css?v=2": b"p{}",
+}
+
+
+def feed(progress, log):
+    return [progress.feed(line) for line in log.splitlines()]
+
+
+def write_files(root, files):
+    for path, content in files.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(content)
+
+
+def test_wget_log():
+    saved = []
+    progress = WgetProgress(on_saved=lambda url, path: saved.append((url, path)))
+    assert feed(progress, WGET_LOG) == [True, True, False, False]
+    assert saved == [("http://example.com/", "out/example.com/index.html"),
+                     ("http://example.com/a.css", "out/example.com/a.css")]
+    stats = progress.as_stats()
+    assert (stats["processed_urls"], stats["failed_urls"], stats["bytes_downloaded"]) == (2, 1, 150)
+    assert stats["resources"]["html"] == 1 and stats["resources"]["css"] == 1
+
+
+def test_wget2_log_pairs_interleaved_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, WGET2_FILES)
+    saved = []
+    progress = Wget2Progress(on_saved=lambda url, path: saved.append((url, path)))
+    feed(progress, WGET2_LOG)
+
+    assert saved == [("http://example.com/", "out/example.com/index.html"),
+                     ("http://example.com/css/a%20b.css?v=2", "out/example.com/css/a b.css?v=2"),
+                     ("http://example.com/about", "out/example.com/about.html")]
+    stats = progress.as_stats()
+    assert (stats["processed_urls"], stats["failed_urls"]) == (3, 1)
+    assert stats["bytes_downloaded"] == sum(len(content) for content in WGET2_FILES.values())
+    assert stats["last_url"] == "http://example.com/about"
+    # Nothing is held on to once downloads are done
+    assert progress._pending == {} and progress._done == set()
+
+
+def test_wget2_response_before_saving_line(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path, {"out/example.com/index.html": b"<p>home</p>"})
+    progress = Wget2Progress()
+    assert feed(progress, "[0] Downloading 'http://example.com/' ...\n"
+                          "HTTP response 200 OK [http://example.com/]\n"
+                          "Saving 'out/example.com/index.html'\n") == [False, False, True]
+    assert progress.as_stats()["bytes_downloaded"] == len(b"<p>home</p>")
+
+
+@pytest.fixture
+def fake_wget2(tmp_path, monkeypatch):
+    """A wget2 stand-in that prints WGET2_LOG to stdout and writes its files under --directory-prefix."""
+    script = tmp_path / "wget2"
+    log = WGET2_LOG.replace("out/", "$PREFIX/")
+    files = "\n".join(f"mkdir -p \"$PREFIX/{os.path.dirname(path[4:])}\"; printf '{content.decode()}' > \"$PREFIX/{path[4:]}\""
+                      for path, content in WGET2_FILES.items())
+    script.write_text(textwrap.dedent("""\
+        #!/bin/sh
+        case "$1" in
+          --version) echo "GNU Wget2 2.1.0 - multithreaded metalink/file/website downloader"; echo "+https +http2"; exit 0;;
+          --help) echo "--mirror --convert-links --adjust-extension --page-requisites --no-parent --max-threads --http2 --directory-prefix --timeout --tries"; exit 0;;
+        esac
+        for arg; do case "$arg" in --directory-prefix=*) PREFIX="${arg#--directory-prefix=}";; esac; done
+        """) + files + "\ncat <<EOF\n" + log + "EOF\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("WGET2_PATH", str(script))
+    wget_backend.probe_wget.cache_clear()
+    yield script
+    wget_backend.probe_wget.cache_clear()
+
+
+def test_mirror_uses_wget2_by_default(fake_wget2, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    saved = []
+    result = mirror("http://example.com/", tmp_path / "site", on_saved=lambda url, path: saved.append((url, path)))
+
+    assert result["strategy"] == "wget2"
+    assert result["returncode"] == 0
+    assert result["progress"]["processed_urls"] == 3
+    assert ("http://example.com/about", "example.com/about.html") in saved
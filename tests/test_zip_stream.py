@@ -0,0 +1,41 @@
+import io
+import zipfile
+
+from zip_stream import stream_zip
+
+
+def site(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "index.html").write_text("<p>" + "hello " * 10000 + "</p>")
+    (tmp_path / "css" / "a.css").write_text("p { color: red }")
+    (tmp_path / "logo.png").write_bytes(bytes(range(256)) * 64)
+    return [
+        {"path": "index.html", "size": (tmp_path / "index.html").stat().st_size, "kind": "html", "mime": "text/html"},
+        {"path": "css/a.css", "size": 16, "kind": "css", "mime": "text/css"},
+        {"path": "logo.png", "size": 256 * 64, "kind": "images", "mime": "image/png"},
+    ]
+
+
+def test_streamed_archive_opens_with_zipfile(tmp_path):
+    entries = site(tmp_path)
+    redirects = tmp_path / "_redirects"
+    redirects.write_text("/*    /index.html   404\n")
+
+    data = b"".join(stream_zip(str(tmp_path), entries, {"_redirects": str(redirects)}))
+    with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+        assert zipf.testzip() is None
+        assert sorted(zipf.namelist()) == ["_redirects", "css/a.css", "index.html", "logo.png"]
+        assert zipf.read("index.html") == (tmp_path / "index.html").read_bytes()
+        assert zipf.read("logo.png") == (tmp_path / "logo.png").read_bytes()
+        assert zipf.getinfo("index.html").compress_type == zipfile.ZIP_DEFLATED
+        assert zipf.getinfo("logo.png").compress_type == zipfile.ZIP_STORED
+
+
+def test_missing_and_resized_files_are_left_out(tmp_path):
+    entries = site(tmp_path)
+    entries.append({"path": "gone.html", "size": 1, "kind": "html", "mime": "text/html"})
+    entries[1]["size"] = 1
+
+    data = b"".join(stream_zip(str(tmp_path), entries, verify_sizes=True))
+    with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+        assert sorted(zipf.namelist()) == ["index.html", "logo.png"]
@@ -0,0 +1,832 @@
+"""
+Runs wget and follows its progress while it works.
+
+wget's log is read line by line as it streams instead of being buffered
+until exit, so callers get live file counts and memory stays flat however
+large the mirror is.
+
+Classic wget fetches one URL at a time, so mirror() parallelises: with
+wget2 installed it uses wget2's own threads, otherwise a site that
+publishes a sitemap is split across several wget processes whose outputs
+are merged into one tree. A sharded mirror fetches the sitemap's pages
+and their requisites without following links, and says so in its stats.
+WGET_USE_WGET2=0 and WGET_SHARD_SITEMAPS=0 turn either off.
+"""
+import os
+import re
+import time
+import signal
+import shutil
+import logging
+import threading
+import functools
+import subprocess
+import xml.etree.ElementTree as ET
+from collections import deque
+from urllib.parse import urlparse, urljoin, unquote
+
+import requests
+
+from crawler import url_directory
+from manifest import classify_path, empty_resources
+
+logger = logging.getLogger(__name__)
+
+# Lines of wget's log kept for error reporting
+LOG_TAIL_LINES = 50
+
+# Minimum seconds between progress callbacks
+PROGRESS_INTERVAL = 0.5
+
+# Download threads for wget2, and wget processes for a sharded mirror
+WGET2_THREADS = int(os.environ.get("WGET2_THREADS", 8))
+WGET_SHARDS = int(os.environ.get("WGET_SHARDS", 4))
+
+# Prefer wget2 over wget 1.x when both are installed
+WGET_USE_WGET2 = os.environ.get("WGET_USE_WGET2", "1").strip().lower() not in ("0", "false", "no")
+
+# Shard mirrors of sites with a sitemap when wget2 isn't used. A sharded
+# mirror only covers the pages the sitemap lists.
+WGET_SHARD_SITEMAPS = os.environ.get("WGET_SHARD_SITEMAPS", "1").strip().lower() not in ("0", "false", "no")
+
+# Sitemaps smaller than this aren't worth sharding; larger ones are capped
+WGET_SHARD_MIN_URLS = int(os.environ.get("WGET_SHARD_MIN_URLS", 20))
+WGET_SHARD_MAX_URLS = int(os.environ.get("WGET_SHARD_MAX_URLS", 50000))
+
+# Sitemap index files followed when discovering URLs
+MAX_SITEMAPS = 50
+
+# Seconds a cancelled wget gets to exit on SIGTERM before it is killed
+CANCEL_KILL_GRACE = 2.0
+
+# Flags shared by every mirroring strategy; the log level comes from
+# WgetBinary.log_args(), as the two flavors log saved files differently
+MIRROR_FLAGS = [
+    '--convert-links',          # Convert links to work locally
+    '--adjust-extension',       # Add extensions to files (.html)
+    '--page-requisites',        # Get all assets (CSS, JS, images)
+    '--no-parent',              # Don't go to parent directory
+]
+
+# With --no-verbose wget logs one line per saved file, e.g.
+#   2024-05-01 10:00:00 URL:https://example.com/a.css [1234/1234] -> "example.com/a.css" [1]
+_SAVED_RE = re.compile(r'URL: ?(?P<url>\S+) \[(?P<size>\d+)(?:/\d+)?\] -> "(?P<path>.*)" \[\d+\]')
+# ...and failures as the URL on its own line followed by the error
+_FAILED_URL_RE = re.compile(r'^(?P<url>\w+://\S+):$')
+_ERROR_RE = re.compile(r'ERROR (?P<code>\d+): (?P<reason>.*)')
+
+
+# wget2 only logs files in its default verbose mode, each as lines like
+#   [2] Downloading 'https://example.com/a.css' ...
+#   Saving 'example.com/a.css'
+#   HTTP response 200 OK [https://example.com/a.css]
+# from several threads at once, so a file's lines may be interleaved with
+# other files' lines. Failures are logged as "HTTP ERROR response 404 ...".
+_W2_DOWNLOADING_RE = re.compile(r"^\[\d+\] Downloading '(?P<url>[^']+)' \.\.\.")
+_W2_SAVING_RE = re.compile(r"^Saving '(?P<path>.+)'$")
+_W2_RESPONSE_RE = re.compile(r'^HTTP (?P<error>ERROR )?response (?P<code>\d+) (?P<reason>.*?) ?\[(?P<url>[^\]]+)\]$')
+
+
+class WgetProgress:
+    """Running totals parsed from a wget log."""
+
+    def __init__(self, on_saved=None):
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.resources = empty_resources()
+        self.last_url = None
+        self._failed_url = None
+        # Called with (url, path) as each file is saved
+        self.on_saved = on_saved
+
+    def record(self, url, path, size):
+        """Count one saved file."""
+        self.files += 1
+        self.bytes += size
+        self.resources[classify_path(path)] += 1
+        self.last_url = url
+        if self.on_saved is not None:
+            try:
+                self.on_saved(url, path)
+            except Exception as e:
+                logger.error(f"wget saved-file callback error: {e}")
+
+    def feed(self, line):
+        """Parse one log line. Returns True if it recorded a saved file."""
+        match = _SAVED_RE.search(line)
+        if match:
+            self.record(match.group('url'), match.group('path'), int(match.group('size')))
+            return True
+
+        match = _FAILED_URL_RE.match(line)
+        if match:
+            self._failed_url = match.group('url')
+            return False
+
+        match = _ERROR_RE.search(line)
+        if match:
+            self.errors += 1
+            logger.debug(f"wget: {self._failed_url or 'request'} failed with {match.group('code')} {match.group('reason')}")
+            self._failed_url = None
+        return False
+
+    def as_stats(self):
+        return {
+            "processed_urls": self.files,
+            "total_urls": self.files + self.errors,
+            "failed_urls": self.errors,
+            "bytes_downloaded": self.bytes,
+            "last_url": self.last_url,
+            "resources": dict(self.resources)
+        }
+
+
+class Wget2Progress(WgetProgress):
+    """
+    Running totals parsed from a wget2 log.
+
+    wget2 logs the file a response is saved to and the response's status
+    on separate lines, without sizes, and its threads' lines interleave. A
+    "Saving" line is matched to the download whose URL maps onto its path,
+    and the file is counted, at its size on disk, once the response line
+    for that URL says it is complete. Only downloads still in progress are
+    kept in memory.
+    """
+
+    def __init__(self, on_saved=None):
+        super().__init__(on_saved)
+        # URL -> saved path (None until its "Saving" line) of downloads in progress
+        self._pending = {}
+        # URLs whose successful response was logged before their "Saving" line
+        self._done = set()
+
+    def feed(self, line):
+        match = _W2_DOWNLOADING_RE.match(line)
+        if match:
+            self._pending.setdefault(match.group('url'), None)
+            return False
+
+        match = _W2_SAVING_RE.match(line)
+        if match:
+            path = match.group('path')
+            url = self._match_download(path)
+            if url is None:
+                return False
+            if url in self._done:
+                self._done.discard(url)
+                del self._pending[url]
+                self.record(url, path, self._size(path))
+                return True
+            self._pending[url] = path
+            return False
+
+        match = _W2_RESPONSE_RE.match(line)
+        if match:
+            url = match.group('url')
+            code = int(match.group('code'))
+            if match.group('error') or code >= 400:
+                self.errors += 1
+                self._pending.pop(url, None)
+                logger.debug(f"wget2: {url} failed with {code} {match.group('reason')}")
+                return False
+            path = self._pending.get(url)
+            if path is not None:
+                del self._pending[url]
+                self.record(url, path, self._size(path))
+                return True
+            if 200 <= code < 300 and url in self._pending:
+                self._done.add(url)
+            else:
+                # Redirects and unchanged files save nothing
+                self._pending.pop(url, None)
+        return False
+
+    def _match_download(self, path):
+        """The download in progress that wget2 saves to path, if any."""
+        candidates = [url for url, saved in self._pending.items() if saved is None]
+        for url in candidates:
+            if _path_matches_url(path, url):
+                return url
+        # With a single download in flight there is nothing to confuse it with
+        return candidates[0] if len(candidates) == 1 else None
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+
+def _path_matches_url(path, url):
+    """Whether wget would save url as path, give or take --directory-prefix and --adjust-extension."""
+    parsed = urlparse(url)
+    local = unquote(parsed.netloc + (parsed.path or '/'))
+    if local.endswith('/'):
+        local += 'index.html'
+    if parsed.query:
+        local += '?' + unquote(parsed.query)
+    path = path.replace(os.sep, '/')
+    for candidate in (path, os.path.splitext(path)[0]):
+        if candidate == local or candidate.endswith('/' + local):
+            return True
+    return False
+
+
+class Cancellation:
+    """
+    Cancels a mirror: kills the process group of every wget it runs.
+
+    wget runs in a session of its own, so killing the group also takes any
+    processes wget started. Processes started after cancel() are killed as
+    soon as they are attached.
+
+    finalize, set by cancel(), tells the caller whether to still archive
+    what was saved before the cancel.
+    """
+
+    def __init__(self):
+        self.finalize = False
+        self._event = threading.Event()
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def cancel(self, finalize=False):
+        self.finalize = finalize
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            _kill_group(process)
+
+    def attach(self, process):
+        with self._lock:
+            self._processes.add(process)
+        if self._event.is_set():
+            _kill_group(process)
+
+    def detach(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+
+def _kill_group(process):
+    """SIGTERM a process group, then SIGKILL it if it is still there after the grace period."""
+    def signal_group(sig):
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    if process.poll() is not None:
+        return
+    logger.info(f"Stopping wget process group {process.pid}")
+    signal_group(signal.SIGTERM)
+    timer = threading.Timer(CANCEL_KILL_GRACE, lambda: process.poll() is None and signal_group(signal.SIGKILL))
+    timer.daemon = True
+    timer.start()
+
+
+def run_wget(cmd, progress_callback=None, cwd=None, progress=None, cancel=None):
+    """
+    Run a wget command, parsing its log as it streams.
+
+    Args:
+        cmd (list): wget command line, including the binary's log_args()
+        progress_callback (callable): Called with WgetProgress.as_stats() as
+            files are saved, at most every PROGRESS_INTERVAL seconds
+        cwd (str): Working directory for wget
+        progress (WgetProgress): Totals to parse into, if not a fresh one
+        cancel (Cancellation): Kills wget when cancelled
+
+    Returns:
+        dict: returncode, progress (WgetProgress) and log_tail (last lines of the log)
+    """
+    progress = progress or WgetProgress()
+    tail = deque(maxlen=LOG_TAIL_LINES)
+    last_report = 0.0
+
+    logger.info(f"Running: {' '.join(cmd)}")
+
+    # wget logs to stderr and wget2 partly to stdout; nothing is downloaded
+    # to '-', so both are read as one log
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors='replace',
+        bufsize=1,
+        cwd=cwd,
+        start_new_session=True
+    )
+    if cancel is not None:
+        cancel.attach(process)
+    try:
+        for line in process.stdout:
+            line = line.rstrip('\n')
+            tail.append(line)
+            if progress.feed(line) and progress_callback:
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    try:
+                        progress_callback(progress.as_stats())
+                    except Exception as e:
+                        logger.error(f"wget progress callback error: {e}")
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        if cancel is not None:
+            cancel.detach(process)
+
+    if progress_callback:
+        try:
+            progress_callback(progress.as_stats())
+        except Exception as e:
+            logger.error(f"wget progress callback error: {e}")
+
+    logger.info(f"wget exited with {returncode}: {progress.files} files, "
+                f"{progress.bytes / (1024 * 1024):.1f} MB, {progress.errors} errors")
+    return {
+        "returncode": returncode,
+        "progress": progress,
+        "log_tail": os.linesep.join(tail)
+    }
+
+
+class WgetBinary:
+    """
+    A wget or wget2 binary and what it supports, from one --version/--help probe.
+
+    Args:
+        path (str): Absolute path of the binary
+        flavor (str): "wget" or "wget2"
+        version (str): Version number, e.g. "1.21.3"
+        features (set): Build features from --version, e.g. "https", "http2"
+        options (set): Long option names listed by --help
+    """
+
+    def __init__(self, path, flavor, version, features, options):
+        self.path = path
+        self.flavor = flavor
+        self.version = version
+        self.features = features
+        self.options = options
+
+    @property
+    def compression(self):
+        return 'compression' in self.options
+
+    @property
+    def http2(self):
+        return self.flavor == "wget2" and 'http2' in self.features | self.options
+
+    @property
+    def threads(self):
+        return 'max-threads' in self.options
+
+    def supports(self, flag):
+        """Whether a --long-option (with or without a value) is understood."""
+        name = flag[2:].split('=', 1)[0]
+        return name in self.options or (name.startswith('no-') and name[3:] in self.options)
+
+    def log_args(self):
+        """Log level at which each saved file is logged in the form its progress parser reads."""
+        # wget2 logs files only when verbose, which is its default
+        return [] if self.flavor == "wget2" else ['--no-verbose']
+
+    def new_progress(self, **kwargs):
+        """A progress parser for this binary's log."""
+        return (Wget2Progress if self.flavor == "wget2" else WgetProgress)(**kwargs)
+
+    def tuned_args(self):
+        """Flags worth adding for this binary's capabilities."""
+        args = []
+        if self.compression:
+            args.append('--compression=auto')
+        if self.threads:
+            args.append(f'--max-threads={WGET2_THREADS}')
+        if self.http2:
+            args.append('--http2')
+        return args
+
+    def command(self, *args):
+        """
+        Build a command line, refusing options this binary doesn't have.
+
+        Raises:
+            ValueError: If a --long-option is not supported
+        """
+        for arg in args:
+            if arg.startswith('--') and not self.supports(arg):
+                raise ValueError(f"{self.path} ({self.flavor} {self.version}) does not support {arg.split('=', 1)[0]}")
+        return [self.path, *args]
+
+    def as_dict(self):
+        return {
+            "path": self.path,
+            "flavor": self.flavor,
+            "version": self.version,
+            "compression": self.compression,
+            "http2": self.http2,
+            "threads": self.threads
+        }
+
+
+_VERSION_RE = re.compile(r'GNU Wget(2?) (\S+)')
+_FEATURE_RE = re.compile(r'(?<!\S)\+([a-z0-9/_-]+)')
+_OPTION_RE = re.compile(r'--(?:\[no-\])?([a-z0-9][a-z0-9-]*)')
+
+
+def _probe_binary(path):
+    try:
+        version_text = subprocess.run([path, '--version'], capture_output=True, text=True,
+                                      errors='replace', timeout=10).stdout
+        help_text = subprocess.run([path, '--help'], capture_output=True, text=True,
+                                   errors='replace', timeout=10).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not run {path}: {e}")
+        return None
+
+    match = _VERSION_RE.search(version_text)
+    if not match:
+        logger.warning(f"{path} does not look like GNU Wget")
+        return None
+    features = {feature.split('/', 1)[0] for feature in _FEATURE_RE.findall(version_text)}
+    return WgetBinary(path, "wget2" if match.group(1) else "wget", match.group(2),
+                      features, set(_OPTION_RE.findall(help_text)))
+
+
+@functools.lru_cache(maxsize=None)
+def probe_wget():
+    """
+    Find and probe the installed wget binaries, once per process.
+
+    WGET_PATH and WGET2_PATH override the PATH lookup. A "wget" that is
+    really wget2 (as some distributions ship it) is filed as wget2.
+
+    Returns:
+        dict: WgetBinary by flavor ("wget", "wget2"), for those installed
+    """
+    binaries = {}
+    for name in ('wget2', 'wget'):
+        path = os.environ.get(f"{name.upper()}_PATH") or shutil.which(name)
+        if not path or any(binary.path == os.path.realpath(path) for binary in binaries.values()):
+            continue
+        binary = _probe_binary(os.path.realpath(path))
+        if binary and binary.flavor not in binaries:
+            binaries[binary.flavor] = binary
+            logger.info(f"Found {binary.flavor} {binary.version} at {binary.path} "
+                        f"(compression={binary.compression}, http2={binary.http2}, threads={binary.threads})")
+
+    if not binaries:
+        logger.error(f"wget is not available on this system (PATH: {os.environ.get('PATH', 'Not set')})")
+    return binaries
+
+
+def get_wget(flavor=None):
+    """
+    The probed binary to run, or None if there is none.
+
+    Args:
+        flavor (str): "wget" or "wget2"; by default wget2 is preferred
+            unless WGET_USE_WGET2 is turned off
+    """
+    binaries = probe_wget()
+    if flavor:
+        return binaries.get(flavor)
+    if WGET_USE_WGET2:
+        return binaries.get("wget2") or binaries.get("wget")
+    return binaries.get("wget") or binaries.get("wget2")
+
+
+def combine_returncodes(codes):
+    """
+    Exit status for several wget runs, the way wget reports several errors.
+
+    Apart from 0 and 1, lower-numbered codes take precedence.
+    """
+    failures = [code for code in codes if code != 0]
+    if not failures:
+        return 0
+    specific = [code for code in failures if code != 1]
+    return min(specific) if specific else 1
+
+
+def _sitemap_locs(text):
+    """Return (page URLs, nested sitemap URLs) from a sitemap or sitemap index."""
+    root = ET.fromstring(text)
+    locs = [el.text.strip() for el in root.iter() if el.tag.endswith('loc') and el.text]
+    if root.tag.endswith('sitemapindex'):
+        return [], locs
+    return locs, []
+
+
+def discover_urls(url, limit=WGET_SHARD_MAX_URLS, timeout=10):
+    """
+    Find the pages a site publishes in its sitemaps.
+
+    Sitemaps are taken from robots.txt, falling back to /sitemap.xml, and
+    sitemap indexes are followed. Only pages that a --no-parent mirror of
+    url would fetch are returned.
+
+    Args:
+        url (str): Start URL of the mirror
+        limit (int): Maximum number of URLs to return
+        timeout (float): Seconds to wait for each sitemap
+
+    Returns:
+        list: Page URLs, starting with url itself
+    """
+    parsed = urlparse(url)
+    origin = f"{parsed.scheme}://{parsed.netloc}/"
+    prefix = url_directory(url)
+
+    session = requests.Session()
+    pending = []
+    try:
+        robots = session.get(urljoin(origin, 'robots.txt'), timeout=timeout)
+        if robots.ok:
+            pending = [line.split(':', 1)[1].strip() for line in robots.text.splitlines()
+                       if line.lower().startswith('sitemap:')]
+    except requests.RequestException as e:
+        logger.debug(f"No robots.txt for {origin}: {e}")
+    pending = pending or [urljoin(origin, 'sitemap.xml')]
+
+    urls = [url]
+    seen = {url}
+    fetched = 0
+    while pending and fetched < MAX_SITEMAPS and len(urls) < limit:
+        sitemap_url = pending.pop(0)
+        fetched += 1
+        try:
+            response = session.get(sitemap_url, timeout=timeout)
+            if not response.ok:
+                continue
+            pages, sitemaps = _sitemap_locs(response.content)
+        except (requests.RequestException, ET.ParseError) as e:
+            logger.debug(f"Skipping sitemap {sitemap_url}: {e}")
+            continue
+
+        pending.extend(sitemaps)
+        for page in pages:
+            page = page.split('#', 1)[0]
+            if page.startswith(prefix) and page not in seen:
+                seen.add(page)
+                urls.append(page)
+                if len(urls) >= limit:
+                    break
+
+    session.close()
+    logger.info(f"Discovered {len(urls)} URLs for {url} from {fetched} sitemaps")
+    return urls
+
+
+class _ShardProgress:
+    """Sums the progress of several wget processes into one callback."""
+
+    def __init__(self, shards, progress_callback):
+        self.shards = shards
+        self.progress_callback = progress_callback
+        self._lock = threading.Lock()
+        self._last_report = 0.0
+
+    def as_stats(self):
+        stats = WgetProgress().as_stats()
+        for shard in self.shards:
+            shard_stats = shard.as_stats()
+            for key in ("processed_urls", "total_urls", "failed_urls", "bytes_downloaded"):
+                stats[key] += shard_stats[key]
+            for kind, count in shard_stats["resources"].items():
+                stats["resources"][kind] += count
+            stats["last_url"] = shard_stats["last_url"] or stats["last_url"]
+        # Only the sitemap's pages were fetched; links weren't followed
+        stats["coverage"] = "sitemap"
+        return stats
+
+    def report(self, _stats=None, force=False):
+        if not self.progress_callback:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_report < PROGRESS_INTERVAL:
+                return
+            self._last_report = now
+        try:
+            self.progress_callback(self.as_stats())
+        except Exception as e:
+            logger.error(f"wget progress callback error: {e}")
+
+
+# Absolute links that wget --convert-links leaves to files another shard saved
+_ABSOLUTE_LINK_RE = re.compile(r'''(\b(?:href|src)\s*=\s*)(["'])(https?://[^"'\s>]+)\2''', re.IGNORECASE)
+
+
+def _relink(html_path, saved, output_dir):
+    """Point absolute links at files saved by other shards to the local copies."""
+    base = os.path.dirname(html_path)
+
+    def relink(match):
+        url, _, fragment = match.group(3).partition('#')
+        target = saved.get(url)
+        if target is None:
+            return match.group(0)
+        local = os.path.relpath(os.path.join(output_dir, target), base).replace(os.sep, '/')
+        if fragment:
+            local += '#' + fragment
+        return f"{match.group(1)}{match.group(2)}{local}{match.group(2)}"
+
+    with open(html_path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        html = f.read()
+    relinked = _ABSOLUTE_LINK_RE.sub(relink, html)
+    if relinked != html:
+        with open(html_path, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            f.write(relinked)
+
+
+def run_wget_sharded(wget, urls, output_dir, extra_args=(), shards=WGET_SHARDS, progress_callback=None,
+                     cancel=None, on_saved=None):
+    """
+    Fetch a known URL set with several wget processes and merge their output.
+
+    URLs are dealt round-robin into one --input-file per process. Each
+    process writes to its own directory so two fetching the same page
+    requisite can't clobber each other, then the trees are moved into
+    output_dir and links between pages fetched by different processes
+    are made local.
+
+    Args:
+        wget (WgetBinary): Binary to run
+        urls (list): Pages to fetch
+        output_dir (Path): Directory the merged tree is written to
+        extra_args (list): Additional wget flags
+        shards (int): Number of wget processes
+        progress_callback (callable): Called with the combined progress
+        cancel (Cancellation): Kills every shard's wget when cancelled
+
+        on_saved (callable): Called with (url, path relative to output_dir)
+            for each file once the shard trees are merged
+
+    Returns:
+        dict: returncode, progress (combined stats) and log_tail
+    """
+    shards = max(1, min(shards, len(urls)))
+    shard_dirs = [output_dir / f".shard-{i}" for i in range(shards)]
+    # URL -> path relative to its shard directory, for relinking across shards;
+    # bounded by the URL list and the requisites of those pages
+    shard_saved = [{} for _ in range(shards)]
+
+    def shard_recorder(i):
+        def record(url, path):
+            shard_saved[i].setdefault(url, os.path.relpath(path, shard_dirs[i]))
+        return record
+
+    progress = [wget.new_progress(on_saved=shard_recorder(i)) for i in range(shards)]
+    combined = _ShardProgress(progress, progress_callback)
+    results = [None] * shards
+
+    def run_shard(i):
+        shard_dirs[i].mkdir(parents=True, exist_ok=True)
+        input_file = shard_dirs[i] / "urls.txt"
+        input_file.write_text('\n'.join(urls[i::shards]) + '\n')
+        cmd = wget.command(*MIRROR_FLAGS, *wget.log_args(), *wget.tuned_args(), '--force-directories', *extra_args,
+                           '--directory-prefix=' + str(shard_dirs[i]),
+                           '--input-file=' + str(input_file))
+        results[i] = run_wget(cmd, combined.report, progress=progress[i], cancel=cancel)
+
+    logger.info(f"Fetching {len(urls)} URLs with {shards} wget processes")
+    threads = [threading.Thread(target=run_shard, args=(i,), name=f"wget-shard-{i}") for i in range(shards)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Merge the shard trees; a file several shards saved is kept once
+    saved = {}
+    for shard_dir, paths in zip(shard_dirs, shard_saved):
+        for url, path in paths.items():
+            saved.setdefault(url, path)
+        (shard_dir / "urls.txt").unlink(missing_ok=True)
+        for root, _, files in os.walk(shard_dir):
+            for name in files:
+                source = os.path.join(root, name)
+                target = output_dir / os.path.relpath(source, shard_dir)
+                if not target.exists():
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(source, target)
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    for path in set(saved.values()):
+        if classify_path(path) == 'html':
+            _relink(str(output_dir / path), saved, str(output_dir))
+    if on_saved is not None:
+        for url, path in saved.items():
+            if (output_dir / path).exists():
+                on_saved(url, path)
+
+    combined.report(force=True)
+    results = [result or {"returncode": 1, "log_tail": ""} for result in results]
+    return {
+        "returncode": combine_returncodes(result["returncode"] for result in results),
+        "progress": combined.as_stats(),
+        "log_tail": os.linesep.join(result["log_tail"] for result in results if result["log_tail"])
+    }
+
+
+def mirror(url, output_dir, extra_args=(), progress_callback=None, strategy=None, cancel=None, on_saved=None):
+    """
+    Mirror a website into output_dir with the fastest wget setup available.
+
+    Strategies, in order of preference:
+        wget2   - wget2 --mirror with --max-threads, when wget2 is installed
+                  (unless WGET_USE_WGET2 is off and wget 1.x is installed)
+        sharded - the site's sitemap split across WGET_SHARDS wget processes
+                  (unless WGET_SHARD_SITEMAPS is off); covers just the
+                  pages the sitemap lists and their requisites
+        single  - one wget --mirror process
+
+    Args:
+        url (str): Start URL
+        output_dir (Path): Directory to mirror into
+        extra_args (list): Additional wget flags, e.g. timeouts
+        progress_callback (callable): Called with running stats
+        strategy (str): Force a strategy instead of picking one
+        cancel (Cancellation): Stops the mirror, keeping what was saved so far
+        on_saved (callable): Called with (url, path relative to output_dir)
+            as each file is saved; sharded mirrors save into their shard
+            directories, so they call it once the shards are merged
+
+    Returns:
+        dict: returncode, strategy, progress stats and log_tail. The stats
+        of a sharded mirror carry coverage "sitemap".
+
+    Raises:
+        RuntimeError: If no usable wget is installed
+    """
+    wget2 = get_wget("wget2")
+    wget = get_wget("wget")
+    if wget2 is None and wget is None:
+        raise RuntimeError("wget is not installed")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    urls = None
+    if strategy is None:
+        strategy = "wget2" if wget2 and (WGET_USE_WGET2 or wget is None) else "single"
+        if strategy == "single" and WGET_SHARD_SITEMAPS and WGET_SHARDS > 1:
+            urls = discover_urls(url)
+            if len(urls) >= WGET_SHARD_MIN_URLS:
+                strategy = "sharded"
+
+    logger.info(f"Mirroring {url} with the {strategy} wget strategy")
+    if strategy == "sharded":
+        urls = urls or discover_urls(url)
+        result = run_wget_sharded(wget or wget2, urls, output_dir, extra_args, WGET_SHARDS, progress_callback,
+                                  cancel, on_saved)
+    else:
+        binary = wget2 if strategy == "wget2" else (wget or wget2)
+        cmd = binary.command('--mirror', *MIRROR_FLAGS, *binary.log_args(), *binary.tuned_args(), *extra_args,
+                             '--directory-prefix=' + str(output_dir), url)
+
+        def saved_callback(saved_url, path):
+            on_saved(saved_url, os.path.relpath(path, output_dir))
+
+        progress = binary.new_progress(on_saved=saved_callback if on_saved else None)
+        result = run_wget(cmd, progress_callback, progress=progress, cancel=cancel)
+        result["progress"] = progress.as_stats()
+
+    result["strategy"] = strategy
+    return result
+
+
+def manifest_recorder(writer, output_dir, host):
+    """
+    on_saved callback for mirror() that records files into a manifest as
+    wget saves them, so snapshots can include them before the mirror ends.
+
+    Paths are made relative to the host's directory, as in the manifest
+    the engines record once wget is done. Only the URL and size are
+    recorded; the engines take each file's URL from these entries
+    (manifest_urls) when that final manifest replaces them with full ones.
+
+    Args:
+        writer (ManifestWriter): Manifest to append to
+        output_dir (Path): Directory being mirrored into
+        host (str): Host the mirror started from
+    """
+    roots = [os.path.join(output_dir, host), os.path.join(output_dir, "www." + host)]
+
+    def on_saved(url, path):
+        file_path = os.path.join(output_dir, path)
+        for root in roots:
+            rel = os.path.relpath(file_path, root)
+            if not rel.startswith('..'):
+                writer.add(rel, url, os.path.getsize(file_path))
+                return
+
+    return on_saved
+
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Crawl worker: leases queued crawl jobs and runs them.
+
+The web tier only enqueues jobs and reads their status, so crawl capacity
+scales separately from HTTP capacity. Run standalone workers with
+
+    webber-worker [--concurrency N]    (or: python worker.py [--concurrency N])
+
+and set EMBEDDED_CRAWL_WORKERS=0 on the web processes. By default the web
+process also runs one embedded worker so a single-process deploy still works.
+"""
+import os
+import sys
+import time
+import socket
+import shutil
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+from crawler import WebCrawler
+from jobs import (lease_job, heartbeat, finish_job, reap_expired_leases, cancel_mode,
+                  HEARTBEAT_INTERVAL, CANCEL_POLL_INTERVAL)
+from task_registry import get_task, update_task, ProgressRecorder
+from result_cache import store_result
+from page_index import index_pages
+from artifacts import register_task_artifact
+from wget_backend import probe_wget, Cancellation
+from janitor import start_janitor
+from worker_registry import start_registry, process_id
+from manifest import empty_resources, read_manifest, summarize, remove_manifest
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before polling the job queue again
+POLL_INTERVAL = float(os.environ.get("CRAWL_WORKER_POLL_INTERVAL", 1.0))
+
+# Seconds between sweeps for jobs whose worker died
+REAP_INTERVAL = 30.0
+
+# Worker pool sizes for the crawler's fetch/transform/store pipeline stages
+CRAWLER_PIPELINE_OPTIONS = {
+    "fetch_workers": int(os.environ.get("CRAWL_FETCH_WORKERS", 4)),
+    "transform_workers": int(os.environ.get("CRAWL_TRANSFORM_WORKERS", 2)),
+    "store_workers": int(os.environ.get("CRAWL_STORE_WORKERS", 2)),
+    "queue_size": int(os.environ.get("CRAWL_STAGE_QUEUE_SIZE", 64)),
+}
+
+temp_dir = Path("temp")
+
+# Crawlers running in this process, by task ID
+running_crawlers = {}
+
+
+class Heartbeat:
+    """
+    Keeps a worker's lease on a job alive while the job runs.
+
+    If a renewal finds the lease gone (it expired and the job was handed to
+    another worker), on_lost is called so the job can be stopped here.
+    Between renewals it checks every CANCEL_POLL_INTERVAL for a cancel
+    request, and calls on_cancel(finalize) once if there is one.
+    """
+
+    def __init__(self, app, task_id, worker_id, on_lost=None, on_cancel=None):
+        self.app = app
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.on_lost = on_lost
+        self.on_cancel = on_cancel
+        self.lost = False
+        self.cancelled = False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{task_id[:8]}")
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _check_cancel(self):
+        if self.on_cancel is None or self.cancelled:
+            return
+        mode = cancel_mode(self.task_id)
+        if mode:
+            logger.info(f"Cancelling job {self.task_id} ({mode})")
+            self.cancelled = True
+            self.on_cancel(mode == "finalize")
+
+    def _run(self):
+        last_beat = time.monotonic()
+        while not self._stop_event.wait(min(CANCEL_POLL_INTERVAL, HEARTBEAT_INTERVAL)):
+            try:
+                with self.app.app_context():
+                    self._check_cancel()
+                    if time.monotonic() - last_beat < HEARTBEAT_INTERVAL:
+                        continue
+                    last_beat = time.monotonic()
+                    renewed = heartbeat(self.task_id, self.worker_id)
+            except Exception as e:
+                # A missed beat is fine; the lease outlasts several of them
+                logger.error(f"Heartbeat error for job {self.task_id}: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Worker {self.worker_id} lost its lease on job {self.task_id}")
+                self.lost = True
+                if self.on_lost:
+                    self.on_lost()
+                return
+
+
+def run_job(app, socketio, task, worker_id):
+    """Run a leased job with the engine it asked for, heartbeating as it goes."""
+    task_id = task.id
+    if task.engine == "fast_wget":
+        # Losing the lease kills wget too: the new holder mirrors into the same directory
+        cancel = Cancellation()
+        with Heartbeat(app, task_id, worker_id, on_lost=cancel.cancel, on_cancel=cancel.cancel) as lease:
+            run_fast_wget_task(socketio, task_id, task.url, worker_id, ProgressRecorder(app, task_id),
+                               build_archive=task.archive, cancel=cancel, lease=lease)
+    elif task.wget_mode:
+        cancel = Cancellation()
+        with Heartbeat(app, task_id, worker_id, on_lost=cancel.cancel, on_cancel=cancel.cancel) as lease:
+            run_wget_task(socketio, task_id, task.url, worker_id, ProgressRecorder(app, task_id),
+                          cancel=cancel, lease=lease)
+    else:
+        crawler = WebCrawler(task.url, task_id, socketio, throttle_delay=0.01,
+                             progress_callback=ProgressRecorder(app, task_id),
+                             fetch_weight=task.fetch_weight, build_archive=task.archive,
+                             **CRAWLER_PIPELINE_OPTIONS)
+        # Losing the lease drops the crawl without a checkpoint: the new
+        # holder is already resuming in the same directory
+        with Heartbeat(app, task_id, worker_id, on_lost=crawler.abandon, on_cancel=crawler.cancel) as lease:
+            run_crawler_task(crawler, worker_id)
+
+    if lease.lost:
+        # The job and its files belong to whoever holds the lease now
+        logger.info(f"Worker {worker_id} leaving job {task_id} to its new lease holder")
+        return
+
+    # Page titles for /preview, then keep the archive for identical requests that follow
+    index_pages(task_id)
+    store_result(task_id)
+
+    # Downloads, previews and browsing all read the archive and manifest now
+    task = get_task(task_id)
+    register_task_artifact(task)
+    if task is not None and task.status == "completed" and task.zip_path and os.path.exists(task.zip_path):
+        shutil.rmtree(temp_dir / task_id, ignore_errors=True)
+    elif task is not None and task.status == "cancelled":
+        # Free the disk now; a partial archive, if one was asked for, stays
+        shutil.rmtree(temp_dir / task_id, ignore_errors=True)
+        if not task.zip_path:
+            remove_manifest(task_id)
+
+
+def run_crawler_task(crawler, worker_id):
+    """Run a WebCrawler to completion and record the outcome."""
+    task_id = crawler.task_id
+    running_crawlers[task_id] = crawler
+    try:
+        update_task(task_id, status="crawling")
+        crawler.start_crawling()
+        if crawler.status == "abandoned":
+            # Lost the lease; the new holder resumes from its own checkpoint
+            logger.info(f"Crawl {task_id} abandoned on worker {worker_id}")
+            return
+        crawler.progress_callback.flush()
+        if crawler.status == "stopped":
+            logger.info(f"Crawl {task_id} stopped on worker {worker_id}")
+            return
+        if crawler.status == "cancelled":
+            finish_job(task_id, worker_id, status="cancelled", message="Crawl cancelled",
+                       stats=crawler.get_stats(), zip_path=crawler.get_zip_path())
+            logger.info(f"Crawl {task_id} cancelled on worker {worker_id}")
+            return
+        finish_job(
+            task_id,
+            worker_id,
+            status=crawler.status,
+            progress=100 if crawler.status == "completed" else 0,
+            stats=crawler.get_stats(),
+            zip_path=crawler.get_zip_path(),
+            # Streaming-only crawls are zipped from their files as they are downloaded
+            files_root=str(crawler.task_dir) if crawler.status == "completed" and not crawler.build_archive else None
+        )
+    except Exception as e:
+        logger.error(f"Error in crawler task {task_id}: {str(e)}")
+        finish_job(task_id, worker_id, status="failed", error=str(e))
+    finally:
+        running_crawlers.pop(task_id, None)
+
+
+class WgetProgressReporter:
+    """
+    Turns progress parsed from wget's log into status updates.
+
+    wget cannot say how many files a mirror will have, so progress is an
+    estimate that climbs towards 95% as files arrive; the final update sets
+    100% once the archive is built.
+
+    Args:
+        socketio: SocketIO instance for status_update events
+        task_id (str): Task being downloaded
+        recorder (ProgressRecorder): Saves the latest report to the task, if given
+    """
+
+    def __init__(self, socketio, task_id, recorder=None):
+        self.socketio = socketio
+        self.task_id = task_id
+        self.recorder = recorder
+        # "sitemap" once a sharded mirror reports it only fetched the sitemap's pages
+        self.coverage = None
+
+    def __call__(self, stats):
+        self.coverage = stats.get("coverage", self.coverage)
+        files = stats["processed_urls"]
+        progress = min(95, 10 + int(85 * files / (files + 100)))
+        message = f"Downloaded {files} files ({stats['bytes_downloaded'] / (1024 * 1024):.1f} MB)"
+        if stats["last_url"]:
+            message += f" - {stats['last_url']}"
+
+        self.socketio.emit('status_update', {
+            'task_id': self.task_id,
+            'message': message,
+            'progress': progress,
+            'stats': stats
+        })
+        if self.recorder:
+            self.recorder(message, progress, stats)
+
+    def flush(self):
+        if self.recorder:
+            self.recorder.flush()
+
+
+def coverage_notice(reporter):
+    """Task message for a mirror that didn't follow links, or None."""
+    if reporter.coverage == "sitemap":
+        return "Only pages listed in the site's sitemap were downloaded"
+    return None
+
+
+def run_wget_task(socketio, task_id, url, worker_id, recorder=None, cancel=None, lease=None):
+    """
+    Run a wget crawl to completion, reporting progress and the outcome.
+
+    If the lease is lost, nothing is recorded; the job is someone else's.
+    """
+    reporter = WgetProgressReporter(socketio, task_id, recorder)
+    try:
+        # Send initial status
+        logger.info(f"Starting wget crawling for {url}")
+        socketio.emit('status_update', {
+            'task_id': task_id,
+            'message': f"Starting wget download for {url}",
+            'progress': 10,
+            'stats': {'resources': empty_resources()}
+        })
+        update_task(task_id, status="crawling", progress=10)
+
+        # Prepare task directory
+        task_dir = temp_dir / task_id
+
+        # Use our simplified_wget module
+        from simplified_wget import crawl_with_wget
+
+        # Start crawling. A re-leased job reuses the same directory, and
+        # wget --mirror's timestamping skips files the last attempt fetched.
+        result = crawl_with_wget(url, task_id, task_dir, progress_callback=reporter, cancel=cancel)
+        reporter.flush()
+
+        if lease is not None and lease.lost:
+            logger.info(f"Wget crawl of {url} stopped after losing the lease on job {task_id}")
+            return
+
+        if result["status"] == "cancelled":
+            outcome = {"zip_path": result.get("zip_path")}
+            if result.get("zip_path"):
+                outcome["stats"] = {
+                    "processed_urls": result["files_downloaded"],
+                    "total_urls": result["files_downloaded"],
+                    "bytes_downloaded": result["bytes_downloaded"],
+                    "resources": result["resources"]
+                }
+            finish_job(task_id, worker_id, status="cancelled", message="Crawl cancelled", **outcome)
+            socketio.emit('status_update', {'task_id': task_id, 'message': "Crawl cancelled", 'progress': -1})
+            logger.info(f"Wget crawling cancelled for {url}")
+        elif result["status"] == "completed":
+            # Store task completion info
+            finish_job(
+                task_id,
+                worker_id,
+                status="completed",
+                progress=100,
+                zip_path=result["zip_path"],
+                message=coverage_notice(reporter),
+                stats={
+                    "processed_urls": result["files_downloaded"],
+                    "total_urls": result["files_downloaded"],
+                    "bytes_downloaded": result["bytes_downloaded"],
+                    "resources": result["resources"],
+                    "coverage": reporter.coverage or "site"
+                }
+            )
+
+            # Emit completion status
+            socketio.emit('status_update', {
+                'task_id': task_id,
+                'message': f"Crawling completed! Downloaded {result['files_downloaded']} files.",
+                'progress': 100,
+                'stats': {'resources': result["resources"]}
+            })
+
+            logger.info(f"Wget crawling completed for {url}")
+        else:
+            # Handle error
+            finish_job(task_id, worker_id, status="failed", error=result.get("error", "Unknown error"))
+
+            socketio.emit('status_update', {
+                'task_id': task_id,
+                'message': f"Error: {result.get('error', 'Unknown error')}",
+                'progress': -1
+            })
+
+            logger.error(f"Wget crawling failed for {url}: {result.get('error', 'Unknown error')}")
+
+    except Exception as e:
+        logger.error(f"Error in wget crawling: {str(e)}")
+        finish_job(task_id, worker_id, status="failed", error=str(e))
+        socketio.emit('status_update', {
+            'task_id': task_id,
+            'message': f"Error: {str(e)}",
+            'progress': -1
+        })
+
+
+def run_fast_wget_task(socketio, task_id, url, worker_id, recorder=None, build_archive=True, cancel=None,
+                       lease=None):
+    """
+    Run a fast wget download, as queued by /fast_wget, and record the outcome.
+
+    Streaming-only jobs (build_archive=False) keep their files and record
+    where they are instead of a ZIP. A cancelled download records only a
+    partial archive, and only if the cancel asked for one. If the lease is
+    lost, nothing is recorded; the job is someone else's.
+    """
+    reporter = WgetProgressReporter(socketio, task_id, recorder)
+    try:
+        logger.info(f"Starting fast wget download for {url}")
+        socketio.emit('status_update', {
+            'task_id': task_id,
+            'message': f"Downloading website with wget...",
+            'progress': 10
+        })
+        update_task(task_id, status="crawling", progress=10)
+
+        from fast_wget import crawl_with_wget_sync
+        output_path = crawl_with_wget_sync(url, progress_callback=reporter, task_id=task_id,
+                                           build_archive=build_archive, cancel=cancel)
+        reporter.flush()
+
+        if lease is not None and lease.lost:
+            logger.info(f"Fast wget download of {url} stopped after losing the lease on job {task_id}")
+            return
+
+        if cancel is not None and cancel.is_set():
+            zip_path = output_path if build_archive and output_path and os.path.exists(output_path) else None
+            outcome = {"zip_path": zip_path}
+            if zip_path:
+                summary = summarize(read_manifest(task_id) or [])
+                outcome["stats"] = {
+                    "processed_urls": summary["files"],
+                    "total_urls": summary["files"],
+                    "bytes_downloaded": summary["bytes"],
+                    "resources": summary["resources"]
+                }
+            finish_job(task_id, worker_id, status="cancelled", message="Download cancelled", **outcome)
+            socketio.emit('status_update', {'task_id': task_id, 'message': "Download cancelled", 'progress': -1})
+            logger.info(f"Fast wget download cancelled for {url}")
+            return
+
+        if not output_path or not os.path.exists(output_path):
+            error = ("Failed to download website with wget. The website might be unavailable, "
+                     "blocked, or have certificate issues. Please try a different website.")
+            finish_job(task_id, worker_id, status="failed", error=error)
+            socketio.emit('status_update', {'task_id': task_id, 'message': f"Error: {error}", 'progress': -1})
+            return
+
+        summary = summarize(read_manifest(task_id) or [])
+        files_downloaded = summary["files"]
+        finish_job(
+            task_id,
+            worker_id,
+            status="completed",
+            progress=100,
+            zip_path=output_path if build_archive else None,
+            files_root=None if build_archive else output_path,
+            message=coverage_notice(reporter),
+            stats={
+                "processed_urls": files_downloaded,
+                "total_urls": files_downloaded,
+                "bytes_downloaded": summary["bytes"],
+                "resources": summary["resources"],
+                "coverage": reporter.coverage or "site"
+            }
+        )
+        socketio.emit('status_update', {
+            'task_id': task_id,
+            'message': f"Download completed! {files_downloaded} files.",
+            'progress': 100
+        })
+        logger.info(f"Fast wget download completed for {url}")
+
+    except Exception as e:
+        logger.error(f"Error in fast wget download: {str(e)}")
+        finish_job(task_id, worker_id, status="failed", error=str(e))
+        socketio.emit('status_update', {'task_id': task_id, 'message': f"Error: {str(e)}", 'progress': -1})
+
+
+def work_loop(app, socketio, worker_id, stop_event):
+    """Lease and run jobs one at a time until stop_event is set."""
+    logger.info(f"Crawl worker {worker_id} started")
+    last_reap = 0.0
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                # Any live worker re-queues jobs orphaned by dead ones
+                if time.monotonic() - last_reap >= REAP_INTERVAL:
+                    last_reap = time.monotonic()
+                    reap_expired_leases()
+
+                task = lease_job(worker_id)
+                if task is None:
+                    stop_event.wait(POLL_INTERVAL)
+                    continue
+                run_job(app, socketio, task, worker_id)
+        except Exception as e:
+            logger.error(f"Crawl worker {worker_id} error: {e}")
+            stop_event.wait(POLL_INTERVAL)
+    logger.info(f"Crawl worker {worker_id} stopped")
+
+
+def start_workers(app, socketio, count, stop_event=None):
+    """Start count worker threads in this process and return them."""
+    stop_event = stop_event or threading.Event()
+    # Probe wget up front rather than on the first wget job
+    probe_wget()
+    # Take this process's share of the fetch budget before any job starts
+    start_registry(app, stop_event)
+    # Crawl worker processes also clear out stale tasks and orphaned files,
+    # one of them at a time
+    start_janitor(app, stop_event, proc_id=process_id())
+    threads = []
+    for slot in range(count):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{slot}"
+        thread = threading.Thread(target=work_loop, args=(app, socketio, worker_id, stop_event),
+                                  name=f"crawl-worker-{slot}")
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run crawl jobs from the job queue.")
+    parser.add_argument("--concurrency", type=int,
+                        default=int(os.environ.get("CRAWL_WORKER_CONCURRENCY", 2)),
+                        help="number of jobs to run at once (default: 2)")
+    args = parser.parse_args(argv)
+
+    # A standalone worker must not start embedded workers of its own
+    os.environ["EMBEDDED_CRAWL_WORKERS"] = "0"
+    from app import app, socketio
+
+    stop_event = threading.Event()
+    threads = start_workers(app, socketio, max(1, args.concurrency), stop_event)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Stopping crawl workers after their current jobs")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    return 0
+
+
+if __name__ == "__main__":
+    # Run through the importable module so app.py sees the same running_crawlers
+    from worker import main as worker_main
+    sys.exit(worker_main())
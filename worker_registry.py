@@ -0,0 +1,139 @@
+"""
+Registry of the processes running crawl workers.
+
+Each process that runs crawl workers (the standalone workers, and the web
+process when it embeds some) keeps a row in worker_processes fresh. The
+live rows are how the processes share limits meant for the whole
+deployment: the fetch connection budget is split equally between them,
+the oldest live process is the one that runs the janitor, and /metrics
+reads each process's fetch scheduler stats from its row, since the web
+process has no crawls of its own to report.
+"""
+import os
+import socket
+import logging
+import datetime
+import threading
+
+from models import db, WorkerProcess
+from fetch_scheduler import fetch_scheduler, FETCH_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Seconds between a process's registry updates
+PROCESS_HEARTBEAT_INTERVAL = float(os.environ.get("WORKER_PROCESS_HEARTBEAT_INTERVAL", 10))
+
+# A process that has not updated its row for this long is taken to be gone
+PROCESS_TIMEOUT = 3 * PROCESS_HEARTBEAT_INTERVAL
+
+
+def process_id():
+    """This process's registry ID."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def fetch_share(processes):
+    """
+    Fetch connections each of processes live worker processes may use.
+
+    At least one, so with more processes than FETCH_CONNECTIONS the
+    deployment can exceed the budget by the difference.
+    """
+    return max(1, FETCH_CONNECTIONS // max(1, processes))
+
+
+def _live(now):
+    cutoff = now - datetime.timedelta(seconds=PROCESS_TIMEOUT)
+    return WorkerProcess.query.filter(WorkerProcess.heartbeat_at >= cutoff)
+
+
+def beat(proc_id, stats, now=None):
+    """
+    Refresh a process's row with its latest stats and drop rows of
+    processes that stopped updating theirs; needs an application context.
+
+    Returns:
+        int: Number of live processes, this one included
+    """
+    now = now or datetime.datetime.utcnow()
+    row = db.session.get(WorkerProcess, proc_id)
+    if row is None:
+        row = WorkerProcess(id=proc_id, started_at=now)
+        db.session.add(row)
+    row.heartbeat_at = now
+    row.stats = stats
+    cutoff = now - datetime.timedelta(seconds=PROCESS_TIMEOUT)
+    WorkerProcess.query.filter(WorkerProcess.heartbeat_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return _live(now).count()
+
+
+def leave(proc_id):
+    """Remove a process's row when it stops, so the others take over its share at once."""
+    WorkerProcess.query.filter_by(id=proc_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def live_processes(now=None):
+    """Rows of live worker processes, oldest first."""
+    now = now or datetime.datetime.utcnow()
+    return _live(now).order_by(WorkerProcess.started_at, WorkerProcess.id).all()
+
+
+def is_leader(proc_id, now=None):
+    """Whether proc_id is the oldest live process, which runs deployment-wide chores."""
+    leader = live_processes(now)[:1]
+    return bool(leader) and leader[0].id == proc_id
+
+
+def publish(proc_id):
+    """Publish this process's fetch scheduler stats and take its share of the fetch budget."""
+    processes = beat(proc_id, fetch_scheduler.get_stats())
+    fetch_scheduler.set_connections(fetch_share(processes))
+    return processes
+
+
+def registry_loop(app, stop_event, proc_id, interval=PROCESS_HEARTBEAT_INTERVAL):
+    """Publish every interval seconds until stop_event is set, then leave the registry."""
+    while not stop_event.wait(interval):
+        with app.app_context():
+            try:
+                publish(proc_id)
+            except Exception as e:
+                logger.error(f"Worker registry update failed: {e}")
+                db.session.rollback()
+    try:
+        with app.app_context():
+            leave(proc_id)
+    except Exception as e:
+        logger.error(f"Error leaving worker registry: {e}")
+
+
+def start_registry(app, stop_event=None):
+    """
+    Register this process and start the thread that keeps its row fresh.
+
+    The first update runs before returning, so the process's workers start
+    with its share of the fetch budget rather than all of it.
+    """
+    proc_id = process_id()
+    try:
+        with app.app_context():
+            processes = publish(proc_id)
+        logger.info(f"Worker process {proc_id} registered; {processes} live, "
+                    f"{fetch_scheduler.connections} fetch connections here")
+    except Exception as e:
+        logger.error(f"Worker registry update failed: {e}")
+    thread = threading.Thread(target=registry_loop, args=(app, stop_event or threading.Event(), proc_id),
+                              name="worker-registry")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def fetch_metrics():
+    """The deployment's fetch budget and each live process's scheduler stats, for /metrics."""
+    return {
+        "connections": FETCH_CONNECTIONS,
+        "processes": [row.to_dict() for row in live_processes()]
+    }
@@ -0,0 +1,131 @@
+"""
+ZIP archives generated while they are sent.
+
+zipfile can write to a stream it cannot seek. It then writes each entry's
+sizes and CRC in a data descriptor after the data instead of going back
+to patch the local header. stream_zip drives it over a write-only buffer
+and hands the bytes on as they are produced, so a response starts as soon
+as the first entry does and no archive is ever written to disk.
+"""
+import os
+import time
+import zipfile
+
+from manifest import is_precompressed, read_manifest
+
+# Read size when copying files into the archive
+COPY_CHUNK_BYTES = 256 * 1024
+
+# Entries this large need Zip64 sizes, which must be chosen up front when
+# the sizes are only written after the data
+ZIP64_ENTRY_LIMIT = zipfile.ZIP64_LIMIT
+
+
+class _ChunkBuffer:
+    """Write-only file object collecting what zipfile writes; not seekable."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_info(arcname, src, compress):
+    mtime = time.localtime(os.fstat(src.fileno()).st_mtime)
+    info = zipfile.ZipInfo(arcname, date_time=mtime[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def stream_zip(root, entries, extra_files=None, verify_sizes=False):
+    """
+    Generate a ZIP of manifest entries chunk by chunk.
+
+    Args:
+        root (str): Directory the entry paths are relative to
+        entries (list): Manifest entries to include
+        extra_files (dict): Further archive name -> file path, e.g. _redirects
+        verify_sizes (bool): Skip entries whose file no longer has the size
+            the manifest recorded, e.g. one being rewritten
+
+    Yields:
+        bytes: The archive, in order
+    """
+    buffer = _ChunkBuffer()
+    files = [(arcname, file_path, True, None)
+             for arcname, file_path in (extra_files or {}).items() if os.path.exists(file_path)]
+    for entry in entries:
+        file_path = os.path.join(root, entry["path"])
+        if entry["path"] in (extra_files or {}) or not os.path.exists(file_path):
+            continue
+        files.append((entry["path"], file_path, not is_precompressed(entry),
+                      entry["size"] if verify_sizes else None))
+
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as zipf:
+        for arcname, file_path, compress, expected_size in files:
+            try:
+                src = open(file_path, 'rb')
+            except FileNotFoundError:
+                # Removed since the listing was taken; nothing of it is sent yet
+                continue
+            size = os.fstat(src.fileno()).st_size
+            if expected_size is not None and size != expected_size:
+                src.close()
+                continue
+            info = _zip_info(arcname, src, compress)
+            with src, zipf.open(info, 'w', force_zip64=size >= ZIP64_ENTRY_LIMIT) as dest:
+                for chunk in iter(lambda: src.read(COPY_CHUNK_BYTES), b''):
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    # The central directory is written on close
+    yield buffer.drain()
+
+
+def stream_task_archive(task_id, root):
+    """
+    Generate the ZIP a task's archive would hold, from its manifest and the
+    files still under root.
+
+    Returns:
+        generator: The archive's bytes, or None if the task has no manifest
+    """
+    entries = read_manifest(task_id)
+    if entries is None:
+        return None
+    redirects_path = os.path.join(root, "_redirects")
+    extra_files = {"_redirects": redirects_path} if os.path.exists(redirects_path) else None
+    return stream_zip(root, entries, extra_files)
+
+
+def stream_task_snapshot(task_id, root):
+    """
+    Generate a ZIP of the files a running task has finished so far.
+
+    The crawl goes on undisturbed; the snapshot holds the files listed in
+    the manifest when it was read. A file whose size no longer matches its
+    entry, such as a page wget is converting links in, is left out rather
+    than sent half written.
+
+    Returns:
+        generator: The archive's bytes, or None if nothing has been saved yet
+    """
+    entries = read_manifest(task_id)
+    if not entries:
+        return None
+    return stream_zip(root, entries, verify_sizes=True)